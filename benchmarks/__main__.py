@@ -0,0 +1,100 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs the benchmark suite, saves results as json and compares them with a baseline.
+
+    python -m benchmarks --save results.json
+    python -m benchmarks --compare results.json
+"""
+
+from statistics import median
+from tempfile import TemporaryDirectory
+from timeit import Timer
+import json
+import platform
+import sys
+
+import click
+
+from installation_instruction import __version__
+from benchmarks.suite import BENCHMARKS
+
+
+def _run(name: str, repeat: int, min_time: float) -> dict:
+    with TemporaryDirectory() as tmp_dir:
+        timer = Timer(BENCHMARKS[name](tmp_dir))
+        number = 1
+        while True:
+            duration = timer.timeit(number)
+            if duration >= min_time:
+                break
+            number *= 2 if duration == 0 else max(2, min(10, int(min_time / duration) + 1))
+        times = [timer.timeit(number) / number for _ in range(repeat)]
+    return {"min": min(times), "median": median(times), "number": number, "repeat": repeat}
+
+def _format_time(seconds: float) -> str:
+    for (unit, factor) in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= factor:
+            return f"{seconds / factor:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+
+@click.command(help="Runs the benchmark suite.")
+@click.option("-k", "--filter", "patterns", multiple=True, help="Only run benchmarks whose name contains this string.")
+@click.option("--repeat", type=click.IntRange(min=1), default=5, show_default=True, help="Number of measurements per benchmark.")
+@click.option("--min-time", type=float, default=0.2, show_default=True, help="Minimum time of one measurement in seconds.")
+@click.option("--save", type=click.Path(dir_okay=False, writable=True), default=None, help="Save results as json.")
+@click.option("--compare", type=click.Path(exists=True, dir_okay=False), default=None, help="Compare with results saved earlier.")
+@click.option("--threshold", type=float, default=0.1, show_default=True, help="Relative slowdown of the median reported as regression.")
+@click.option("--list", "list_only", is_flag=True, default=False, help="Only list the benchmarks.")
+def main(patterns, repeat, min_time, save, compare, threshold, list_only):
+    names = [name for name in BENCHMARKS if not patterns or any(pattern in name for pattern in patterns)]
+    if list_only:
+        click.echo("\n".join(names))
+        return
+
+    baseline = {}
+    if compare is not None:
+        with open(compare, "r") as file:
+            baseline = json.load(file)["results"]
+
+    results = {}
+    regressions = []
+    for name in names:
+        result = results[name] = _run(name, repeat, min_time)
+        line = f"{name:40} {_format_time(result['median'])}"
+        if name in baseline:
+            ratio = result["median"] / baseline[name]["median"]
+            line += f"  {_format_time(baseline[name]['median'])}  {ratio:6.2f}x"
+            if ratio > 1 + threshold:
+                regressions.append(name)
+                line += "  regression"
+        click.echo(line)
+
+    if save is not None:
+        with open(save, "w") as file:
+            json.dump({
+                "version": __version__,
+                "python": sys.version,
+                "platform": platform.platform(),
+                "results": results,
+            }, file, indent=2)
+    if regressions:
+        click.echo(f"{len(regressions)} regressions: " + ", ".join(regressions), err=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
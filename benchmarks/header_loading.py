@@ -0,0 +1,91 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares loading only the schema of a config with a multi-megabyte template
+against loading it with the template compiled, as before templates were compiled lazily.
+
+Run with `python benchmarks/header_loading.py`.
+"""
+
+from timeit import repeat
+import re
+
+from installation_instruction import helpers
+from installation_instruction.environment import configure_environment
+from installation_instruction.installation_instruction import InstallationInstruction
+
+
+SCHEMA = """
+$schema: https://json-schema.org/draft/2020-12/schema
+$id: https://example.org/benchmark
+type: object
+properties:
+  os:
+    enum: [linux, mac, win]
+    default: linux
+  gpu:
+    type: boolean
+    default: false
+"""
+
+BLOCK = """
+{% if os == "linux" and gpu %}
+    echo "block {i} on linux with gpu, padding padding padding padding padding padding"
+{% elif os == "mac" %}
+    echo "block {i} on mac, padding padding padding padding padding padding padding"
+{% else %}
+    echo "block {i} elsewhere, padding padding padding padding padding padding padding"
+{% endif %}
+"""
+
+REGEX = re.compile(r"^\s*(?P<schema>.*?)\s*\-{6,}\s*(?P<template>.*?)\s*$", re.S)
+
+
+def _create_config(size: int) -> str:
+    blocks = []
+    length = 0
+    i = 0
+    while length < size:
+        block = BLOCK.replace("{i}", str(i))
+        blocks.append(block)
+        length += len(block)
+        i += 1
+    return SCHEMA + "------\n" + "".join(blocks)
+
+def _best(function, number: int) -> float:
+    return min(repeat(function, number=number, repeat=3)) / number
+
+def _load_template(config: str):
+    # Compiled templates are kept in memory by source, dropping them makes every load compile.
+    configure_environment()
+    return InstallationInstruction(config).template
+
+def main() -> None:
+    config = _create_config(4 * 1024 * 1024)
+    print(f"Config size: {len(config) / 1024 / 1024:.1f} MiB")
+
+    regex = _best(lambda: REGEX.search(config).group("template"), 3)
+    split = _best(lambda: helpers._split_string_at_delimiter(config), 3)
+    print(f"split with regex:              {regex * 1000:10.2f} ms")
+    print(f"split with delimiter scan:     {split * 1000:10.2f} ms")
+
+    header_only = _best(lambda: InstallationInstruction(config).parse_schema(), 3)
+    with_template = _best(lambda: _load_template(config), 1)
+    print(f"load schema only:              {header_only * 1000:10.2f} ms")
+    print(f"load schema and compile:       {with_template * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks of loading, validating, rendering, option parsing and the cli.
+
+A benchmark is a setup function registered with `benchmark`. It returns the function which is timed.
+Setup functions get a temporary directory, which is removed after the benchmark.
+"""
+
+from typing import Callable
+import os
+import subprocess
+import sys
+
+from installation_instruction import helpers
+from installation_instruction.cache import ConfigCache
+from installation_instruction.environment import configure_environment
+from installation_instruction.get_flags_and_options_from_schema import _get_flags_and_options
+from installation_instruction.installation_instruction import InstallationInstruction
+from installation_instruction.registry import ConfigRegistry, discover_configs
+
+from benchmarks.synthetic import make_config, make_input
+
+
+EXAMPLES = {
+    "pytorch": "examples/pytorch/pytorch-instruction.schema.yml.jinja",
+    "scikit-learn": "examples/scikit-learn/scikit-learn-instruction.schema.yml.jinja",
+    "spacy": "examples/spacy/spacy-instruction.schema.yml.jinja",
+}
+
+EXAMPLE_INPUTS = {
+    "pytorch": {"build": "stable", "__os__": "linux", "package": "pip", "compute_platform": "cpu"},
+    "scikit-learn": {"os": "Linux", "packager": "pip", "virtualenv": True},
+    "spacy": {"os": "linux", "platform": "x86", "package": "pip", "hardware": "cpu"},
+}
+
+SYNTHETIC = {
+    "large": {"properties": 300, "enum_size": 20, "template_blocks": 1000},
+    "huge-enums": {"properties": 40, "enum_size": 2000, "template_blocks": 100},
+    "long-template": {"properties": 20, "enum_size": 5, "template_blocks": 20000},
+}
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str) -> Callable:
+    """
+    Registers a setup function as benchmark.
+    """
+    def register(setup: Callable[[str], Callable[[], object]]) -> Callable:
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _cold(function: Callable[[], object]) -> Callable[[], object]:
+    """
+    Returns a function which drops the compiled templates kept in memory before calling `function`, like a new process.
+    """
+    def run() -> object:
+        configure_environment()
+        return function()
+    return run
+
+def _parse_schema_reference(schema: dict, misc: dict) -> dict:
+    """
+    `InstallationInstruction.parse_schema` as it was before the schema model, building the dict from the schema on every call.
+    `parse-schema` should not be slower than this.
+    """
+    pretty = misc.get("pretty", {})
+    description = misc.get("description", {})
+    properties = {}
+    for (key, value) in schema.get("properties", {}).items():
+        properties[key] = {
+            "title": value.get("title", "") or pretty.get(key, key),
+            "description": value.get("description", "") or description.get(key, ""),
+            "type": value.get("type", "string"),
+            "default": value.get("default", None),
+            "key": key,
+        }
+        if "enum" in value:
+            properties[key]["enum"] = [{"title": pretty.get(e, e), "key": e, "description": description.get(e, "")} for e in value["enum"]]
+            properties[key]["type"] = "enum"
+    return {"$id": schema.get("$id", ""), "title": schema.get("title", ""), "description": schema.get("description", ""), "properties": properties}
+
+def _read(path: str) -> str:
+    with open(path, "r") as file:
+        return file.read()
+
+def _synthetic(name: str) -> tuple[str, dict]:
+    parameters = SYNTHETIC[name]
+    return (make_config(**parameters), make_input(parameters["properties"], parameters["enum_size"]))
+
+def _configs() -> dict[str, Callable[[], tuple[str, dict]]]:
+    configs = {name: (lambda name=name, path=path: (_read(path), EXAMPLE_INPUTS[name])) for (name, path) in EXAMPLES.items()}
+    configs.update({name: (lambda name=name: _synthetic(name)) for name in SYNTHETIC})
+    return configs
+
+
+for (config_name, get_config) in _configs().items():
+
+    @benchmark(f"load/cold/{config_name}")
+    def _(tmp_dir: str, get_config=get_config):
+        (config, _input) = get_config()
+        return _cold(lambda: InstallationInstruction(config).template)
+
+    @benchmark(f"load/warm/{config_name}")
+    def _(tmp_dir: str, get_config=get_config):
+        (config, _input) = get_config()
+        cache = ConfigCache(tmp_dir)
+        InstallationInstruction(config, cache).template
+        return _cold(lambda: InstallationInstruction(config, cache).template)
+
+    @benchmark(f"load/schema-only/{config_name}")
+    def _(tmp_dir: str, get_config=get_config):
+        (config, _input) = get_config()
+        return lambda: InstallationInstruction(config).parse_schema()
+
+    @benchmark(f"validate/{config_name}")
+    def _(tmp_dir: str, get_config=get_config):
+        (config, input) = get_config()
+        instruction = InstallationInstruction(config)
+        instruction.validate(input)
+        return lambda: instruction.validate(input)
+
+    @benchmark(f"render/single/{config_name}")
+    def _(tmp_dir: str, get_config=get_config):
+        (config, input) = get_config()
+        instruction = InstallationInstruction(config)
+        instruction.validate_and_render(input)
+        return lambda: instruction.validate_and_render(input)
+
+    @benchmark(f"render/stream/{config_name}")
+    def _(tmp_dir: str, get_config=get_config):
+        (config, input) = get_config()
+        instruction = InstallationInstruction(config)
+        list(instruction.iter_render(input))
+        return lambda: list(instruction.iter_render(input))
+
+    @benchmark(f"parse-schema/{config_name}")
+    def _(tmp_dir: str, get_config=get_config):
+        (config, _input) = get_config()
+        instruction = InstallationInstruction(config)
+        return lambda: instruction.parse_schema()
+
+    @benchmark(f"parse-schema/reference/{config_name}")
+    def _(tmp_dir: str, get_config=get_config):
+        (config, _input) = get_config()
+        instruction = InstallationInstruction(config)
+        return lambda: _parse_schema_reference(instruction.schema, instruction.misc)
+
+    @benchmark(f"flags-and-options/{config_name}")
+    def _(tmp_dir: str, get_config=get_config):
+        (config, _input) = get_config()
+        instruction = InstallationInstruction(config)
+        return lambda: _get_flags_and_options(instruction.schema, instruction.misc)
+
+
+for enum_size in (1000, 10000):
+
+    @benchmark(f"parse-header/json/enums-{enum_size}")
+    def _(tmp_dir: str, enum_size=enum_size):
+        (header, _template) = helpers._split_string_at_delimiter(make_config(20, enum_size, 10, json_header=True))
+        return lambda: helpers._parse_header(header)
+
+    @benchmark(f"parse-header/yaml/enums-{enum_size}")
+    def _(tmp_dir: str, enum_size=enum_size):
+        (header, _template) = helpers._split_string_at_delimiter(make_config(20, enum_size, 10))
+        return lambda: helpers._parse_header(header)
+
+    @benchmark(f"parse-header/yaml-python/enums-{enum_size}")
+    def _(tmp_dir: str, enum_size=enum_size):
+        import yaml
+        (header, _template) = helpers._split_string_at_delimiter(make_config(20, enum_size, 10))
+        return lambda: yaml.load(header, Loader=yaml.SafeLoader)
+
+
+@benchmark("render/batch/large")
+def _(tmp_dir: str):
+    parameters = SYNTHETIC["large"]
+    instruction = InstallationInstruction(make_config(**parameters))
+    inputs = [make_input(parameters["properties"], parameters["enum_size"], variant) for variant in range(100)]
+    return lambda: list(instruction.render_many(inputs))
+
+
+@benchmark("async/native/500")
+def _(tmp_dir: str):
+    import asyncio
+    parameters = SYNTHETIC["large"]
+    instruction = InstallationInstruction(make_config(**parameters))
+    inputs = [make_input(parameters["properties"], parameters["enum_size"], variant) for variant in range(500)]
+
+    async def run():
+        await asyncio.gather(*(instruction.validate_and_render_async(input) for input in inputs))
+    asyncio.run(run())
+    return lambda: asyncio.run(run())
+
+@benchmark("async/executor/500")
+def _(tmp_dir: str):
+    import asyncio
+    parameters = SYNTHETIC["large"]
+    instruction = InstallationInstruction(make_config(**parameters))
+    inputs = [make_input(parameters["properties"], parameters["enum_size"], variant) for variant in range(500)]
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, instruction.validate_and_render, input) for input in inputs))
+    asyncio.run(run())
+    return lambda: asyncio.run(run())
+
+
+def _write_monorepo(tmp_dir: str, count: int) -> str:
+    """
+    Writes `count` generated configs with distinct `$id` into folders below `tmp_dir`.
+    """
+    root = os.path.join(tmp_dir, "monorepo")
+    for index in range(count):
+        folder = os.path.join(root, f"package-{index}")
+        os.makedirs(folder)
+        with open(os.path.join(folder, "install.cfg"), "w") as file:
+            file.write(make_config(50, 10, 300 + index))
+    return root
+
+@benchmark("registry/sequential/40")
+def _(tmp_dir: str):
+    paths = discover_configs(_write_monorepo(tmp_dir, 40))
+    return _cold(lambda: [InstallationInstruction.from_file(path).template for path in paths])
+
+@benchmark("registry/threads/40")
+def _(tmp_dir: str):
+    root = _write_monorepo(tmp_dir, 40)
+    return _cold(lambda: ConfigRegistry().add_tree(root))
+
+@benchmark("registry/processes/40")
+def _(tmp_dir: str):
+    root = _write_monorepo(tmp_dir, 40)
+    runs = iter(range(1 << 30))
+    return lambda: ConfigRegistry(ConfigCache(os.path.join(tmp_dir, f"cache-{next(runs)}")), processes=True).add_tree(root)
+
+
+def _cli(tmp_dir: str, *args: str) -> Callable[[], None]:
+    """
+    Returns a function running the cli in a new process, with cache, data and log dirs in the temporary directory.
+    """
+    env = dict(os.environ)
+    for variable in ("XDG_CACHE_HOME", "XDG_DATA_HOME", "XDG_STATE_HOME"):
+        env[variable] = os.path.join(tmp_dir, variable.lower())
+    command = [sys.executable, "-m", "installation_instruction", *args]
+
+    def run() -> None:
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    run()
+    return run
+
+@benchmark("cli/help")
+def _(tmp_dir: str):
+    return _cli(tmp_dir, "--help")
+
+@benchmark("cli/show/pytorch")
+def _(tmp_dir: str):
+    input = EXAMPLE_INPUTS["pytorch"]
+    return _cli(tmp_dir, "show", EXAMPLES["pytorch"], "--build", input["build"], "----os--", input["__os__"], "--package", input["package"], "--compute-platform", input["compute_platform"])
+
+@benchmark("cli/show-help/large")
+def _(tmp_dir: str):
+    path = os.path.join(tmp_dir, "install.cfg")
+    with open(path, "w") as file:
+        file.write(make_config(**SYNTHETIC["large"]))
+    return _cli(tmp_dir, "show", path, "--help")
+
+@benchmark("cli/install/no-op")
+def _(tmp_dir: str):
+    path = os.path.join(tmp_dir, "install.cfg")
+    with open(path, "w") as file:
+        file.write("type: object\nproperties: {}\n------\n" + "true\n" * 20)
+    return _cli(tmp_dir, "install", path)
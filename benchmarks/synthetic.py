@@ -0,0 +1,88 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Generator of large synthetic configs.
+"""
+
+import json
+
+
+def make_config(properties: int = 300, enum_size: int = 20, template_blocks: int = 1000, json_header: bool = False) -> str:
+    """
+    Returns a config with enum, boolean, string and integer properties and a template with a block of conditions per line.
+
+    :param properties: Number of properties.
+    :type properties: int
+    :param enum_size: Number of values of each enum.
+    :type enum_size: int
+    :param template_blocks: Number of `if` blocks in the template.
+    :type template_blocks: int
+    :param json_header: Write the schema as json instead of yaml.
+    :type json_header: bool
+    :return: Config string.
+    :rtype: str
+    """
+    schema = {
+        "$schema": "https://json-schema.org/draft/2020-12/schema",
+        "$id": f"https://example.org/synthetic-{properties}-{enum_size}-{template_blocks}",
+        "title": "Synthetic",
+        "type": "object",
+        "properties": {},
+    }
+    pretty = {}
+    for i in range(properties):
+        kind = i % 4
+        if kind == 0:
+            values = [f"value_{i}_{j}" for j in range(enum_size)]
+            schema["properties"][f"enum_{i}"] = {"title": f"Enum {i}", "enum": values, "default": values[0]}
+            pretty.update({value: value.replace("_", " ").title() for value in values})
+        elif kind == 1:
+            schema["properties"][f"flag_{i}"] = {"title": f"Flag {i}", "type": "boolean", "default": False}
+        elif kind == 2:
+            schema["properties"][f"name_{i}"] = {"title": f"Name {i}", "type": "string", "default": f"name{i}"}
+        else:
+            schema["properties"][f"count_{i}"] = {"title": f"Count {i}", "type": "integer", "default": i}
+
+    keys = list(schema["properties"])
+    blocks = []
+    for i in range(template_blocks):
+        key = keys[i % len(keys)]
+        if key.startswith("enum_"):
+            blocks.append(f'{{% if {key} == "{key.replace("enum", "value")}_1" %}}\n    echo "block {i}" {{{{ {key} }}}}\n{{% else %}}\n    echo "other {i}"\n{{% endif %}}\n')
+        elif key.startswith("flag_"):
+            blocks.append(f'{{% call command() %}}\n    echo "block {i}"\n    {{% if {key} %}}--{key}{{% endif %}}\n{{% endcall %}}\n')
+        else:
+            blocks.append(f'echo "block {i}" {{{{ {key} }}}}\n')
+
+    header = {"schema": schema, "pretty": pretty}
+    if json_header:
+        header_string = json.dumps(header, indent=2)
+    else:
+        import yaml
+        header_string = yaml.safe_dump(header, sort_keys=False)
+    return header_string + "\n------\n" + "".join(blocks)
+
+def make_input(config_properties: int = 300, enum_size: int = 20, variant: int = 0) -> dict:
+    """
+    Returns a valid user input for a config from `make_config`. Different variants choose different values.
+    """
+    input = {}
+    for i in range(config_properties):
+        kind = i % 4
+        if kind == 0:
+            input[f"enum_{i}"] = f"value_{i}_{(i + variant) % enum_size}"
+        elif kind == 1:
+            input[f"flag_{i}"] = (i + variant) % 2 == 0
+    return input
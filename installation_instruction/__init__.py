@@ -15,16 +15,22 @@
 
 from importlib import metadata
 
-__version__ = metadata.version(__package__)
+_metadata = metadata.metadata(__package__)
 
-# This is terrible and I really hate it.
-__description__ = metadata.metadata(__package__)["Summary"]
-__repository__ = metadata.metadata(__package__)["Project-URL"].replace("Repository, ", "")
+__version__ = _metadata["Version"]
+__description__ = _metadata["Summary"]
+__repository__ = _metadata["Project-URL"].replace("Repository, ", "")
 
-__author__ = metadata.metadata(__package__)["Author"]
-__author_email__ = metadata.metadata(__package__)["Author-email"]
-__license__ = metadata.metadata(__package__)["License"]
+__author__ = _metadata["Author"]
+__author_email__ = _metadata["Author-email"]
+__license__ = _metadata["License"]
 
-del metadata
+del metadata, _metadata
+
+def __getattr__(name):
+    # `InstallationInstruction` is imported lazily, so modules like `lookup_table` can be used without jinja and jsonschema.
+    if name == "InstallationInstruction":
+        from installation_instruction.installation_instruction import InstallationInstruction
+        return InstallationInstruction
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-from installation_instruction.installation_instruction import InstallationInstruction
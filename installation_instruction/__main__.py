@@ -21,18 +21,18 @@ are ConfigCommandGroup instances.
 """
 
 from sys import exit
-from os.path import isfile, isdir
-from subprocess import run
+import sys
 import os
 import click
 import json
-import platformdirs
 import platform
 
 from .__init__ import __version__, __description__, __repository__, __author__, __author_email__, __license__
-from .get_flags_and_options_from_schema import _get_flags_and_options
-from .installation_instruction import InstallationInstruction
 from .helpers import _red_echo, _get_install_config_file
+from .tracing import span
+
+# Modules depending on jinja, jsonschema, yaml, git or platformdirs are imported where they are needed,
+# so `ibi --help` and `ibi --version` start fast.
 
 
 VERSION_STRING = f"""Version: installation-instruction {__version__}
@@ -40,6 +40,30 @@ Copyright: (C) 2024 {__author_email__}, {__author__}
 License: {__license__}
 Repository: {__repository__}"""
 
+def _load_instruction(config_file: str):
+    """
+    Returns `InstallationInstruction` from config file, using the config cache in the user cache dir.
+    A config file is loaded once per process, it is only loaded again if it changed.
+
+    :param config_file: Path to config file.
+    :type config_file: str
+    :return: InstallationInstruction class
+    :rtype: InstallationInstruction
+    """
+    from .installation_instruction import InstallationInstruction
+    from .cache import _get_default_config_cache
+    config_file = os.path.abspath(config_file)
+    stat = os.stat(config_file)
+    version = (stat.st_mtime_ns, stat.st_size)
+    if (loaded := _instructions.get(config_file)) is not None and loaded[0] == version:
+        return loaded[1]
+    with span("load-config"):
+        instruction = InstallationInstruction.from_file(config_file, _get_default_config_cache())
+    _instructions[config_file] = (version, instruction)
+    return instruction
+
+_instructions = {}
+
 def _get_system(option_types):
     """
     Returns the os from the list of possible os systems defined in the schema.
@@ -64,6 +88,34 @@ def _get_system(option_types):
 
     return None
 
+def _enable_tracing(ctx, timings: bool, trace: str | None):
+    """
+    Adds tracing hooks and reports the phases when the command finished, also if it exits with an error.
+
+    :param timings: Print the time per phase to stderr.
+    :type timings: bool
+    :param trace: Path of the chrome trace event file or None.
+    :type trace: str or None
+    """
+    from .tracing import add_hook, Timings, ChromeTrace
+
+    timings_hook = Timings() if timings else None
+    trace_hook = ChromeTrace() if trace else None
+    for hook in (timings_hook, trace_hook):
+        if hook is not None:
+            add_hook(hook)
+
+    def report():
+        if timings_hook is not None:
+            click.echo(timings_hook.format(), err=True)
+        if trace_hook is not None:
+            trace_hook.write(trace)
+
+    ctx.call_on_close(report)
+    root = span("ibi", command=ctx.invoked_subcommand)
+    root.__enter__()
+    ctx.call_on_close(lambda: root.__exit__(None, None, None))
+
 class ConfigReadCommand(click.MultiCommand):
     """
     Custom click command class to read config file, folder or git repository and show installation instructions with parameters.
@@ -78,13 +130,25 @@ class ConfigReadCommand(click.MultiCommand):
         )
 
 
+    def shell_complete(self, ctx, incomplete: str) -> list:
+        from .completion import _complete_sources
+        return _complete_sources(incomplete) + super().shell_complete(ctx, incomplete)
+
     def get_command(self, ctx, config_file: str) -> click.Command|None:
 
+        if ctx.resilient_parsing:
+            from .completion import _get_completion_command
+            return _get_completion_command(ctx.info_name, config_file)
+
+        source = config_file
         (_temp_dir, config_file) = _get_install_config_file(config_file)
         
+        from .get_flags_and_options_from_schema import _get_flags_and_options
+        from .completion import index_options
         try:
-            instruction = InstallationInstruction.from_file(config_file)
-            options = _get_flags_and_options(instruction.schema, getattr(instruction, "misc", None),inst=True)
+            instruction = _load_instruction(config_file)
+            with span("options"):
+                options = _get_flags_and_options(instruction.schema_model, inst=True)
         except Exception as e:
             _red_echo("Error (parsing options from schema): " + str(e))
             exit(1)
@@ -97,23 +161,63 @@ class ConfigReadCommand(click.MultiCommand):
                     option.default = system_default
 
         def callback(**kwargs):
-            inst = instruction.validate_and_render(kwargs)
-            if inst[1]:
-                _red_echo("Error: " + "\n".join(inst[0]))
+            from .runner import iter_steps, run_steps, format_summary, _get_install_logger
+            if errors := instruction.validate(kwargs):
+                from jsonschema.exceptions import best_match
+                _red_echo("Error: " + best_match(errors).message)
                 exit(1)
             if ctx.obj["MODE"] == "show":
-                click.echo("\n".join(inst[0]))
+                try:
+                    with span("show"):
+                        for line in instruction.iter_render(kwargs):
+                            click.echo(line)
+                except Exception as e:
+                    _red_echo("Error: " + str(e))
+                    exit(1)
             elif ctx.obj["MODE"] == "install":
-                for command in inst[0]:
-                    result = run(command, shell=True, text=True, capture_output=True)
-                    if result.returncode != 0:
-                        _red_echo("Installation failed with:\n" + command + "\n\n" + result.stdout + "\n" + result.stderr)
+                logger = _get_install_logger()
+                logger.info("Installing %s", config_file)
+                verbose = ctx.obj["INSTALL_VERBOSE"]
+                prefix_output = ctx.obj["INSTALL_JOBS"] > 1
+                def on_output(step, stream, line):
+                    prefix = f"[{step.name}] " if prefix_output and step.name is not None else ""
+                    logger.info("%s%s: %s", prefix, stream, line)
+                    if verbose:
+                        click.echo(prefix + line, err=stream == "stderr")
+
+                # Commands start while the template renders, unless it can raise: then nothing runs before rendering finished.
+                if instruction.dependencies()["raises"]:
+                    try:
+                        (lines, is_error) = instruction._render_memoized(kwargs)
+                    except Exception as e:
+                        _red_echo("Error: " + str(e))
+                        exit(1)
+                    if is_error:
+                        _red_echo("Error: " + "\n".join(lines))
                         exit(1)
-                    else:
-                        if ctx.obj["INSTALL_VERBOSE"]:
-                            click.echo(result.stdout.strip())
+                else:
+                    lines = instruction._iter_render_with_step_markers(kwargs)
+
+                results = []
+                try:
+                    with span("install", jobs=ctx.obj["INSTALL_JOBS"]):
+                        for result in run_steps(iter_steps(lines), ctx.obj["INSTALL_JOBS"], on_output):
+                            results.append(result)
+                            for command in result.commands:
+                                logger.info("%s exited with %d after %.2fs", command.command, command.returncode, command.duration)
+                            if result.failed:
+                                click.echo(format_summary(results))
+                                _red_echo("Installation failed with:\n" + result.command + "\n\n" + result.stdout + "\n" + result.stderr)
+                                exit(1)
+                except Exception as e:
+                    if results:
+                        click.echo(format_summary(results))
+                    _red_echo("Error: " + str(e))
+                    exit(1)
+                click.echo(format_summary(results))
                 click.echo(click.style("Installation successful.", fg="green"))
 
+            index_options(ctx.info_name, source, instruction.config_key, options)
             exit(0)
             
 
@@ -135,139 +239,105 @@ class ConfigCommandGroup(click.Group):
             options_metavar="",
         )
 
+    def shell_complete(self, ctx, incomplete: str) -> list:
+        from .completion import _complete_sources
+        return _complete_sources(incomplete) + super().shell_complete(ctx, incomplete)
+
     def get_command(self, ctx, config_file: str , **kwargs) -> click.Command|None:
+
+        if ctx.resilient_parsing:
+            from .completion import _get_completion_command
+            return _get_completion_command(ctx.info_name, config_file)
         
+        from .get_flags_and_options_from_schema import _get_flags_and_options
+        from .defaults import _get_default_store, _get_user_defaults
+        from .completion import index_options
+
+        source = config_file
         (_temp_dir, config_file) = _get_install_config_file(config_file)
 
-        user_data_dir = platformdirs.user_data_dir("default_data_local","installation_instruction")
-        os.makedirs(user_data_dir, exist_ok=True)
-        PATH_TO_DEFAULT_FILE = os.path.join(user_data_dir, "DEFAULT_DATA.json")
-        ctx.obj['path'] = PATH_TO_DEFAULT_FILE
-        default_data = {}
-        if isfile(PATH_TO_DEFAULT_FILE):
-            with open(PATH_TO_DEFAULT_FILE,"r") as f:
-                default_data = json.load(f)
-            ctx.obj['default_data'] = default_data
-            ctx.obj['new_file'] = False
-        else:
-            ctx.obj['new_file'] = True
         try:
-            instruction = InstallationInstruction.from_file(config_file)
-            schema = instruction.parse_schema()
-            title = schema.get("$id")
+            instruction = _load_instruction(config_file)
+            title = instruction.schema_model.id
             ctx.obj['title'] = title
-            options, ctx.obj['defaults'] = _get_flags_and_options(instruction.schema, getattr(instruction, "misc", None)) 
+            with span("options"):
+                options, ctx.obj['defaults'] = _get_flags_and_options(instruction.schema_model)
         except Exception as e:
             _red_echo("Error (parsing options from schema): " + str(e))
             exit(1)
 
         def callback(**kwargs):
-            new_file = ctx.obj['new_file']
-            PATH_TO_DEFAULT_FILE = ctx.obj['path']
+            title = ctx.obj['title']
             if ctx.obj["MODE"] == "add":
                 orig_default = ctx.obj['defaults']
-                default_data = {}
-                if not new_file:
-                    with open(PATH_TO_DEFAULT_FILE,"r") as f:
-                        default_data = json.load(f)
-                title = ctx.obj['title']
-                exist_project = title in default_data.keys()
-                defaults_settings = {}
-                if exist_project:
-                    defaults_settings = default_data.get(title)
-                for option in options:
-                    if option.name in kwargs.keys():
-                        if kwargs.get(option.name) == None:
-                            pass
-                        elif type(option.type) == click.Choice:
-                            if kwargs.get(option.name) in option.type.choices:
-                                defaults_settings[option.name]= kwargs.get(option.name)
-                            else:
-                                _red_echo(f"There is no {kwargs.get(option.name)} option in {option.name}")
-                        else:
-                            if type(option.type)== click.types.StringParamType:
-                                defaults_settings[option.name]= kwargs.get(option.name)
-                            elif type(option.type)== click.types.IntParamType:
-                                try:
-                                    def_val = int(kwargs.get(option.name))
-                                except ValueError:
-                                    _red_echo(f"{kwargs.get(option.name)} is no int!")
-                                    exit(1)
-                                defaults_settings[option.name]= def_val
-                            elif type(option.type)== click.types.FloatParamType:
-                                try:
-                                    def_val = float(kwargs.get(option.name))
-                                except ValueError:
-                                    _red_echo(f"{kwargs.get(option.name)} is no float!")
-                                    exit(1)
-                                defaults_settings[option.name]= def_val
-                            elif type(option.type)== click.types.BoolParamType:
-                                if defaults_settings.get(option.name) == True:
-                                    defaults_settings[option.name] = False
+
+                def update(defaults_settings):
+                    for option in options:
+                        if option.name in kwargs.keys():
+                            if kwargs.get(option.name) == None:
+                                pass
+                            elif type(option.type) == click.Choice:
+                                if kwargs.get(option.name) in option.type.choices:
+                                    defaults_settings[option.name]= kwargs.get(option.name)
                                 else:
-                                    defaults_settings[option.name] = kwargs.get(option.name, False)
-                remove = []
-                for key in defaults_settings.keys():
-                    if str(defaults_settings.get(key)) == str(orig_default.get(key)):
-                        remove.append(key)
-                for key in remove:
-                    defaults_settings.pop(key)
-                if defaults_settings:
-                    default_data[title] = defaults_settings
-                else:
-                    default_data.pop(title)
-                if not default_data:
-                    os.remove(PATH_TO_DEFAULT_FILE)
-                    click.echo(f"removed default file as all setting were the same like the defaults of the developer.") 
+                                    _red_echo(f"There is no {kwargs.get(option.name)} option in {option.name}")
+                            else:
+                                if type(option.type)== click.types.StringParamType:
+                                    defaults_settings[option.name]= kwargs.get(option.name)
+                                elif type(option.type)== click.types.IntParamType:
+                                    try:
+                                        def_val = int(kwargs.get(option.name))
+                                    except ValueError:
+                                        _red_echo(f"{kwargs.get(option.name)} is no int!")
+                                        exit(1)
+                                    defaults_settings[option.name]= def_val
+                                elif type(option.type)== click.types.FloatParamType:
+                                    try:
+                                        def_val = float(kwargs.get(option.name))
+                                    except ValueError:
+                                        _red_echo(f"{kwargs.get(option.name)} is no float!")
+                                        exit(1)
+                                    defaults_settings[option.name]= def_val
+                                elif type(option.type)== click.types.BoolParamType:
+                                    if defaults_settings.get(option.name) == True:
+                                        defaults_settings[option.name] = False
+                                    else:
+                                        defaults_settings[option.name] = kwargs.get(option.name, False)
+                    remove = []
+                    for key in defaults_settings.keys():
+                        if str(defaults_settings.get(key)) == str(orig_default.get(key)):
+                            remove.append(key)
+                    for key in remove:
+                        defaults_settings.pop(key)
+                    return defaults_settings
+
+                (old_settings, defaults_settings) = _get_default_store().update(title, update)
+                if not defaults_settings:
+                    click.echo(f"removed {title} from the default_data as all setting were the same like the defaults of the developer.")
+                elif old_settings:
+                    click.echo(f"successfully applied changes to {title} in the default_data.")
                 else:
-                    with open(PATH_TO_DEFAULT_FILE,"w") as f:
-                        json.dump(default_data, f,indent= 4)
-                    if new_file:
-                        click.echo("successfully created a new default file at:")
-                        click.echo(PATH_TO_DEFAULT_FILE)
-                    if exist_project:
-                        click.echo(f"successfully added {title} to the default_data.")
-                    else:
-                        click.echo(f"successfully applied changes to {title} in the default_data.")
+                    click.echo(f"successfully added {title} to the default_data.")
 
             elif ctx.obj["MODE"] == "remove":
-                if not isfile(PATH_TO_DEFAULT_FILE):
-                    _red_echo(f"There exists no Default File to remove from.")
-                    exit(1)
-                
-                with open(PATH_TO_DEFAULT_FILE,"r") as f:
-                    default_data = json.load(f)
-                title = ctx.obj['title']
-                deleted_item = default_data.pop(title,None)
-                if not deleted_item:
+                if not _get_default_store().remove(title):
                     _red_echo(f"There exists no project to remove.")
                 else:
-                    with open(PATH_TO_DEFAULT_FILE,"w") as f:
-                        json.dump(default_data, f,indent=4)
                     click.echo(f"successfully deleted {title} from the default_data.") 
-                    if not default_data:
-                        os.remove(PATH_TO_DEFAULT_FILE)
-                        click.echo(f"removed default file as it was empty.") 
 
             elif ctx.obj["MODE"] == "list":
-                if not isfile(PATH_TO_DEFAULT_FILE):
-                    _red_echo(f"There exists no default file to list projects from.")
-                    exit(1)
-                with open(PATH_TO_DEFAULT_FILE,"r") as f:
-                    default_data = json.load(f)
-                
-                title = ctx.obj['title']
-                if not default_data.get(title,False):
+                dic = _get_user_defaults(title)
+                if not dic:
                     click.echo(f"{title} has no entry in the default file.")
                 else:
                     click.echo("")
                     click.echo(f"{title} has the following user default configurations:")
                     click.echo("")
-                    dic = default_data.get(title)
                     for i in dic.keys():
                         click.echo(f"{i}: {dic.get(i)}")
                     click.echo("")
             
+            index_options(ctx.info_name, source, instruction.config_key, options)
             exit(0)
         return click.Command(
             name=config_file,
@@ -283,6 +353,62 @@ def cat(path):
         config_string = file.read()
     print(config_string)
 
+@click.command(help="Renders every combination of enum and boolean options as JSON lines.")
+@click.argument("path")
+@click.option("-o", "--output", type=click.File("w"), default="-", help="File for the rendered combinations.")
+@click.option("--errors", type=click.File("w"), default=None, help="Separate file for combinations resulting in an error.")
+@click.option("-j", "--workers", type=click.IntRange(min=0), default=0, help="Number of worker processes, 0 uses all cpus.")
+@click.option("--limit", type=click.IntRange(min=0), default=None, help="Maximum number of combinations.")
+@click.option("--shard", default=None, metavar="I/N", help="Only render the i-th of n shards.")
+@click.option("--collapse", is_flag=True, default=False, help="Only enumerate options which influence the output.")
+@click.option("--progress/--no-progress", default=True, help="Show progress on stderr.")
+def matrix(path, output, errors, workers, limit, shard, collapse, progress):
+    from .matrix import render_matrix, count_combinations, _parse_shard
+
+    (_temp_dir, config_file) = _get_install_config_file(path)
+    try:
+        instruction = _load_instruction(config_file)
+        shard = _parse_shard(shard) if shard is not None else None
+    except Exception as e:
+        _red_echo("Error: " + str(e))
+        exit(1)
+
+    if errors is None:
+        errors = output
+    results = render_matrix(instruction, workers=workers or os.cpu_count(), limit=limit, shard=shard, collapse=collapse)
+    total = count_combinations(instruction, limit, shard, collapse)
+    with click.progressbar(length=total, label="Rendering", file=sys.stderr, hidden=not progress) as bar:
+        for (input, instructions, is_error) in results:
+            if is_error:
+                errors.write(json.dumps({"input": input, "error": "\n".join(instructions)}) + "\n")
+            else:
+                output.write(json.dumps({"input": input, "instructions": instructions}) + "\n")
+            bar.update(1)
+
+@click.command(help="Serves schemas and rendered instructions of configs over HTTP.")
+@click.argument("paths", nargs=-1, required=True)
+@click.option("--host", default="127.0.0.1", show_default=True, help="Host to bind to.")
+@click.option("--port", type=int, default=8000, show_default=True, help="Port to bind to.")
+def serve(paths, host, port):
+    import asyncio
+    from .cache import _get_default_config_cache
+    from .server import RenderServer
+
+    config_files = [_get_install_config_file(path)[1] for path in paths]
+    try:
+        server = RenderServer(config_files, _get_default_config_cache())
+    except Exception as e:
+        _red_echo("Error (loading configs): " + str(e))
+        exit(1)
+
+    for (name, config) in server.configs.items():
+        click.echo(f"Serving {config.path} as /configs/{name}")
+    click.echo(f"Listening on http://{host}:{port}")
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
 @click.command(cls=ConfigReadCommand, help="Shows installation instructions for your specified config file and parameters.")
 @click.pass_context
 def show(ctx):
@@ -290,10 +416,12 @@ def show(ctx):
 
 @click.command(cls=ConfigReadCommand, help="Installs with config and parameters given.")
 @click.option("-v", "--verbose", is_flag=True, help="Show verbose output.", default=False)
+@click.option("-j", "--jobs", type=click.IntRange(min=1), default=1, help="Number of steps run in parallel.")
 @click.pass_context
-def install(ctx, verbose):
+def install(ctx, verbose, jobs):
     ctx.obj['MODE'] = "install"
     ctx.obj['INSTALL_VERBOSE'] = verbose
+    ctx.obj['INSTALL_JOBS'] = jobs
 
 @click.group( context_settings={"help_option_names": ["-h", "--help"]}, help="Default command to create custom default settings with add, remove, and list.")
 @click.pass_context
@@ -318,14 +446,26 @@ def list(ctx):
 
 @click.group(context_settings={"help_option_names": ["-h", "--help"]}, help=__description__)
 @click.version_option(version=__version__, message=VERSION_STRING)
+@click.option("--offline", is_flag=True, default=False, envvar="IBI_OFFLINE", help="Only use already cached configs and git repositories.")
+@click.option("--timings", is_flag=True, default=False, help="Print the time spent in each phase to stderr.")
+@click.option("--trace", type=click.Path(dir_okay=False, writable=True), default=None, help="Write the phases as chrome trace event json to this file.")
 @click.pass_context
-def main(ctx):
+def main(ctx, offline, timings, trace):
     ctx.ensure_object(dict)
+    if timings or trace:
+        _enable_tracing(ctx, timings, trace)
+    if offline:
+        from .git_cache import _get_default_git_cache
+        from .http_cache import _get_default_http_cache
+        _get_default_git_cache().offline = True
+        _get_default_http_cache().offline = True
 
 main.add_command(cat)
 main.add_command(show)
 main.add_command(install)
 main.add_command(default)
+main.add_command(matrix)
+main.add_command(serve)
 
 if __name__ == "__main__":
     main()
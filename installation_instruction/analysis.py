@@ -0,0 +1,130 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Analysis of which schema properties influence the rendered template.
+"""
+
+from jinja2 import Environment, meta, nodes
+
+
+def _normalize_template_data(data: str) -> str:
+    """
+    Normalizes template data the way rendered instructions are normalized (whitespace collapsed, empty lines removed).
+    """
+    return "\n".join(" ".join(line.split()) for line in data.splitlines() if line.strip())
+
+def _signature(node_list: list) -> str:
+    """
+    Returns a string which is equal for two lists of nodes if they render the same instructions.
+    Only differences in whitespace are ignored.
+    """
+    parts = []
+    for node in node_list:
+        if isinstance(node, nodes.Output):
+            for child in node.nodes:
+                if isinstance(child, nodes.TemplateData):
+                    if data := _normalize_template_data(child.data):
+                        parts.append(repr(data))
+                else:
+                    parts.append(repr(child))
+        else:
+            parts.append(repr(node))
+    return "\n".join(parts)
+
+def _is_dead_branching(node: nodes.Node) -> bool:
+    """
+    Checks if all branches of an `if` block or expression render the same.
+    """
+    if isinstance(node, nodes.If):
+        branches = [node.body] + [elif_.body for elif_ in node.elif_] + [node.else_]
+        return len({_signature(branch) for branch in branches}) == 1
+    if isinstance(node, nodes.CondExpr):
+        return node.expr2 is not None and repr(node.expr1) == repr(node.expr2)
+    return False
+
+def _collect_usage(node: nodes.Node, usage: dict, in_condition: bool, in_dead_condition: bool) -> None:
+    """
+    Walks the AST and records for every loaded name where it is used.
+    `usage` maps names to a set of `output`, `condition` and `dead_condition`.
+    """
+    if isinstance(node, nodes.Name) and node.ctx == "load":
+        if in_dead_condition:
+            kind = "dead_condition"
+        elif in_condition:
+            kind = "condition"
+        else:
+            kind = "output"
+        usage.setdefault(node.name, set()).add(kind)
+        return
+
+    if isinstance(node, (nodes.If, nodes.CondExpr)):
+        dead = _is_dead_branching(node)
+        tests = [node.test] + ([elif_.test for elif_ in node.elif_] if isinstance(node, nodes.If) else [])
+        for test in tests:
+            _collect_usage(test, usage, True, in_dead_condition or dead)
+        elifs = node.elif_ if isinstance(node, nodes.If) else []
+        for child in node.iter_child_nodes():
+            if any(child is test for test in tests):
+                continue
+            if any(child is elif_ for elif_ in elifs):
+                for grandchild in child.iter_child_nodes():
+                    if grandchild is not child.test:
+                        _collect_usage(grandchild, usage, in_condition, in_dead_condition)
+                continue
+            _collect_usage(child, usage, in_condition, in_dead_condition)
+        return
+
+    for child in node.iter_child_nodes():
+        _collect_usage(child, usage, in_condition, in_dead_condition)
+
+def analyze_dependencies(environment: Environment, template: str, schema: dict) -> dict:
+    """
+    Analyzes which schema properties influence the rendered template.
+
+    A property influences the output if it is referenced by the template, except when it is only used
+    in tests of `if` blocks or expressions whose branches all render the same.
+
+    :param environment: Environment the template is rendered with.
+    :type environment: jinja2.Environment
+    :param template: Template source.
+    :type template: str
+    :param schema: Json schema.
+    :type schema: dict
+    :return: Dict with `properties`, mapping each property to `referenced`, `in_output`, `in_condition`
+        and `influences_output`, `undeclared`, a sorted list of names the template references but the schema does not declare,
+        and `raises`, whether the template references the `raise` macro.
+    :rtype: dict
+    """
+    ast = environment.parse(template)
+    usage = {}
+    _collect_usage(ast, usage, False, False)
+
+    # Properties are looked up by the names loaded in the template. Input overrides globals of the environment,
+    # so a property named like a macro (e.g. `step`) is referenced, which `find_undeclared_variables` leaves out.
+    properties = {}
+    for key in schema.get("properties", {}):
+        kinds = usage.get(key, set())
+        properties[key] = {
+            "referenced": bool(kinds),
+            "in_output": "output" in kinds,
+            "in_condition": "condition" in kinds,
+            "influences_output": bool(kinds - {"dead_condition"}),
+        }
+
+    return {
+        "properties": properties,
+        "undeclared": sorted(meta.find_undeclared_variables(ast) - set(properties)),
+        "raises": "raise" in usage,
+    }
@@ -0,0 +1,457 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Caches for parsed configs, compiled jinja templates and render results.
+
+Entries are keyed by a hash of the config content and the library version,
+so an unchanged `install.cfg` is neither parsed nor compiled a second time.
+"""
+
+from collections import OrderedDict
+from hashlib import sha1, sha256
+from threading import Lock, get_ident
+import json
+import os
+
+import platformdirs
+
+from installation_instruction import __version__
+from installation_instruction.environment import get_bytecode_name
+
+
+CACHE_DIR_NAME = "installation_instruction"
+DEFAULT_MAX_CACHE_SIZE = 64 * 1024 * 1024
+
+ENTRY_SUFFIX = ".json"
+BYTECODE_SUFFIX = ".jinja"
+CHOICES_SUFFIX = ".choices.json"
+
+
+def _get_default_cache_dir(name: str) -> str:
+    """
+    Returns the path to a subdirectory of the user cache directory.
+
+    :param name: Name of the subdirectory.
+    :type name: str
+    :return: Path to the directory.
+    :rtype: str
+    """
+    return os.path.join(platformdirs.user_cache_dir(CACHE_DIR_NAME), name)
+
+
+class _DiskLRU:
+    """
+    Directory of files bounded in total size. The modification time of a file is used as its last access time,
+    the least recently used files are deleted first.
+    """
+
+    def __init__(self, directory: str, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def read(self, name: str) -> bytes | None:
+        """
+        Returns the content of a file and marks it as recently used. Returns `None` if the file does not exist.
+        """
+        path = self.path(name)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def write(self, name: str, data: bytes) -> None:
+        """
+        Atomically writes a file and evicts old files if the directory grew too large.
+        """
+        path = self.path(name)
+        tmp_path = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def remove(self, name: str) -> bool:
+        try:
+            os.remove(self.path(name))
+        except OSError:
+            return False
+        return True
+
+    def evict(self) -> None:
+        """
+        Deletes least recently used files until the directory fits into `max_size`.
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                # Other processes may remove or replace files while the directory is scanned.
+                try:
+                    if not entry.is_file() or entry.name.endswith(".tmp"):
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+                total += stat.st_size
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for (_mtime, name, size) in entries:
+            if total <= self.max_size:
+                break
+            if self.remove(name):
+                self.evictions += 1
+                total -= size
+
+    def clear(self) -> None:
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file():
+                    self.remove(entry.name)
+
+
+def _create_bytecode_cache(store: _DiskLRU):
+    """
+    Returns a jinja `BytecodeCache` storing compiled templates next to the parsed config entries.
+    Jinja is only imported when a template is compiled.
+    """
+    from jinja2 import BytecodeCache
+
+    class _ConfigBytecodeCache(BytecodeCache):
+
+        def __init__(self, store: _DiskLRU) -> None:
+            self.store = store
+            self.hits = 0
+            self.misses = 0
+
+        def load_bytecode(self, bucket) -> None:
+            data = self.store.read(bucket.key + BYTECODE_SUFFIX)
+            if data is None:
+                self.misses += 1
+                return
+            bucket.bytecode_from_string(data)
+            if bucket.code is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        def dump_bytecode(self, bucket) -> None:
+            self.store.write(bucket.key + BYTECODE_SUFFIX, bucket.bytecode_to_string())
+
+        def clear(self) -> None:
+            self.store.clear()
+
+    return _ConfigBytecodeCache(store)
+
+
+class ConfigCache:
+    """
+    Persistent cache of parsed configs (schema, misc and template source) and their compiled jinja templates.
+
+    Pass it to `InstallationInstruction` or `InstallationInstruction.from_file` to skip parsing,
+    schema checking and template compilation of configs which were already seen.
+    """
+
+    def __init__(self, directory: str | None = None, max_size: int = DEFAULT_MAX_CACHE_SIZE) -> None:
+        """
+        :param directory: Cache directory. Defaults to a directory in the user cache dir.
+        :type directory: str or None
+        :param max_size: Maximum size of the cache directory in bytes.
+        :type max_size: int
+        """
+        if directory is None:
+            directory = _get_default_cache_dir("configs")
+        self.store = _DiskLRU(directory, max_size)
+        self._bytecode_cache = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def bytecode_cache(self):
+        """
+        Jinja `BytecodeCache` of the compiled templates, created on first use.
+
+        :rtype: jinja2.BytecodeCache
+        """
+        if self._bytecode_cache is None:
+            self._bytecode_cache = _create_bytecode_cache(self.store)
+        return self._bytecode_cache
+
+    @staticmethod
+    def key(config: str) -> str:
+        """
+        Returns the cache key of a config string. The key changes with the content and the library version.
+
+        :param config: Config string.
+        :type config: str
+        :return: Hex digest.
+        :rtype: str
+        """
+        digest = sha256(__version__.encode())
+        digest.update(b"\0")
+        digest.update(config.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """
+        Returns the cached entry or `None`.
+
+        :param key: Key from `ConfigCache.key`.
+        :type key: str
+        :return: Dict with the keys `schema`, `misc` and `template` or None.
+        :rtype: dict or None
+        """
+        data = self.store.read(key + ENTRY_SUFFIX)
+        if data is not None:
+            try:
+                entry = json.loads(data)
+            except ValueError:
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def set(self, key: str, entry: dict) -> bool:
+        """
+        Stores an entry. Entries which do not survive a round trip through json are not stored,
+        e.g. a YAML header with dates or integer keys, so such configs are always parsed.
+
+        :param key: Key from `ConfigCache.key`.
+        :type key: str
+        :param entry: Dict with the keys `schema`, `misc` and `template`.
+        :type entry: dict
+        :return: True if the entry was stored.
+        :rtype: bool
+        """
+        try:
+            data = json.dumps(entry)
+        except (TypeError, ValueError):
+            return False
+        if json.loads(data) != entry:
+            return False
+        self.store.write(key + ENTRY_SUFFIX, data.encode("utf-8"))
+        return True
+
+    def get_artifact(self, key: str, suffix: str) -> bytes | None:
+        """
+        Returns data derived from a config, like a choice table, or `None`.
+
+        :param key: Key from `ConfigCache.key`.
+        :type key: str
+        :param suffix: Suffix of the kind of data.
+        :type suffix: str
+        :return: Stored data or None.
+        :rtype: bytes or None
+        """
+        return self.store.read(key + suffix)
+
+    def set_artifact(self, key: str, suffix: str, data: bytes) -> None:
+        """
+        Stores data derived from a config. It is removed with the config by `invalidate`.
+
+        :param key: Key from `ConfigCache.key`.
+        :type key: str
+        :param suffix: Suffix of the kind of data.
+        :type suffix: str
+        :param data: Data to store.
+        :type data: bytes
+        """
+        self.store.write(key + suffix, data)
+
+    def invalidate(self, key: str) -> None:
+        """
+        Removes an entry, its compiled template and derived data.
+
+        :param key: Key from `ConfigCache.key`.
+        :type key: str
+        """
+        self.store.remove(key + ENTRY_SUFFIX)
+        self.store.remove(key + CHOICES_SUFFIX)
+        # Bucket keys of jinja `BytecodeCache.get_cache_key` for the template names, see `environment.load_template`.
+        for name in (get_bytecode_name(key), get_bytecode_name(key, True)):
+            self.store.remove(sha1(name.encode("utf-8")).hexdigest() + BYTECODE_SUFFIX)
+
+    def clear(self) -> None:
+        """
+        Removes all entries.
+        """
+        self.store.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns hit, miss and eviction counters of this cache instance.
+
+        :return: Dict with counters.
+        :rtype: dict
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytecode_hits": self._bytecode_cache.hits if self._bytecode_cache is not None else 0,
+            "bytecode_misses": self._bytecode_cache.misses if self._bytecode_cache is not None else 0,
+            "evictions": self.store.evictions,
+        }
+
+
+class RenderCache:
+    """
+    Two tier cache of render results: a bounded in-memory LRU and an optional on-disk tier shared between processes.
+
+    Assign it to `InstallationInstruction.render_cache` to memoize `validate_and_render`.
+    Keys consist of the config key (see `ConfigCache.key`) and a canonical form of the user input.
+    """
+
+    def __init__(self, maxsize: int = 1024, directory: str | None = None, max_disk_size: int = DEFAULT_MAX_CACHE_SIZE) -> None:
+        """
+        :param maxsize: Maximum number of results held in memory.
+        :type maxsize: int
+        :param directory: Directory of the on-disk tier. If None, results are only held in memory.
+        :type directory: str or None
+        :param max_disk_size: Maximum size of the on-disk tier in bytes.
+        :type max_disk_size: int
+        """
+        self.maxsize = maxsize
+        self.memory = OrderedDict()
+        self.disk = _DiskLRU(directory, max_disk_size) if directory is not None else None
+        self.lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _file_name(config_key: str, input_key: str) -> str:
+        return config_key[:32] + "-" + sha256(input_key.encode("utf-8")).hexdigest()[:32] + ENTRY_SUFFIX
+
+    def get(self, config_key: str, input_key: str) -> tuple[list[str], bool] | None:
+        """
+        Returns a cached render result or `None`.
+
+        :param config_key: Key of the config.
+        :type config_key: str
+        :param input_key: Canonical form of the user input.
+        :type input_key: str
+        :return: Instructions and False. Or error and True.
+        :rtype: tuple[list[str], bool] or None
+        """
+        key = (config_key, input_key)
+        with self.lock:
+            result = self.memory.get(key)
+            if result is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return (list(result[0]), result[1])
+        if self.disk is not None:
+            data = self.disk.read(self._file_name(config_key, input_key))
+            if data is not None:
+                (stored_input_key, lines, is_error) = json.loads(data)
+                if stored_input_key == input_key:
+                    self.disk_hits += 1
+                    self._set_memory(key, (tuple(lines), is_error))
+                    return (lines, is_error)
+        self.misses += 1
+        return None
+
+    def set(self, config_key: str, input_key: str, result: tuple[list[str], bool]) -> None:
+        """
+        Stores a render result in both tiers.
+
+        :param config_key: Key of the config.
+        :type config_key: str
+        :param input_key: Canonical form of the user input.
+        :type input_key: str
+        :param result: Instructions and False. Or error and True.
+        :type result: tuple[list[str], bool]
+        """
+        (lines, is_error) = result
+        self._set_memory((config_key, input_key), (tuple(lines), is_error))
+        if self.disk is not None:
+            data = json.dumps([input_key, lines, is_error]).encode("utf-8")
+            self.disk.write(self._file_name(config_key, input_key), data)
+
+    def _set_memory(self, key: tuple, result: tuple) -> None:
+        with self.lock:
+            self.memory[key] = result
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.maxsize:
+                self.memory.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, config_key: str) -> None:
+        """
+        Removes all results of a config from both tiers.
+
+        :param config_key: Key of the config.
+        :type config_key: str
+        """
+        with self.lock:
+            for key in [key for key in self.memory if key[0] == config_key]:
+                del self.memory[key]
+        if self.disk is not None:
+            prefix = config_key[:32] + "-"
+            for name in os.listdir(self.disk.directory):
+                if name.startswith(prefix):
+                    self.disk.remove(name)
+
+    def clear(self) -> None:
+        """
+        Removes all results from both tiers.
+        """
+        with self.lock:
+            self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns hit, miss and eviction counters of this cache instance.
+
+        :return: Dict with counters.
+        :rtype: dict
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk.evictions if self.disk is not None else 0,
+            "size": len(self.memory),
+        }
+
+
+_default_config_cache = None
+
+def _get_default_config_cache() -> ConfigCache:
+    """
+    Returns the process wide `ConfigCache` in the user cache directory.
+    """
+    global _default_config_cache
+    if _default_config_cache is None:
+        _default_config_cache = ConfigCache()
+    return _default_config_cache
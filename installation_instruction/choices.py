@@ -0,0 +1,178 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Valid remaining choices of enum and boolean options for a partial user input.
+
+Every combination of the options which influence the output is rendered once (see `installation_instruction.matrix`).
+Combinations are numbered in the order of `itertools.product`, and sets of combinations are stored as bitsets in python integers.
+A query intersects the bitset of the valid combinations with the bitsets of the values already chosen.
+"""
+
+import json
+
+from installation_instruction.lookup_table import _value_key
+
+
+MAX_COMBINATIONS = 1 << 22
+
+
+def _pattern_bitset(count: int, stride: int, size: int, index: int) -> int:
+    """
+    Returns the bitset of all combinations where the option with the given stride and number of values has the value `index`.
+    """
+    if count == 0:
+        return 0
+    period = "0" * (index * stride) + "1" * stride + "0" * ((size - index - 1) * stride)
+    return int((period * (count // (size * stride)))[::-1], 2)
+
+
+def _template_raises(instruction, input: dict) -> bool:
+    """
+    Returns if the template raises for input which is only invalid because required properties are missing.
+    Such combinations are rendered without validation and excluded only if the template raises.
+    """
+    try:
+        return instruction._render(input)[1]
+    except Exception:
+        return True
+
+
+def _relaxed_validator(instruction, input: dict):
+    """
+    Returns a validator of the schema which does not require the properties missing from `input`.
+    Properties which are neither enumerated nor have a default are missing from every combination,
+    so only these are relaxed and enumerated values which break the schema are still reported.
+    """
+    from installation_instruction.validator import compile_validator
+
+    schema = dict(instruction.schema)
+    schema["required"] = [key for key in schema.get("required", []) if key in input]
+    return compile_validator(schema)
+
+
+class ChoiceTable:
+    """
+    Bitset encoded table of the option combinations which are valid against the schema and for which the template does not raise.
+    """
+
+    def __init__(self, options: list[tuple[str, list]], fixed: dict, valid: int) -> None:
+        """
+        :param options: Enumerated option keys with their values, in the order of the combinations.
+        :type options: list[tuple[str, list]]
+        :param fixed: Enum and boolean options which do not influence the output, with their values.
+        :type fixed: dict
+        :param valid: Bitset of the valid combinations.
+        :type valid: int
+        """
+        self.options = options
+        self.fixed = fixed
+        self.valid = valid
+        self.count = 1
+        for (_key, values) in options:
+            self.count *= len(values)
+
+        self._bitsets = {}
+        self._indices = {}
+        stride = self.count
+        for (key, values) in options:
+            stride //= len(values)
+            self._bitsets[key] = [_pattern_bitset(self.count, stride, len(values), index) for index in range(len(values))]
+            self._indices[key] = {_value_key(value): index for (index, value) in enumerate(values)}
+
+    @classmethod
+    def from_instruction(cls, instruction, workers: int | None = None):
+        """
+        Renders every combination of the options which influence the output and records which are valid.
+        Required properties which are neither enumerated nor have a default are not required,
+        every other schema error and every raise of the template marks a combination as invalid.
+
+        :param instruction: Installation instruction.
+        :type instruction: InstallationInstruction
+        :param workers: Number of worker processes for rendering.
+        :type workers: int or None
+        :raise Exception: If there are more than `MAX_COMBINATIONS` combinations.
+        :return: Choice table.
+        :rtype: ChoiceTable
+        """
+        from installation_instruction.matrix import render_matrix, count_combinations, _get_option_space
+
+        count = count_combinations(instruction, collapse=True)
+        if count > MAX_COMBINATIONS:
+            raise Exception(f"Config has {count} combinations of options, more than {MAX_COMBINATIONS} are not supported.")
+        (space, _fixed) = _get_option_space(instruction, collapse=True)
+        enumerated = {key for (key, _values) in space}
+        fixed = {}
+        for (key, value) in instruction.schema.get("properties", {}).items():
+            if key in enumerated:
+                continue
+            if "enum" in value:
+                fixed[key] = list(value["enum"])
+            elif value.get("type") == "boolean":
+                fixed[key] = [False, True]
+
+        bits = bytearray(b"0" * count)
+        relaxed = None
+        for (index, (input, _instructions, is_error)) in enumerate(render_matrix(instruction, workers=workers, collapse=True)):
+            if is_error and instruction.validate(input):
+                if relaxed is None:
+                    relaxed = _relaxed_validator(instruction, input)
+                is_error = bool(relaxed(input)) or _template_raises(instruction, input)
+            if not is_error:
+                bits[index] = ord("1")
+        return cls(space, fixed, int(bits[::-1], 2) if count else 0)
+
+    def to_json(self) -> str:
+        return json.dumps({"options": self.options, "fixed": self.fixed, "valid": format(self.valid, "x")})
+
+    @classmethod
+    def from_json(cls, data: str | bytes):
+        data = json.loads(data)
+        return cls([tuple(option) for option in data["options"]], data["fixed"], int(data["valid"], 16))
+
+    def _index(self, key: str, value) -> int:
+        try:
+            index = self._indices[key].get(_value_key(value))
+        except TypeError:
+            index = None
+        if index is None:
+            raise Exception(f"{value!r} is not a value of {key}.")
+        return index
+
+    def valid_choices(self, partial: dict) -> dict[str, list]:
+        """
+        Returns for each enum and boolean option not set in `partial` the values which do not make the template raise.
+        Other options are assumed to be their defaults.
+
+        :param partial: Partial enduser input.
+        :type partial: dict
+        :raise Exception: If a value of `partial` is not a value of its option.
+        :return: Option keys mapped to their valid values.
+        :rtype: dict[str, list]
+        """
+        remaining = self.valid
+        for (key, value) in partial.items():
+            if key in self._bitsets:
+                remaining &= self._bitsets[key][self._index(key, value)]
+            elif key in self.fixed and not any(_value_key(value) == _value_key(choice) for choice in self.fixed[key]):
+                raise Exception(f"{value!r} is not a value of {key}.")
+
+        choices = {}
+        for (key, values) in self.options:
+            if key not in partial:
+                choices[key] = [value for (value, bitset) in zip(values, self._bitsets[key]) if remaining & bitset]
+        for (key, values) in self.fixed.items():
+            if key not in partial:
+                choices[key] = list(values) if remaining else []
+        return choices
@@ -0,0 +1,264 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Shell completion of the options of configs, served from a persisted index.
+
+While completing `ibi show <config> --<TAB>` click asks for the options of the config on every key press.
+The option names, types and choices of each config are stored in a small sqlite index in the user cache directory,
+keyed by the command, the source given on the command line and the hash of the config content, see `ConfigCache.key`.
+Local configs are read and hashed, they are only parsed and indexed by completion if their hash is not indexed.
+Git urls are completed from their indexed options without fetching them, they are indexed after a command succeeded with them.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+import click
+from click.shell_completion import CompletionItem
+
+from installation_instruction.helpers import _is_remote_git_repository, _resolve_config_file
+from installation_instruction.get_flags_and_options_from_schema import SCHEMA_TO_CLICK_TYPE_MAPPING, _get_flags_and_options
+
+
+DATABASE_FILE_NAME = "options.sqlite3"
+MAX_INDEX_ENTRIES = 256
+BUSY_TIMEOUT = 5.0
+
+# Commands whose options are built for installing, see `_get_flags_and_options`.
+INSTALL_COMMANDS = ("show", "install")
+
+_CLICK_TYPES = {click_type.name: click_type for click_type in SCHEMA_TO_CLICK_TYPE_MAPPING.values()}
+
+
+class OptionIndex:
+    """
+    Persisted options of configs, keyed by the command, their source and content hash.
+    At most `max_entries` options are kept, the ones indexed longest ago are removed first.
+    """
+
+    def __init__(self, directory: str | None = None, max_entries: int = MAX_INDEX_ENTRIES) -> None:
+        """
+        :param directory: Directory of the database. Defaults to a directory in the user cache dir.
+        :type directory: str or None
+        :param max_entries: Maximum number of indexed options of a command and source.
+        :type max_entries: int
+        """
+        if directory is None:
+            from installation_instruction.cache import _get_default_cache_dir
+            directory = _get_default_cache_dir("completion")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, DATABASE_FILE_NAME)
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS options (command TEXT NOT NULL, source TEXT NOT NULL, hash TEXT NOT NULL, options TEXT NOT NULL, indexed REAL NOT NULL, PRIMARY KEY (command, source))")
+
+    def get(self, command: str, source: str, hash: str | None = None) -> list[dict] | None:
+        """
+        Returns the indexed options of a source for a command.
+
+        :param command: Name of the command, e.g. `show`.
+        :type command: str
+        :param source: Git url or absolute path of the config.
+        :type source: str
+        :param hash: Hash of the config content, None returns the options of any content.
+        :type hash: str or None
+        :return: Option specs, see `_option_specs`, or None if the source is not indexed with this hash.
+        :rtype: list[dict] or None
+        """
+        row = self.connection.execute("SELECT hash, options FROM options WHERE command = ? AND source = ?", (command, source)).fetchone()
+        if row is None or (hash is not None and row[0] != hash):
+            return None
+        return json.loads(row[1])
+
+    def set(self, command: str, source: str, hash: str, options: list[dict]) -> None:
+        """
+        Indexes the options of a source for a command, replacing the ones of an earlier content.
+
+        :param command: Name of the command, e.g. `show`.
+        :type command: str
+        :param source: Git url or absolute path of the config.
+        :type source: str
+        :param hash: Hash of the config content.
+        :type hash: str
+        :param options: Option specs, see `_option_specs`.
+        :type options: list[dict]
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO options (command, source, hash, options, indexed) VALUES (?, ?, ?, ?, ?)",
+                (command, source, hash, json.dumps(options), time.time()),
+            )
+            self.connection.execute(
+                "DELETE FROM options WHERE rowid NOT IN (SELECT rowid FROM options ORDER BY indexed DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def sources(self, prefix: str = "") -> list[str]:
+        """
+        Returns the indexed sources of any command starting with a prefix.
+
+        :rtype: list[str]
+        """
+        rows = self.connection.execute("SELECT DISTINCT source FROM options WHERE substr(source, 1, ?) = ? ORDER BY source", (len(prefix), prefix))
+        return [source for (source,) in rows]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+_default_option_index = None
+
+def _get_default_option_index() -> OptionIndex:
+    """
+    Returns the process wide `OptionIndex` in the user cache directory.
+    """
+    global _default_option_index
+    if _default_option_index is None:
+        _default_option_index = OptionIndex()
+    return _default_option_index
+
+
+def _index_key(source: str) -> str:
+    """
+    Returns the key of a source in the index, local paths are made absolute.
+    """
+    return source if _is_remote_git_repository(source) else os.path.abspath(source)
+
+def _option_specs(options: list[click.Option]) -> list[dict]:
+    """
+    Returns what completion needs of click options as json serializable dicts: declarations, type, choices, help and if it is a flag.
+    """
+    return [
+        {
+            "decls": ["/".join(pair) for pair in zip(option.opts, option.secondary_opts)] or list(option.opts),
+            "type": option.type.name,
+            "choices": list(option.type.choices) if isinstance(option.type, click.Choice) else None,
+            "help": option.help,
+            "is_flag": option.is_flag,
+        }
+        for option in options
+    ]
+
+def _options_from_specs(specs: list[dict]) -> list[click.Option]:
+    """
+    Creates click options from specs returned by `_option_specs`.
+    """
+    return [
+        click.Option(
+            param_decls=spec["decls"],
+            type=click.Choice(spec["choices"]) if spec["choices"] is not None else _CLICK_TYPES.get(spec["type"], click.STRING),
+            help=spec["help"],
+            is_flag=spec["is_flag"],
+            show_choices=True,
+        )
+        for spec in specs
+    ]
+
+def _get_specs(command: str, instruction) -> list[dict]:
+    """
+    Returns the option specs of a config as the command builds its options.
+    """
+    if command in INSTALL_COMMANDS:
+        options = _get_flags_and_options(instruction.schema_model, inst=True)
+    else:
+        (options, _defaults) = _get_flags_and_options(instruction.schema_model)
+    return _option_specs(options)
+
+def index_options(command: str, source: str, config_key: str, options: list[click.Option]) -> None:
+    """
+    Indexes the options of a git url if they are not indexed with its current content, called after a command succeeded.
+    Local configs are indexed by completion itself, so for them the index is not opened.
+    The index only speeds up completion, so errors writing it are ignored.
+
+    :param command: Name of the command, e.g. `show`.
+    :type command: str
+    :param source: Git url, path to dir or file as given on the command line.
+    :type source: str
+    :param config_key: Hash of the config content, `InstallationInstruction.config_key`.
+    :type config_key: str
+    :param options: Click options of the config.
+    :type options: list[click.Option]
+    """
+    if not _is_remote_git_repository(source):
+        return
+    try:
+        index = _get_default_option_index()
+        if index.get(command, source, config_key) is None:
+            index.set(command, source, config_key, _option_specs(options))
+    except (OSError, sqlite3.Error):
+        pass
+
+def _get_completion_command(command: str, source: str) -> click.Command | None:
+    """
+    Returns a command with the options of a config for shell completion.
+
+    Git urls which are indexed are not fetched. Local configs are parsed only if their content is not indexed,
+    their options are indexed afterwards. Nothing is printed, if the config can not be found or parsed None is returned.
+
+    :param command: Name of the command, e.g. `show`.
+    :type command: str
+    :param source: Git url, path to dir or file as given on the command line.
+    :type source: str
+    :return: Command with the options of the config, without callback.
+    :rtype: click.Command or None
+    """
+    key = _index_key(source)
+    try:
+        index = _get_default_option_index()
+    except (OSError, sqlite3.Error):
+        index = None
+
+    specs = None
+    if index is not None and _is_remote_git_repository(source):
+        specs = index.get(command, key)
+    if specs is None:
+        from installation_instruction.cache import ConfigCache, _get_default_config_cache
+        try:
+            with open(_resolve_config_file(source), "r") as file:
+                config = file.read()
+            config_key = ConfigCache.key(config)
+            if index is not None:
+                specs = index.get(command, key, config_key)
+            if specs is None:
+                from installation_instruction.installation_instruction import InstallationInstruction
+                instruction = InstallationInstruction(config, _get_default_config_cache())
+                specs = _get_specs(command, instruction)
+                if index is not None:
+                    try:
+                        index.set(command, key, config_key, specs)
+                    except sqlite3.Error:
+                        pass
+        except Exception:
+            return None
+    return click.Command(name=source, params=_options_from_specs(specs))
+
+def _complete_sources(incomplete: str) -> list[CompletionItem]:
+    """
+    Completes the config argument with indexed git urls and local files.
+    """
+    if incomplete.startswith("-"):
+        return []
+    try:
+        sources = [source for source in _get_default_option_index().sources(incomplete) if _is_remote_git_repository(source)]
+    except (OSError, sqlite3.Error):
+        sources = []
+    return [CompletionItem(source) for source in sources] + [CompletionItem(incomplete, type="file")]
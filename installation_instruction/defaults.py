@@ -0,0 +1,193 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Store of the custom defaults users set with `ibi default add`.
+
+Defaults are kept in a sqlite database with one row per project and option, so reading the defaults
+of one project does not load the others and concurrent changes do not overwrite each other.
+Defaults from the `DEFAULT_DATA.json` file of earlier versions are imported once.
+"""
+
+from contextlib import contextmanager
+from typing import Callable
+import json
+import os
+import sqlite3
+
+
+DATA_DIR_NAME = "default_data_local"
+DATA_DIR_AUTHOR = "installation_instruction"
+DATABASE_FILE_NAME = "defaults.sqlite3"
+LEGACY_FILE_NAME = "DEFAULT_DATA.json"
+BUSY_TIMEOUT = 30.0
+
+
+def _get_default_data_dir() -> str:
+    """
+    Returns the user data directory the defaults are stored in.
+    """
+    import platformdirs
+    return platformdirs.user_data_dir(DATA_DIR_NAME, DATA_DIR_AUTHOR)
+
+
+class DefaultsStore:
+    """
+    Transactional store of user defaults, keyed by the `$id` of a schema.
+    """
+
+    def __init__(self, directory: str | None = None) -> None:
+        """
+        :param directory: Directory of the database. Defaults to the user data dir.
+        :type directory: str or None
+        """
+        if directory is None:
+            directory = _get_default_data_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, DATABASE_FILE_NAME)
+        self.legacy_path = os.path.join(directory, LEGACY_FILE_NAME)
+        self.connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        # Readers do not take the write lock once the tables exist and the json file was imported.
+        if not self._is_migrated():
+            with self._transaction() as connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS defaults (project TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (project, key))")
+                connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+                self._migrate(connection)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Holds the write lock of the database from the start, so read-modify-write cycles are atomic across processes.
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def _is_migrated(self) -> bool:
+        try:
+            return self.connection.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone() is not None
+        except sqlite3.OperationalError:
+            return False
+
+    def _migrate(self, connection: sqlite3.Connection) -> None:
+        """
+        Imports the json file of earlier versions once.
+        """
+        if connection.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone() is not None:
+            return
+        if os.path.isfile(self.legacy_path):
+            with open(self.legacy_path, "r") as file:
+                legacy = json.load(file)
+            connection.executemany(
+                "INSERT OR REPLACE INTO defaults (project, key, value) VALUES (?, ?, ?)",
+                [
+                    (project, key, json.dumps(value))
+                    for (project, settings) in legacy.items()
+                    for (key, value) in settings.items()
+                ],
+            )
+        connection.execute("INSERT INTO meta (key, value) VALUES ('migrated', '1')")
+
+    def get(self, project: str) -> dict:
+        """
+        Returns the defaults of a project.
+
+        :param project: `$id` of the schema.
+        :type project: str
+        :return: Option keys and values, empty if the project has no defaults.
+        :rtype: dict
+        """
+        rows = self.connection.execute("SELECT key, value FROM defaults WHERE project = ? ORDER BY rowid", (project,))
+        return {key: json.loads(value) for (key, value) in rows}
+
+    def update(self, project: str, update: Callable[[dict], dict]) -> tuple[dict, dict]:
+        """
+        Atomically replaces the defaults of a project with the result of `update` called with the current defaults.
+        Returning an empty dict removes the project.
+
+        :param project: `$id` of the schema.
+        :type project: str
+        :param update: Function returning the new defaults.
+        :type update: Callable[[dict], dict]
+        :return: Old and new defaults.
+        :rtype: tuple[dict, dict]
+        """
+        with self._transaction() as connection:
+            old = self.get(project)
+            new = update(dict(old))
+            for key in old.keys() - new.keys():
+                connection.execute("DELETE FROM defaults WHERE project = ? AND key = ?", (project, key))
+            connection.executemany(
+                "INSERT OR REPLACE INTO defaults (project, key, value) VALUES (?, ?, ?)",
+                [(project, key, json.dumps(value)) for (key, value) in new.items() if key not in old or old[key] != value],
+            )
+        return (old, new)
+
+    def remove(self, project: str) -> bool:
+        """
+        Removes the defaults of a project.
+
+        :param project: `$id` of the schema.
+        :type project: str
+        :return: True if the project had defaults.
+        :rtype: bool
+        """
+        with self._transaction() as connection:
+            return connection.execute("DELETE FROM defaults WHERE project = ?", (project,)).rowcount > 0
+
+    def projects(self) -> list[str]:
+        """
+        Returns all projects with defaults.
+
+        :return: Sorted list of `$id` of the schemas.
+        :rtype: list[str]
+        """
+        return [project for (project,) in self.connection.execute("SELECT DISTINCT project FROM defaults ORDER BY project")]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+_default_store = None
+
+def _get_default_store() -> DefaultsStore:
+    """
+    Returns the process wide `DefaultsStore` in the user data directory.
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = DefaultsStore()
+    return _default_store
+
+def _get_user_defaults(project: str | None) -> dict:
+    """
+    Returns the defaults the user set for a project. This is the read path of `install`, `show` and `default list`.
+
+    :param project: `$id` of the schema.
+    :type project: str or None
+    :return: Option keys and values.
+    :rtype: dict
+    """
+    if project is None:
+        return {}
+    if _default_store is None:
+        # Users who never set a default have no database, reading does not create one.
+        directory = _get_default_data_dir()
+        if not os.path.isfile(os.path.join(directory, DATABASE_FILE_NAME)) and not os.path.isfile(os.path.join(directory, LEGACY_FILE_NAME)):
+            return {}
+    return _get_default_store().get(project)
@@ -0,0 +1,218 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The jinja environment shared by all templates of a process.
+
+The macros `raise`, `command` and `step` are compiled once and provided as globals of the environment,
+so they are not part of the template source and line numbers in errors are the line numbers of the config's template.
+Compiled templates are kept in a bounded LRU keyed by a hash of their source.
+
+Templates rendered with `InstallationInstruction.validate_and_render_async` use a second shared environment with `enable_async=True`.
+"""
+
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from jinja2 import Template, BytecodeCache
+    from jinja2.sandbox import SandboxedEnvironment
+
+
+RAISE_JINJA_MACRO_STRING = """
+{% macro raise(error) %}
+    {{ None['[ERROR] ' ~ error][0] }}
+{% endmacro %}
+"""
+
+COMMAND_JINJA_MACRO_STRING = """
+{% macro command() %}
+    {% filter replace("\n", " ") %}
+        {{ caller() }}
+    {% endfilter %} 
+{% endmacro %}
+"""
+
+STEP_JINJA_MACRO_STRING = """
+{% macro step(name, after=[]) %}
+    #ibi-step {{ {"name": name, "after": after} | tojson }}
+    {{ caller() }}
+    #ibi-end-step
+{% endmacro %}
+"""
+
+MACROS = [
+    RAISE_JINJA_MACRO_STRING,
+    COMMAND_JINJA_MACRO_STRING,
+    STEP_JINJA_MACRO_STRING,
+]
+MACRO_NAMES = ["raise", "command", "step"]
+
+DEFAULT_OPTIONS = {
+    "trim_blocks": True,
+    "lstrip_blocks": True,
+}
+DEFAULT_TEMPLATE_CACHE_SIZE = 128
+ASYNC_SUFFIX = "#async"
+
+
+_lock = Lock()
+_options = dict(DEFAULT_OPTIONS)
+_options_key = None
+_template_cache_size = DEFAULT_TEMPLATE_CACHE_SIZE
+_environments = {}
+_templates = OrderedDict()
+
+
+def configure_environment(template_cache_size: int | None = None, **options) -> None:
+    """
+    Sets options of the shared environment. Templates loaded before are dropped from the cache,
+    the environment is created again with the next template.
+
+    :param template_cache_size: Maximum number of compiled templates kept in memory.
+    :type template_cache_size: int or None
+    :param options: Keyword arguments of `jinja2.sandbox.SandboxedEnvironment`, added to `DEFAULT_OPTIONS`.
+    """
+    global _options, _options_key, _template_cache_size
+    with _lock:
+        _options = {**DEFAULT_OPTIONS, **options}
+        _options_key = None
+        if template_cache_size is not None:
+            _template_cache_size = template_cache_size
+        _environments.clear()
+        _templates.clear()
+
+def _create_environment(options: dict) -> "SandboxedEnvironment":
+    """
+    Creates a sandboxed environment with the macros as globals.
+    """
+    from jinja2.sandbox import SandboxedEnvironment
+    environment = SandboxedEnvironment(**options)
+    library = environment.from_string("".join(MACROS))
+    if environment.is_async:
+        library = _run_to_completion(library.make_module_async())
+    else:
+        library = library.module
+    environment.globals.update({name: getattr(library, name) for name in MACRO_NAMES})
+    return environment
+
+def _run_to_completion(coroutine):
+    """
+    Runs a coroutine which never waits for anything, without an event loop.
+    Defining the macros does not wait, so the macro module of the async environment can be created from any thread.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    coroutine.close()
+    raise Exception("Coroutine did not complete without waiting.")
+
+def get_environment(enable_async: bool = False) -> "SandboxedEnvironment":
+    """
+    Returns the shared environment templates are rendered with.
+
+    :param enable_async: Return the environment for rendering with `Template.render_async`.
+    :type enable_async: bool
+    :return: Sandboxed jinja environment with the macros as globals.
+    :rtype: jinja2.sandbox.SandboxedEnvironment
+    """
+    with _lock:
+        if (environment := _environments.get(enable_async)) is None:
+            environment = _environments[enable_async] = _create_environment({**_options, "enable_async": enable_async})
+        return environment
+
+def get_bytecode_name(name: str, enable_async: bool = False) -> str:
+    """
+    Returns the name under which a template is stored in a bytecode cache.
+    It contains a hash of the environment options, so templates compiled with other options are not loaded.
+    Async templates are stored under the name with `ASYNC_SUFFIX`.
+
+    :param name: Name of the template, e.g. `ConfigCache.key` of its config.
+    :type name: str
+    :param enable_async: Name of the template compiled for `Template.render_async`.
+    :type enable_async: bool
+    :rtype: str
+    """
+    global _options_key
+    with _lock:
+        if _options_key is None:
+            _options_key = sha256(repr(sorted(_options.items())).encode("utf-8")).hexdigest()[:16]
+        name = f"{name}#{_options_key}"
+    return name + ASYNC_SUFFIX if enable_async else name
+
+def load_template(source: str, bytecode_cache: "BytecodeCache | None" = None, name: str | None = None, enable_async: bool = False) -> "Template":
+    """
+    Returns the compiled template of a source, from the in-memory cache if it was loaded before.
+
+    If a bytecode cache and a name are given, the compiled template is loaded from and stored in the bytecode cache,
+    under the name returned by `get_bytecode_name`.
+
+    :param source: Template source without macros.
+    :type source: str
+    :param bytecode_cache: Cache for compiled templates.
+    :type bytecode_cache: jinja2.BytecodeCache or None
+    :param name: Name under which the template is stored in the bytecode cache.
+    :type name: str or None
+    :param enable_async: Compile the template for `Template.render_async`.
+    :type enable_async: bool
+    :return: Compiled template.
+    :rtype: jinja2.Template
+    """
+    environment = get_environment(enable_async)
+    key = (enable_async, sha256(source.encode("utf-8")).hexdigest())
+    with _lock:
+        if (template := _templates.get(key)) is not None and template.environment is environment:
+            _templates.move_to_end(key)
+            return template
+
+    if bytecode_cache is None or name is None:
+        template = environment.from_string(source)
+    else:
+        bucket = bytecode_cache.get_bucket(environment, get_bytecode_name(name, enable_async), None, source)
+        if bucket.code is None:
+            bucket.code = environment.compile(source)
+            bytecode_cache.set_bucket(bucket)
+        template = environment.template_class.from_code(environment, bucket.code, environment.make_globals(None))
+
+    with _lock:
+        if template.environment is _environments.get(enable_async):
+            _templates[key] = template
+            _templates.move_to_end(key)
+            while len(_templates) > _template_cache_size:
+                _templates.popitem(last=False)
+    return template
+
+def discard_template(source: str) -> None:
+    """
+    Removes the compiled template of a source from the in-memory cache, e.g. when its config is unloaded.
+
+    :param source: Template source without macros.
+    :type source: str
+    """
+    digest = sha256(source.encode("utf-8")).hexdigest()
+    with _lock:
+        _templates.pop((False, digest), None)
+        _templates.pop((True, digest), None)
+
+def template_cache_info() -> dict:
+    """
+    Returns the number of cached templates and the maximum.
+
+    :rtype: dict
+    """
+    with _lock:
+        return {"size": len(_templates), "maxsize": _template_cache_size}
@@ -14,10 +14,9 @@
 
 import click
 from click import Option, Choice
-import os
-import platformdirs
-import json
-from os.path import isfile
+
+from installation_instruction.defaults import _get_user_defaults
+from installation_instruction.schema_model import SchemaModel
 
 SCHEMA_TO_CLICK_TYPE_MAPPING = {
     "string": click.STRING,
@@ -26,52 +25,44 @@ SCHEMA_TO_CLICK_TYPE_MAPPING = {
     "boolean": click.BOOL,
 }
 
-def _get_flags_and_options(schema: dict, misc: dict = None, inst: bool = False) -> list[Option]:
+def _get_flags_and_options(schema: "dict | SchemaModel", misc: dict = None, inst: bool = False) -> list[Option]:
     """
     Generates Click flags and options from a JSON schema.
+    Enum entries merged from `enum`, `const`, `anyOf` and `oneOf` become choices.
 
-    :param schema: Schema which contains the options.
-    :param misc: Additional descriptions and pretty print names nested.
-    :type schema: dict
+    :param schema: Schema which contains the options, or its model, e.g. `InstallationInstruction.schema_model`.
+    :param misc: Additional descriptions and pretty print names nested. Only used if a schema dict is given.
+    :type schema: dict or SchemaModel
     :return: List of all the clickoptions from the schema.
     :rtype: list[Option]
     """
+    if not isinstance(schema, SchemaModel):
+        schema = SchemaModel.from_schema(schema, misc)
+
     options = []
     alt_default = {}
-    required_args = set(schema.get('required', []))
-
-    description = misc.get("description", {}) if misc is not None else {}
 
     change_default = False
     if inst:
-        project_title = schema.get("$id")
-        user_data_dir = platformdirs.user_data_dir("default_data_local","installation_instruction")
-        PATH_TO_DEFAULT_FILE = os.path.join(user_data_dir, "DEFAULT_DATA.json")
-        default_data = {}
-        if isfile(PATH_TO_DEFAULT_FILE):
-            with open(PATH_TO_DEFAULT_FILE,"r") as f:
-                default_data = json.load(f)
-        if project_title in default_data.keys():
-            default_data = default_data.get(project_title)
-            change_default = True
+        default_data = _get_user_defaults(schema.id or None)
+        change_default = bool(default_data)
 
 
-    for key, value in schema.get('properties', {}).items():
+    for key, property in schema.properties.items():
         pretty_key = key
         pretty_key = pretty_key.replace('_', '-').replace(' ', '-')
         option_name = '--{}'.format(pretty_key)
-        option_type = value.get('type', 'string')
-        option_description = value.get('description', '') or description.get(key, "")
+        option_description = property.description
         if change_default and key in default_data.keys():
             option_default = default_data.get(key)
         else:
-            option_default = value.get('default', None)
-        if "enum" in value:
-            option_type = Choice( value["enum"] )
+            option_default = property.default
+        if property.enum is not None:
+            option_type = Choice( [entry.key for entry in property.enum] )
         else:
-            option_type = SCHEMA_TO_CLICK_TYPE_MAPPING.get(option_type, click.STRING)
+            option_type = SCHEMA_TO_CLICK_TYPE_MAPPING.get(property.type, click.STRING)
 
-        required = (key in required_args) and option_default is None
+        required = property.required and option_default is None
         is_flag=(option_type == click.BOOL)
         if is_flag and required:
             option_name = option_name + "/--no-{}".format(pretty_key)
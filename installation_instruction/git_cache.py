@@ -0,0 +1,191 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Persistent cache of bare git mirrors.
+
+Instead of cloning a repository for every cli call, a partial (`--filter=blob:none`), shallow and single branch
+bare clone is kept in the user cache dir. Only `HEAD` is fetched, other refs like pull requests are not.
+Only the blob of `install.cfg` is fetched and written to a checkout directory per commit, so concurrent `ibi`
+processes can share one mirror. Checkouts of earlier commits are removed once they are older than `checkout_max_age`,
+so a process still reading a checkout it was handed does not lose it.
+"""
+
+from hashlib import sha256
+import os
+import shutil
+import time
+
+import git
+
+from installation_instruction.cache import _get_default_cache_dir
+from installation_instruction.helpers import CONFIG_FILE_NAME, _file_lock
+
+
+DEFAULT_GIT_CACHE_TTL = 5 * 60
+DEFAULT_CHECKOUT_MAX_AGE = 60 * 60
+
+FETCH_MARKER_FILE = "ibi-fetched"
+
+
+class GitMirrorCache:
+    """
+    Cache of bare git mirrors with a checkout of only the config file.
+    """
+
+    def __init__(self, directory: str | None = None, ttl: float = DEFAULT_GIT_CACHE_TTL, offline: bool = False, checkout_max_age: float = DEFAULT_CHECKOUT_MAX_AGE) -> None:
+        """
+        :param directory: Cache directory. Defaults to a directory in the user cache dir.
+        :type directory: str or None
+        :param ttl: Seconds after which a mirror is considered stale and fetched again.
+        :type ttl: float
+        :param offline: Never fetch, only use mirrors which are already cached.
+        :type offline: bool
+        :param checkout_max_age: Seconds after which checkouts of earlier commits are removed.
+        :type checkout_max_age: float
+        """
+        if directory is None:
+            directory = _get_default_cache_dir("git")
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        self.checkout_max_age = checkout_max_age
+        self.fetches = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url: str) -> tuple[str, str, str]:
+        name = sha256(url.encode("utf-8")).hexdigest()[:32]
+        return (
+            os.path.join(self.directory, name + ".git"),
+            os.path.join(self.directory, name + ".checkouts"),
+            os.path.join(self.directory, name + ".lock"),
+        )
+
+    def _is_stale(self, mirror_dir: str) -> bool:
+        try:
+            fetched = os.path.getmtime(os.path.join(mirror_dir, FETCH_MARKER_FILE))
+        except OSError:
+            return True
+        return time.time() - fetched >= self.ttl
+
+    def _mark_fetched(self, mirror_dir: str) -> None:
+        with open(os.path.join(mirror_dir, FETCH_MARKER_FILE), "w"):
+            pass
+        self.fetches += 1
+
+    def get_mirror(self, url: str) -> git.Repo:
+        """
+        Returns the bare mirror of a repository. Clones it if it is not cached and fetches it if it is stale.
+
+        :param url: URL of the remote git repository.
+        :type url: str
+        :raise Exception: If the repository is not cached in offline mode.
+        :return: Bare repository.
+        :rtype: git.Repo
+        """
+        (mirror_dir, _checkout_dir, lock_path) = self._paths(url)
+        with _file_lock(lock_path):
+            return self._get_mirror(url, mirror_dir)
+
+    def _get_mirror(self, url: str, mirror_dir: str) -> git.Repo:
+        if not os.path.isdir(mirror_dir):
+            if self.offline:
+                raise Exception(f"{url} is not cached and offline mode is active.")
+            tmp_dir = f"{mirror_dir}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            repo = git.Repo.clone_from(url, tmp_dir, multi_options=["--bare", "--single-branch", "--filter=blob:none", "--depth=1"])
+            repo.close()
+            os.replace(tmp_dir, mirror_dir)
+            self._mark_fetched(mirror_dir)
+            return git.Repo(mirror_dir)
+
+        repo = git.Repo(mirror_dir)
+        if not self.offline and self._is_stale(mirror_dir):
+            repo.git.fetch("--filter=blob:none", "--depth=1", "origin", "HEAD")
+            repo.git.update_ref("HEAD", "FETCH_HEAD")
+            self._mark_fetched(mirror_dir)
+        return repo
+
+    def get_checkout(self, url: str) -> str:
+        """
+        Returns a directory holding only the config file of the current `HEAD` of the repository.
+        The directory is specific to the commit, so it is never changed after it was written.
+
+        :param url: URL of the remote git repository.
+        :type url: str
+        :raise Exception: If the repository is not cached in offline mode.
+        :return: Path to the directory. It does not contain a config file if the repository has none.
+        :rtype: str
+        """
+        (mirror_dir, checkout_root, lock_path) = self._paths(url)
+        with _file_lock(lock_path):
+            repo = self._get_mirror(url, mirror_dir)
+            commit = repo.git.rev_parse("HEAD")
+            checkout_dir = os.path.join(checkout_root, commit)
+            if not os.path.isdir(checkout_dir):
+                tmp_dir = f"{checkout_dir}.{os.getpid()}.tmp"
+                os.makedirs(tmp_dir, exist_ok=True)
+                try:
+                    config = repo.git.cat_file("-p", f"{commit}:{CONFIG_FILE_NAME}", stdout_as_string=False, strip_newline_in_stdout=False)
+                except git.GitCommandError:
+                    config = None
+                if config is not None:
+                    with open(os.path.join(tmp_dir, CONFIG_FILE_NAME), "wb") as file:
+                        file.write(config)
+                os.replace(tmp_dir, checkout_dir)
+                self._remove_old_checkouts(checkout_root, commit)
+            repo.close()
+        return checkout_dir
+
+    def _remove_old_checkouts(self, checkout_root: str, commit: str) -> None:
+        """
+        Removes checkouts of other commits older than `checkout_max_age`. Needs the lock.
+        """
+        now = time.time()
+        for old in os.listdir(checkout_root):
+            path = os.path.join(checkout_root, old)
+            try:
+                if old == commit or old.endswith(".tmp") or now - os.path.getmtime(path) < self.checkout_max_age:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+    def remove(self, url: str) -> None:
+        """
+        Removes the mirror and the checkouts of a repository.
+
+        :param url: URL of the remote git repository.
+        :type url: str
+        """
+        (mirror_dir, checkout_root, lock_path) = self._paths(url)
+        with _file_lock(lock_path):
+            shutil.rmtree(mirror_dir, ignore_errors=True)
+            shutil.rmtree(checkout_root, ignore_errors=True)
+
+
+_default_git_cache = None
+
+def _get_default_git_cache() -> GitMirrorCache:
+    """
+    Returns the process wide `GitMirrorCache` in the user cache directory.
+    TTL and offline mode can be set with the environment variables `IBI_GIT_CACHE_TTL` and `IBI_OFFLINE`.
+    """
+    global _default_git_cache
+    if _default_git_cache is None:
+        _default_git_cache = GitMirrorCache(
+            ttl=float(os.environ.get("IBI_GIT_CACHE_TTL", DEFAULT_GIT_CACHE_TTL)),
+            offline=os.environ.get("IBI_OFFLINE", "") not in ("", "0"),
+        )
+    return _default_git_cache
@@ -14,18 +14,27 @@
 # limitations under the License.
 
 from tempfile import TemporaryDirectory
+from contextlib import contextmanager
+import json
 import os.path
 from os.path import isfile, isdir
 import re
 
-from jinja2 import Template
-from jinja2.sandbox import SandboxedEnvironment
+from typing import Iterable, Iterator
 
 import click
-import git
+
+from installation_instruction.tracing import span
 
 CONFIG_FILE_NAME = "install.cfg"
-ALLOWED_GIT_URL_PREFIXES = ["http://", "https://", "git://", "ssh://", "ftp://", "ftps://"]
+DELIMITER = "------"
+
+STEP_MARKER = "#ibi-step "
+END_STEP_MARKER = "#ibi-end-step"
+
+_LINE_BREAK = re.compile("[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+_WHITESPACE = re.compile(r"\s{2,}")
+ALLOWED_GIT_URL_PREFIXES = ["http://", "https://", "git://", "ssh://", "ftp://", "ftps://", "file://"]
 
 def _red_echo(text: str):
     click.echo(click.style(text, fg="red"))
@@ -43,18 +52,36 @@ def _is_remote_git_repository(url: str) -> bool:
     """
     return any([url.startswith(prefix) for prefix in ALLOWED_GIT_URL_PREFIXES])
 
-def _clone_git_repo(url: str) -> TemporaryDirectory:
+@contextmanager
+def _file_lock(path: str):
     """
-    Clones a git repository to a temporary directory.
+    Context manager holding an exclusive lock on a lock file, which works across processes.
 
-    :param url: URL of the remote git repository.
-    :type url: str
-    :return: `TemporaryDirectory` object with git repo.
-    :rtype: tempfile.TemporaryDirectory
+    :param path: Path to the lock file. It is created if it does not exist.
+    :type path: str
     """
-    temp_dir = TemporaryDirectory()
-    git.Repo.clone_from(url, temp_dir.name, multi_options=["--depth=1"])
-    return temp_dir
+    with open(path, "a+b") as file:
+        if os.name == "nt":
+            import msvcrt
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
     
 def _config_file_is_in_folder(dir_path: str) -> str | None:
     """
@@ -70,38 +97,66 @@ def _config_file_is_in_folder(dir_path: str) -> str | None:
         return install_cfg_path
     return None
 
-def _get_install_config_file(path: str) -> tuple[TemporaryDirectory|None, str]:
+def _resolve_config_file(path: str) -> str:
     """
-    Checks wether path is a git url or a dir, finds the config file and asserts that said file is a file.
+    Returns the path of the config file of a git url, a dir or a file.
+    The config of a git url is fetched directly over http if possible, else it is read from a cached mirror of the repository.
+    Git urls are resolved once per process, later calls return the same path without fetching again.
 
     :param path: Url, path to dir or file.
     :type path: str
-    :return: Returns a tuple with a temporary dir needed for cloning a git repository (on distruction temporary dir is deleted), and the found config file path.
-    :rtype: tuple[TemporaryDirectory|None, str]
+    :raise Exception: If the repository can not be fetched or no config file is found.
+    :return: Path of the config file.
+    :rtype: str
     """
+    if (config_file := _resolved_config_files.get(path)) is not None:
+        return config_file
     config_file = path
-    temp_dir = None
+    is_git_repository = False
     if _is_remote_git_repository(config_file):
+        from installation_instruction.http_cache import _get_default_http_cache, DirectFetchUnavailable
         try:
-            temp_dir = _clone_git_repo(config_file)
-        except Exception as e:
-            _red_echo("Error (cloning git repository):\n\n" + str(e))
-            exit(1)
-        config_file = temp_dir.name
+            with span("fetch", url=config_file, method="http"):
+                config_file = _get_default_http_cache().get(config_file)
+        except DirectFetchUnavailable:
+            from installation_instruction.git_cache import _get_default_git_cache
+            try:
+                with span("fetch", url=config_file, method="git"):
+                    config_file = _get_default_git_cache().get_checkout(config_file)
+            except Exception as e:
+                raise Exception("Error (fetching git repository):\n\n" + str(e))
+            is_git_repository = True
     if isdir(config_file):
-        if path := _config_file_is_in_folder(config_file):
-            config_file = path
+        if found := _config_file_is_in_folder(config_file):
+            config_file = found
+        elif is_git_repository:
+            raise Exception("Config file not found in repository.")
         else:
-            if temp_dir is not None:
-                _red_echo("Config file not found in repository.")
-            else:
-                _red_echo(f"Config file not found in folder {config_file}")
-            exit(1)
+            raise Exception(f"Config file not found in folder {config_file}")
     if not isfile(config_file):
-        _red_echo(f"{config_file} is not a file.")
-        exit(1)
+        raise Exception(f"{config_file} is not a file.")
+
+    if _is_remote_git_repository(path):
+        _resolved_config_files[path] = config_file
+    return config_file
+
+_resolved_config_files = {}
 
-    return (temp_dir, config_file)
+def _get_install_config_file(path: str) -> tuple[TemporaryDirectory|None, str]:
+    """
+    Checks wether path is a git url or a dir, finds the config file and asserts that said file is a file.
+    Prints the error and exits if no config file is found, see `_resolve_config_file`.
+
+    :param path: Url, path to dir or file.
+    :type path: str
+    :return: Returns a tuple with a temporary dir (always None, git repositories are cached in the user cache dir), and the found config file path.
+    :rtype: tuple[TemporaryDirectory|None, str]
+    """
+    try:
+        return (None, _resolve_config_file(path))
+    except Exception as e:
+        _red_echo(str(e))
+        exit(1)
 
 def _get_error_message_from_string(string: str) -> str | None:
     """
@@ -118,6 +173,43 @@ def _get_error_message_from_string(string: str) -> str | None:
         return None
     return matches.group("errmsg")
 
+def _iter_normalized_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Joins chunks of text and yields each line as soon as it is complete, stripped and with runs of whitespace replaced by a single whitespace.
+    Empty lines are skipped. Lines are split like `str.splitlines`.
+
+    :param chunks: Chunks of text, e.g. from `jinja2.Template.generate`.
+    :type chunks: Iterable[str]
+    :return: Iterator over the normalized lines.
+    :rtype: Iterator[str]
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if _LINE_BREAK.search(chunk) is None:
+            continue
+        lines = buffer.splitlines(keepends=True)
+        buffer = lines.pop() if lines[-1].splitlines()[0] == lines[-1] else ""
+        for line in lines:
+            if line := line.strip():
+                yield _WHITESPACE.sub(" ", line)
+    if buffer := buffer.strip():
+        yield _WHITESPACE.sub(" ", buffer)
+
+def _is_step_marker(line: str) -> bool:
+    return line.startswith(STEP_MARKER) or line == END_STEP_MARKER
+
+def _strip_step_markers(lines: Iterable[str]) -> list[str]:
+    """
+    Returns rendered instructions without the marker lines of the `step` macro, which only the install runner uses.
+
+    :param lines: Rendered instructions.
+    :type lines: Iterable[str]
+    :return: Instructions without markers.
+    :rtype: list[str]
+    """
+    return [line for line in lines if not _is_step_marker(line)]
+
 def _replace_whitespace_in_string_and_split_it(string: str) -> list[str]:
     """
     Replaces eol whitespaces of a string with a single whitespace or none.
@@ -127,17 +219,12 @@ def _replace_whitespace_in_string_and_split_it(string: str) -> list[str]:
     :return: String where whitespace is replaced with one whitespace and whitspace before and after are stripped.
     :rtype: str
     """
-    multiline_string = str.splitlines(string)
-    string_list = []
-    for s in multiline_string:
-        s = s.strip()
-        if s:
-            string_list += [re.sub(r"\s{2,}", " ", s, 0)]
-    return string_list
+    return list(_iter_normalized_lines([string]))
 
 def _split_string_at_delimiter(string: str) -> tuple[str, str]:
     """
     Extracts part before and after the delimiter "------" or more.
+    The string is only scanned up to the first delimiter, surrounding whitespace of both parts is stripped.
 
     :param string: The string with a delimiter.
     :type string: str
@@ -145,26 +232,41 @@ def _split_string_at_delimiter(string: str) -> tuple[str, str]:
     :return: Returns a tuple with the part before and after the delimiter.
     :rtype: tuple[str, str]
     """
-    reg = re.compile(r"^\s*(?P<schema>.*?)\s*\-{6,}\s*(?P<template>.*?)\s*$", re.S)
-    matches = reg.search(string)
-    if matches is None:
+    start = string.find(DELIMITER)
+    if start == -1:
         raise Exception("No delimiter (------) found.")
+    end = start + len(DELIMITER)
+    while end < len(string) and string[end] == "-":
+        end += 1
     return (
-                matches.group("schema"),
-                matches.group("template")
+                string[:start].strip(),
+                string[end:].strip()
             )
 
-def _load_template_from_string(string: str) -> Template:
+def _get_yaml_loader() -> type:
     """
-    Returns `jinja2.Template`.
+    Returns the yaml loader for schemas, the libyaml based `CSafeLoader` if pyyaml was built with it, else `SafeLoader`.
+    """
+    import yaml
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-    :param string: String to be processed.
+def _parse_header(string: str) -> dict:
+    """
+    Parses the schema part of a config. Json is parsed with `json.loads`, everything else or json with errors as yaml.
+
+    :param string: Schema part of a config.
     :type string: str
-    :return: jinja2 Template object.
-    :rtype: jinja2.Template
-    """
-    env = SandboxedEnvironment(
-        trim_blocks=True,
-        lstrip_blocks=True
-    )
-    return env.from_string(string)
\ No newline at end of file
+    :raise Exception: If string is neither valid json nor valid yaml.
+    :return: Parsed schema.
+    :rtype: dict
+    """
+    if string.startswith("{"):
+        try:
+            return json.loads(string)
+        except ValueError:
+            pass
+    import yaml
+    try:
+        return yaml.load(string, Loader=_get_yaml_loader())
+    except yaml.YAMLError:
+        raise Exception("Schema is neither a valid json nor a valid yaml.")
@@ -0,0 +1,287 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Persistent cache of config files fetched directly over HTTP, without cloning their repository.
+
+Repository URLs of GitHub and GitLab are mapped to the raw URL of their `install.cfg`, http(s) URLs ending in `install.cfg` are fetched as they are.
+A cached config is used without a request within the TTL, afterwards it is revalidated with `If-None-Match` and `If-Modified-Since`.
+Connections are kept alive and reused from a pool, so fetching many configs from one host needs only a few connections.
+If a config cannot be fetched directly, `DirectFetchUnavailable` is raised and the caller falls back to the git mirror cache.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from threading import Lock
+from urllib.parse import urlsplit, urljoin
+import http.client
+import json
+import os
+import re
+import ssl
+import time
+
+from installation_instruction.cache import _get_default_cache_dir
+from installation_instruction.helpers import CONFIG_FILE_NAME, _file_lock
+
+
+DEFAULT_HTTP_CACHE_TTL = 5 * 60
+DEFAULT_TIMEOUT = 10.0
+MAX_IDLE_CONNECTIONS = 4
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+META_FILE_NAME = "meta.json"
+
+_GITHUB = re.compile(r"^https://github\.com/(?P<owner>[^/]+)/(?P<repo>[^/]+?)(\.git)?/?$")
+_GITLAB = re.compile(r"^https://gitlab\.com/(?P<path>[^/?#]+(/[^/?#]+)+)/?$")
+
+
+class DirectFetchUnavailable(Exception):
+    """
+    The config of a URL can not be fetched directly, it has to be read from a clone of the repository.
+    """
+
+
+def _get_config_url(url: str) -> str | None:
+    """
+    Returns the URL of the raw config file of a repository URL, or None if it is not known how to fetch it directly.
+
+    :param url: URL of a repository or of a config file.
+    :type url: str
+    :return: URL of the config file or None.
+    :rtype: str or None
+    """
+    if url.startswith(("http://", "https://")) and urlsplit(url).path.endswith("/" + CONFIG_FILE_NAME):
+        return url
+    if match := _GITHUB.match(url):
+        return f"https://raw.githubusercontent.com/{match['owner']}/{match['repo']}/HEAD/{CONFIG_FILE_NAME}"
+    if (match := _GITLAB.match(url)) and "/-/" not in url:
+        return f"https://gitlab.com/{match['path'].removesuffix('.git')}/-/raw/HEAD/{CONFIG_FILE_NAME}"
+    return None
+
+
+class _ConnectionPool:
+    """
+    Thread safe pool of keep-alive `http.client` connections per scheme, host and port.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, max_idle: int = MAX_IDLE_CONNECTIONS) -> None:
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = Lock()
+        self._ssl_context = None
+        self.connections = 0
+        self.requests = 0
+
+    def _acquire(self, key: tuple[str, str, int]) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if idle := self._idle.get(key):
+                return (idle.pop(), True)
+            self.connections += 1
+        (scheme, host, port) = key
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            return (http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context), False)
+        return (http.client.HTTPConnection(host, port, timeout=self.timeout), False)
+
+    def _release(self, key: tuple[str, str, int], connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, url: str, headers: dict) -> tuple[int, dict, bytes]:
+        """
+        Sends a GET request. A request on a reused connection which was closed by the server is retried on another connection.
+
+        :param url: Absolute http(s) URL.
+        :type url: str
+        :param headers: Request headers.
+        :type headers: dict
+        :raise OSError: If the server can not be reached.
+        :raise http.client.HTTPException: If the response is invalid.
+        :return: Status, response headers with lower case names and body.
+        :rtype: tuple[int, dict, bytes]
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        while True:
+            (connection, reused) = self._acquire(key)
+            try:
+                connection.request("GET", target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            with self._lock:
+                self.requests += 1
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+            return (response.status, {name.lower(): value for (name, value) in response.getheaders()}, body)
+
+    def close(self) -> None:
+        with self._lock:
+            for idle in self._idle.values():
+                for connection in idle:
+                    connection.close()
+            self._idle.clear()
+
+
+class HttpConfigCache:
+    """
+    Cache of config files fetched over HTTP, revalidated with their `ETag` and `Last-Modified` headers.
+    """
+
+    def __init__(self, directory: str | None = None, ttl: float = DEFAULT_HTTP_CACHE_TTL, offline: bool = False, timeout: float = DEFAULT_TIMEOUT) -> None:
+        """
+        :param directory: Cache directory. Defaults to a directory in the user cache dir.
+        :type directory: str or None
+        :param ttl: Seconds after which a config is revalidated.
+        :type ttl: float
+        :param offline: Never send requests, only use configs which are already cached.
+        :type offline: bool
+        :param timeout: Timeout of connections in seconds.
+        :type timeout: float
+        """
+        if directory is None:
+            directory = _get_default_cache_dir("http")
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        self.pool = _ConnectionPool(timeout)
+        self.fetches = 0
+        self.revalidations = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        name = sha256(url.encode("utf-8")).hexdigest()[:32]
+        return (os.path.join(self.directory, name), os.path.join(self.directory, name + ".lock"))
+
+    def _request(self, url: str, headers: dict) -> tuple[int, dict, bytes]:
+        for _ in range(MAX_REDIRECTS + 1):
+            (status, response_headers, body) = self.pool.request(url, headers)
+            if status not in REDIRECT_STATUSES or "location" not in response_headers:
+                return (status, response_headers, body)
+            url = urljoin(url, response_headers["location"])
+        raise DirectFetchUnavailable(f"Too many redirects fetching {url}.")
+
+    def get(self, url: str) -> str:
+        """
+        Returns the path of the cached config of a repository or config URL, fetching or revalidating it if needed.
+        If the server can not be reached, an already cached config is used.
+
+        :param url: URL of a repository or of a config file.
+        :type url: str
+        :raise DirectFetchUnavailable: If the config can not be fetched directly, e.g. because the URL is not known,
+            the server answered with an error or it is not cached in offline mode.
+        :return: Path to the config file.
+        :rtype: str
+        """
+        config_url = _get_config_url(url)
+        if config_url is None:
+            raise DirectFetchUnavailable(f"{url} can not be fetched directly.")
+        (entry_dir, lock_path) = self._paths(config_url)
+        config_path = os.path.join(entry_dir, CONFIG_FILE_NAME)
+        meta_path = os.path.join(entry_dir, META_FILE_NAME)
+
+        with _file_lock(lock_path):
+            meta = None
+            if os.path.isfile(config_path):
+                try:
+                    with open(meta_path, "r") as file:
+                        meta = json.load(file)
+                except (OSError, ValueError):
+                    meta = {}
+            if meta is not None and (self.offline or time.time() - meta.get("fetched", 0) < self.ttl):
+                return config_path
+            if self.offline:
+                raise DirectFetchUnavailable(f"{url} is not cached and offline mode is active.")
+
+            headers = {"User-Agent": "installation-instruction"}
+            if meta is not None and "etag" in meta:
+                headers["If-None-Match"] = meta["etag"]
+            if meta is not None and "last-modified" in meta:
+                headers["If-Modified-Since"] = meta["last-modified"]
+            try:
+                (status, response_headers, body) = self._request(config_url, headers)
+            except (OSError, http.client.HTTPException) as e:
+                if meta is not None:
+                    return config_path
+                raise DirectFetchUnavailable(f"Fetching {config_url} failed: {e}")
+
+            if status == 304 and meta is not None:
+                self.revalidations += 1
+            elif status == 200:
+                self.fetches += 1
+                os.makedirs(entry_dir, exist_ok=True)
+                tmp_path = f"{config_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as file:
+                    file.write(body)
+                os.replace(tmp_path, config_path)
+                meta = {key: response_headers[key] for key in ("etag", "last-modified") if key in response_headers}
+            else:
+                raise DirectFetchUnavailable(f"Fetching {config_url} failed with status {status}.")
+
+            meta["url"] = config_url
+            meta["fetched"] = time.time()
+            tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(meta, file)
+            os.replace(tmp_path, meta_path)
+        return config_path
+
+    def get_many(self, urls: list[str], workers: int = 8) -> dict[str, str | Exception]:
+        """
+        Fetches many configs concurrently over the shared connection pool.
+
+        :param urls: URLs of repositories or config files.
+        :type urls: list[str]
+        :param workers: Number of concurrent requests.
+        :type workers: int
+        :return: URLs mapped to the path of their config, or the exception raised fetching it.
+        :rtype: dict[str, str or Exception]
+        """
+        def get(url: str) -> str | Exception:
+            try:
+                return self.get(url)
+            except Exception as e:
+                return e
+        with ThreadPoolExecutor(workers) as executor:
+            return dict(zip(urls, executor.map(get, urls)))
+
+
+_default_http_cache = None
+
+def _get_default_http_cache() -> HttpConfigCache:
+    """
+    Returns the process wide `HttpConfigCache` in the user cache directory.
+    TTL and offline mode are the ones of the git mirror cache, set with `IBI_GIT_CACHE_TTL` and `IBI_OFFLINE`.
+    """
+    global _default_http_cache
+    if _default_http_cache is None:
+        _default_http_cache = HttpConfigCache(
+            ttl=float(os.environ.get("IBI_GIT_CACHE_TTL", DEFAULT_HTTP_CACHE_TTL)),
+            offline=os.environ.get("IBI_OFFLINE", "") not in ("", "0"),
+        )
+    return _default_http_cache
@@ -13,39 +13,53 @@
 # limitations under the License.
 
 
-from yaml import safe_load
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from weakref import WeakKeyDictionary
+from itertools import islice
+from time import perf_counter
+from typing import Iterable, Iterator
+import asyncio
 import json
-from jsonschema import validate, Draft202012Validator, exceptions
-from jinja2.exceptions import UndefinedError
+import os
+from jsonschema import Draft202012Validator, exceptions
 
 import installation_instruction.helpers as helpers
+from installation_instruction.tracing import span, iter_span
+from installation_instruction.validator import compile_validator
+from installation_instruction.environment import MACROS, RAISE_JINJA_MACRO_STRING, COMMAND_JINJA_MACRO_STRING, STEP_JINJA_MACRO_STRING
 
 
-RAISE_JINJA_MACRO_STRING = """
-{% macro raise(error) %}
-    {{ None['[ERROR] ' ~ error][0] }}
-{% endmacro %}
-"""
-
-COMMAND_JINJA_MACRO_STRING = """
-{% macro command() %}
-    {% filter replace("\n", " ") %}
-        {{ caller() }}
-    {% endfilter %} 
-{% endmacro %}
-"""
-
-MACROS = [
-    RAISE_JINJA_MACRO_STRING,
-    COMMAND_JINJA_MACRO_STRING,
-]
+DEFAULT_RENDER_CONCURRENCY = 4
+# Seconds `validate_and_render_async` renders before it lets other tasks run.
+RENDER_TIME_SLICE = 0.001
 
 
 class InstallationInstruction:
     """
     Class holding schema and template for validating and rendering installation instruction.
+    The template is compiled on the first render, so only reading the schema does not need jinja.
+
+    Set `render_cache` to an `installation_instruction.cache.RenderCache` to memoize rendering.
+    `render_concurrency` limits how many `validate_and_render_async` calls of an instruction render at once per event loop.
     """
 
+    def validate(self, input: dict) -> list[exceptions.ValidationError]:
+        """
+        Validates user input against schema and returns all errors at once.
+        The schema is compiled into a validation function on first use.
+
+        :param input: Enduser input.
+        :ptype input: dict
+        :return: List of validation errors, empty if input is valid.
+        :rtype: list[jsonschema.exceptions.ValidationError]
+        """
+        if self._validator is None:
+            with span("compile-validator"):
+                self._validator = compile_validator(self.schema)
+        with span("validate"):
+            return self._validator(input)
+
     def validate_and_render(self, input: dict) -> tuple[list[str], bool]:
         """
         Validates user input against schema and renders with the template.
@@ -58,102 +72,428 @@ class InstallationInstruction:
         :rtpye: (str, bool)
         :raise Exception: If schema or user input is invalid.
         """
-        validate(input, self.schema)
+        (instructions, is_error) = self._validate_and_render_with_step_markers(input)
+        return (helpers._strip_step_markers(instructions), is_error)
+
+    def _validate_and_render_with_step_markers(self, input: dict) -> tuple[list[str], bool]:
+        """
+        Like `validate_and_render`, but keeps the marker lines of the `step` macro for the install runner.
+        """
+        if errors := self.validate(input):
+            raise exceptions.best_match(errors)
+        return self._render_memoized(input)
+
+    async def validate_and_render_async(self, input: dict) -> tuple[list[str], bool]:
+        """
+        Async counterpart of `validate_and_render` for event loops, the template is rendered with `Template.generate_async`.
+
+        Compiling the validator and the template on first use runs in a thread.
+        Validation runs in the event loop, it is compiled into plain python and takes microseconds.
+        While rendering, other tasks run every `RENDER_TIME_SLICE` seconds, so large templates do not block the loop.
+        At most `render_concurrency` calls render at once, the others wait.
+
+        :param input: Enduser input.
+        :ptype input: dict
+        :return: Returns instructions as string and False. Or Error and True.
+        :rtpye: (str, bool)
+        :raise Exception: If schema or user input is invalid.
+        """
+        if self._validator is None:
+            self._validator = await asyncio.to_thread(compile_validator, self.schema)
+        if errors := self.validate(input):
+            raise exceptions.best_match(errors)
+
+        async with self._get_render_semaphore():
+            if self.render_cache is None:
+                (instructions, is_error) = await self._render_async(input)
+            else:
+                input_key = self._memoization_key(input)
+                if (result := self.render_cache.get(self.config_key, input_key)) is None:
+                    result = await self._render_async(input)
+                    self.render_cache.set(self.config_key, input_key, result)
+                (instructions, is_error) = result
+        return (helpers._strip_step_markers(instructions), is_error)
+
+    def _get_render_semaphore(self) -> asyncio.Semaphore:
+        """
+        Returns the semaphore limiting concurrent async renders in the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if (semaphore := self._render_semaphores.get(loop)) is None:
+            semaphore = self._render_semaphores[loop] = asyncio.Semaphore(self.render_concurrency)
+        return semaphore
+
+    async def _render_async(self, input: dict) -> tuple[list[str], bool]:
+        """
+        Renders already validated user input with the async template.
+        """
+        if self._async_template is None:
+            self._async_template = await asyncio.to_thread(self._load_template, True)
+        from jinja2.exceptions import UndefinedError
+        chunks = []
+        with span("render", mode="async"):
+            try:
+                deadline = perf_counter() + RENDER_TIME_SLICE
+                async for chunk in self._async_template.generate_async(input):
+                    chunks.append(chunk)
+                    if perf_counter() > deadline:
+                        await asyncio.sleep(0)
+                        deadline = perf_counter() + RENDER_TIME_SLICE
+            except UndefinedError as e:
+                if errmsg := helpers._get_error_message_from_string(str(e)):
+                    return ([errmsg], True)
+                else:
+                    raise e
+            return (helpers._replace_whitespace_in_string_and_split_it("".join(chunks)), False)
+
+    def iter_render(self, input: dict) -> Iterator[str]:
+        """
+        Validates user input against schema and yields the installation instructions line by line while the template is rendered.
+        The lines are the same as the instructions of `validate_and_render`.
+
+        If jinja macro `raise` is called an exception with the error message is raised, possibly after some lines were yielded.
+
+        :param input: Enduser input.
+        :ptype input: dict
+        :return: Iterator over the instructions.
+        :rtype: Iterator[str]
+        :raise Exception: If user input is invalid or the template raises an error.
+        """
+        for line in self._iter_render_with_step_markers(input):
+            if not helpers._is_step_marker(line):
+                yield line
+
+    def _iter_render_with_step_markers(self, input: dict) -> Iterator[str]:
+        """
+        Like `iter_render`, but keeps the marker lines of the `step` macro for the install runner.
+        """
+        if errors := self.validate(input):
+            raise exceptions.best_match(errors)
+        if self.render_cache is not None:
+            (instructions, is_error) = self._render_memoized(input)
+            if is_error:
+                raise Exception("\n".join(instructions))
+            yield from instructions
+            return
+
+        from jinja2.exceptions import UndefinedError
         try:
-            instruction = self.template.render(input)
+            yield from iter_span("render", helpers._iter_normalized_lines(self.template.generate(input)))
         except UndefinedError as e:
             if errmsg := helpers._get_error_message_from_string(str(e)):
-                return ([errmsg], True)
+                raise Exception(errmsg)
             else:
                 raise e
+
+    @property
+    def config_key(self) -> str:
+        """
+        Hash of the config string and the library version, see `ConfigCache.key`.
+        """
+        if self._config_key is None:
+            from installation_instruction.cache import ConfigCache
+            self._config_key = ConfigCache.key(self._config)
+        return self._config_key
+
+    def _memoization_key(self, input: dict) -> str:
+        """
+        Returns user input as sorted json, without properties that do not influence the output.
+        Defaults are not filled in, as the template can tell missing properties from given ones.
+        """
+        properties = self.dependencies()["properties"]
+        input = {key: value for (key, value) in input.items() if key not in properties or properties[key]["influences_output"]}
+        return json.dumps(input, sort_keys=True, separators=(",", ":"))
+
+    def _render_memoized(self, input: dict) -> tuple[list[str], bool]:
+        """
+        Renders already validated user input, using `render_cache` if it is set.
+        The input is rendered as it was given, so memoized results equal unmemoized ones.
+        """
+        if self.render_cache is None:
+            return self._render(input)
+        input_key = self._memoization_key(input)
+        if (result := self.render_cache.get(self.config_key, input_key)) is not None:
+            return result
+        result = self._render(input)
+        self.render_cache.set(self.config_key, input_key, result)
+        return result
+
+    def dependencies(self) -> dict:
+        """
+        Returns which schema properties influence the rendered instructions, see `installation_instruction.analysis.analyze_dependencies`.
+        Properties which do not influence the output are left out of memoization keys.
+
+        :return: Dict with `properties`, mapping each property to `referenced`, `in_output`, `in_condition`
+            and `influences_output`, `undeclared`, a list of names the template references but the schema does not declare,
+            and `raises`, whether the template references the `raise` macro.
+        :rtype: dict
+        """
+        if self._dependencies is None:
+            from installation_instruction.analysis import analyze_dependencies
+            from installation_instruction.environment import get_environment
+            self._dependencies = analyze_dependencies(get_environment(), self._template_source, self.schema)
+        return self._dependencies
+
+    def valid_choices(self, partial: dict) -> dict[str, list]:
+        """
+        Returns for each enum and boolean property not set in `partial` the values which are valid against the schema
+        and do not make the template raise, e.g. to disable choices in a user interface. See `installation_instruction.choices.ChoiceTable`.
+
+        The table of valid combinations is built on first use by rendering every combination of the properties which influence the output.
+        It is stored in the config cache if one is used and its values can be written as json, e.g. not for YAML dates.
+
+        :param partial: Partial enduser input.
+        :ptype partial: dict
+        :return: Property keys mapped to their valid values.
+        :rtype: dict[str, list]
+        :raise Exception: If a value of `partial` is not a value of its property.
+        """
+        if self._choice_table is None:
+            from installation_instruction.cache import CHOICES_SUFFIX
+            from installation_instruction.choices import ChoiceTable
+            data = self._cache.get_artifact(self.config_key, CHOICES_SUFFIX) if self._cache is not None else None
+            if data is not None:
+                self._choice_table = ChoiceTable.from_json(data)
+            else:
+                self._choice_table = ChoiceTable.from_instruction(self)
+                if self._cache is not None:
+                    try:
+                        data = self._choice_table.to_json()
+                    except (TypeError, ValueError):
+                        data = None
+                    if data is not None:
+                        self._cache.set_artifact(self.config_key, CHOICES_SUFFIX, data.encode("utf-8"))
+        return self._choice_table.valid_choices(partial)
+
+    def invalidate_render_cache(self) -> None:
+        """
+        Removes all results of this config from `render_cache`.
+        """
+        if self.render_cache is not None:
+            self.render_cache.invalidate(self.config_key)
+
+    def _render(self, input: dict) -> tuple[list[str], bool]:
+        """
+        Renders already validated user input with the template.
+
+        :param input: Enduser input.
+        :ptype input: dict
+        :return: Returns instructions as string and False. Or Error and True.
+        :rtpye: (str, bool)
+        """
+        from jinja2.exceptions import UndefinedError
+        template = self.template
+        with span("render"):
+            try:
+                instruction = template.render(input)
+            except UndefinedError as e:
+                if errmsg := helpers._get_error_message_from_string(str(e)):
+                    return ([errmsg], True)
+                else:
+                    raise e
         
-        instruction = helpers._replace_whitespace_in_string_and_split_it(instruction)
+            instruction = helpers._replace_whitespace_in_string_and_split_it(instruction)
 
         return (instruction, False)
+
+    def _validate_and_render_without_raising(self, input: dict) -> tuple[list[str], bool]:
+        """
+        Like `validate_and_render`, but returns the messages of validation errors and True instead of raising.
+        """
+        if errors := self.validate(input):
+            return ([e.message for e in errors], True)
+        (instructions, is_error) = self._render_memoized(input)
+        return (helpers._strip_step_markers(instructions), is_error)
+
+    def render_many(self, inputs: Iterable[dict], workers: int | None = None, executor: Executor | None = None, chunksize: int = 64) -> Iterator[tuple[list[str], bool]]:
+        """
+        Validates and renders many user inputs. Yields a result per input in the same order as the inputs.
+        Inputs are consumed lazily, so arbitrarily long streams can be rendered with constant memory.
+
+        Other than `validate_and_render` invalid input does not raise, instead the messages of all validation errors and True are yielded.
+
+        With `workers` a process pool is created for rendering, the config is sent to each worker only once.
+        With `executor` an existing executor is used, each worker compiles the config only once.
+
+        :param inputs: Enduser inputs.
+        :ptype inputs: Iterable[dict]
+        :param workers: Number of worker processes.
+        :ptype workers: int or None
+        :param executor: Executor to render with.
+        :ptype executor: concurrent.futures.Executor or None
+        :param chunksize: Number of inputs sent to a worker at once.
+        :ptype chunksize: int
+        :return: Iterator over instructions and False. Or errors and True.
+        :rtype: Iterator[tuple[list[str], bool]]
+        """
+        if workers is None and executor is None:
+            for input in inputs:
+                yield self._validate_and_render_without_raising(input)
+            return
+
+        if executor is None:
+            with ProcessPoolExecutor(workers, initializer=_init_render_worker, initargs=(self._config,)) as executor:
+                yield from _render_with_executor(executor, None, inputs, chunksize, 2 * workers)
+        else:
+            yield from _render_with_executor(executor, self._config, inputs, chunksize, 2 * (os.cpu_count() or 1))
     
+    @property
+    def schema_model(self):
+        """
+        Immutable model of the schema properties, built on first access. See `installation_instruction.schema_model`.
+
+        :rtype: installation_instruction.schema_model.SchemaModel
+        """
+        if self._schema_model is None:
+            from installation_instruction.schema_model import SchemaModel
+            with span("schema-model"):
+                self._schema_model = SchemaModel.from_schema(self.schema, self.misc)
+        return self._schema_model
+
     def parse_schema(self) -> dict:
         """
         Parses schema into a dict.
 
-        This is only important for merging enum, anyOf and oneOf into one type.
+        This is only important for merging enum, const, anyOf and oneOf into one type.
+        Each call builds a new dict from the immutable `schema_model`, default values are shared with the model.
 
         :return: Schema as dict.
         :rtype: dict
         """
-        result = {}
-
-        result["$id"] = self.schema.get("$id","")
-        result["title"] = self.schema.get("title", "")
-        result["description"] = self.schema.get("description", "")
-        result["properties"] = {}
-
-        pretty = self.misc.get("pretty", {})
-        description = self.misc.get("description", {})
-
-        for key, value in self.schema.get('properties', {}).items():
-
-            result["properties"][key] = {
-                "title": value.get("title", "") or pretty.get(key, key),
-                "description": value.get("description", "") or description.get(key, ""),
-                "type": value.get("type", "string"),
-                "default": value.get("default", None),
-                "key": key,
-            }
-            if "enum" in value:
-                result["properties"][key]["enum"] = [
-                    {
-                        "title": pretty.get(e, e),
-                        "key": e,
-                        "description": description.get(e, ""),
-                    } for e in value["enum"]
-                ]
-                result["properties"][key]["type"] = "enum"
-                
-        return result
+        return self.schema_model.to_dict()
 
 
-    def __init__(self, config: str) -> None:
+    def __init__(self, config: str, cache = None) -> None:
         """
-        Returns `InstallationInstruction` from config string. This also adds raise macro to template.
+        Returns `InstallationInstruction` from config string.
 
         :param config: Config string with schema and template seperated by delimiter.
+        :param cache: Optional cache for parsed configs and compiled templates.
+        :type cache: installation_instruction.cache.ConfigCache or None
         :raise Exception: If schema part of config is neither valid json nor valid yaml.
         :raise Exception: If no delimiter is found.
         """
-        (schema_str, template) = helpers._split_string_at_delimiter(config)
-        try:
-            schema = json.load(schema_str)
-        except:
-            try:
-                schema = safe_load(schema_str)
-            except:
-                raise Exception("Schema is neither a valid json nor a valid yaml.")
-            
-        if "schema" in schema:
-            self.schema = schema["schema"]
-            self.misc = {key: schema[key] for key in schema if key != "schema"}
+        self._config = config
+        self._config_key = None
+        self._validator = None
+        self._dependencies = None
+        self._choice_table = None
+        self._schema_model = None
+        self._async_template = None
+        self._render_semaphores = WeakKeyDictionary()
+        self.render_cache = None
+        self.render_concurrency = DEFAULT_RENDER_CONCURRENCY
+
+        key = None
+        entry = None
+        if cache is not None:
+            with span("cache-lookup"):
+                key = self._config_key = cache.key(config)
+                entry = cache.get(key)
+
+        if entry is not None:
+            self.schema = entry["schema"]
+            self.misc = entry["misc"]
+            template = entry["template"]
         else:
-            self.schema = schema
-            self.misc = {}
-        
-        try:
-            Draft202012Validator.check_schema(self.schema)
-        except exceptions.SchemaError as e:
-            raise Exception(f"The given schema file is not a valid json schema.\n\n{e}")
-        self.template = helpers._load_template_from_string("".join(MACROS)  + template)
+            with span("split"):
+                (schema_str, template) = helpers._split_string_at_delimiter(config)
+            with span("parse-header"):
+                schema = helpers._parse_header(schema_str)
+                
+            if "schema" in schema:
+                self.schema = schema["schema"]
+                self.misc = {key: schema[key] for key in schema if key != "schema"}
+            else:
+                self.schema = schema
+                self.misc = {}
+            
+            with span("check-schema"):
+                try:
+                    Draft202012Validator.check_schema(self.schema)
+                except exceptions.SchemaError as e:
+                    raise Exception(f"The given schema file is not a valid json schema.\n\n{e}")
+
+        self._template_source = template
+        self._template = None
+        self._cache = cache
+        if cache is not None and entry is None:
+            cache.set(key, {"schema": self.schema, "misc": self.misc, "template": template})
+
+    @property
+    def template(self):
+        """
+        Jinja template, compiled on first access. The macros are globals of the shared environment, see `installation_instruction.environment`.
 
+        :rtype: jinja2.Template
+        """
+        if self._template is None:
+            self._template = self._load_template(False)
+        return self._template
+
+    def _load_template(self, enable_async: bool):
+        from installation_instruction.environment import load_template
+        with span("compile-template", mode="async" if enable_async else "sync"):
+            if self._cache is not None:
+                return load_template(self._template_source, self._cache.bytecode_cache, self.config_key, enable_async)
+            return load_template(self._template_source, enable_async=enable_async)
+
+
+    def __reduce__(self):
+        return (self.__class__, (self._config,))
 
     @classmethod
-    def from_file(cls, path: str):
+    def from_file(cls, path: str, cache = None):
         """
         Returns class initialized via config file from path.
 
         :param path: Path to config file.
         :ptype path: str
+        :param cache: Optional cache for parsed configs and compiled templates.
+        :type cache: installation_instruction.cache.ConfigCache or None
         :return: InstallationInstruction class
         :rtype: InstallationInstruction
         """
-        with open(path, 'r') as file:
-            config = file.read()
-        return cls(config)
+        with span("read-config", path=path):
+            with open(path, 'r') as file:
+                config = file.read()
+        return cls(config, cache)
 
+
+_worker_instructions = {}
+
+def _init_render_worker(config: str) -> None:
+    """
+    Initializer of worker processes created by `InstallationInstruction.render_many`.
+    """
+    _worker_instructions[None] = InstallationInstruction(config)
+
+def _render_chunk(config: str | None, inputs: list[dict]) -> list[tuple[list[str], bool]]:
+    """
+    Renders a chunk of inputs in a worker process. Instructions are compiled once per worker and config.
+
+    :param config: Config string or None for the config given to `_init_render_worker`.
+    :type config: str or None
+    """
+    instruction = _worker_instructions.get(config)
+    if instruction is None:
+        if len(_worker_instructions) > 8:
+            _worker_instructions.clear()
+        instruction = _worker_instructions[config] = InstallationInstruction(config)
+    return [instruction._validate_and_render_without_raising(input) for input in inputs]
+
+def _render_with_executor(executor: Executor, config: str | None, inputs: Iterable[dict], chunksize: int, max_pending: int) -> Iterator[tuple[list[str], bool]]:
+    """
+    Submits chunks of inputs to an executor, with at most `max_pending` chunks in flight, and yields results in order.
+    """
+    inputs = iter(inputs)
+    pending = deque()
+    while True:
+        while len(pending) < max_pending:
+            chunk = list(islice(inputs, chunksize))
+            if not chunk:
+                break
+            pending.append(executor.submit(_render_chunk, config, chunk))
+        if not pending:
+            return
+        yield from pending.popleft().result()
@@ -0,0 +1,237 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Precomputed lookup tables for configs with a finite option space.
+
+A lookup table is a single binary file mapping every combination of enum and boolean options
+to its rendered instructions or error message. Lines are deduplicated in a string pool.
+`LookupTable` memory-maps such a file and answers lookups without jinja or jsonschema.
+
+File layout (all integers are little endian uint32):
+
+* magic `IILT` and format version
+* length of a json header and the header, padded to 4 bytes
+* number of combinations and the entry id of each combination
+* number of entries and the offsets of each entry into the entry words, followed by the number of words and the words.
+  An entry is stored as error flag followed by the string ids of its lines.
+* number of strings and the byte offsets of each string, followed by the utf-8 encoded strings.
+"""
+
+import json
+import mmap
+import struct
+
+
+MAGIC = b"IILT"
+FORMAT_VERSION = 1
+
+_UINT32 = struct.Struct("<I")
+
+
+def _value_key(value) -> tuple:
+    """
+    Returns a hashable key of a json value, where booleans are not equal to numbers.
+    """
+    return (isinstance(value, bool), value)
+
+
+def _pack_array(values: list[int]) -> bytes:
+    return _UINT32.pack(len(values)) + struct.pack(f"<{len(values)}I", *values)
+
+
+def compile_lookup_table(instruction, path: str, workers: int | None = None) -> None:
+    """
+    Renders every combination of enum and boolean options and writes the results into a lookup table file.
+    Properties which do not influence the output are not enumerated, see `InstallationInstruction.dependencies`.
+
+    :param instruction: Installation instruction.
+    :type instruction: InstallationInstruction
+    :param path: Path of the lookup table file.
+    :type path: str
+    :param workers: Number of worker processes for rendering.
+    :type workers: int or None
+    """
+    from installation_instruction.matrix import render_matrix, _get_option_space
+
+    (space, fixed) = _get_option_space(instruction, collapse=True)
+    enumerated = {key for (key, _values) in space}
+    properties = []
+    for (key, value) in instruction.schema.get("properties", {}).items():
+        if "enum" in value:
+            values = list(value["enum"])
+        elif value.get("type") == "boolean":
+            values = [False, True]
+        else:
+            continue
+        properties.append({"key": key, "values": values, "enumerated": key in enumerated})
+
+    header = {
+        "config_key": instruction.config_key,
+        "properties": properties,
+        "enumerated": [key for (key, _values) in space],
+        "fixed": fixed,
+        "defaults": {
+            key: value["default"]
+            for (key, value) in instruction.schema.get("properties", {}).items()
+            if "default" in value
+        },
+    }
+
+    strings = {}
+    entries = {}
+    entry_ids = []
+    for (_input, lines, is_error) in render_matrix(instruction, workers=workers, collapse=True):
+        line_ids = tuple(strings.setdefault(line, len(strings)) for line in lines)
+        entry_ids.append(entries.setdefault((is_error, line_ids), len(entries)))
+
+    words = []
+    entry_offsets = []
+    for (is_error, line_ids) in entries:
+        entry_offsets.append(len(words))
+        words.append(int(is_error))
+        words.extend(line_ids)
+    entry_offsets.append(len(words))
+
+    encoded = [string.encode("utf-8") for string in strings]
+    string_offsets = [0]
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 4)
+
+    with open(path, "wb") as file:
+        file.write(MAGIC + _UINT32.pack(FORMAT_VERSION))
+        file.write(_UINT32.pack(len(header_bytes)) + header_bytes)
+        file.write(_pack_array(entry_ids))
+        file.write(_pack_array(entry_offsets[:-1]) + _UINT32.pack(entry_offsets[-1]))
+        file.write(_pack_array(words))
+        file.write(_pack_array(string_offsets[:-1]) + _UINT32.pack(string_offsets[-1]))
+        file.write(b"".join(encoded))
+
+
+class LookupTable:
+    """
+    Memory-mapped reader of a lookup table file created with `compile_lookup_table`.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Path of the lookup table file.
+        :type path: str
+        :raise Exception: If the file is not a lookup table.
+        """
+        with open(path, "rb") as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._buffer[:4] != MAGIC or self._read(4) != FORMAT_VERSION:
+            self._buffer.close()
+            raise Exception(f"{path} is not a lookup table of version {FORMAT_VERSION}.")
+
+        header_length = self._read(8)
+        self.header = json.loads(self._buffer[12:12 + header_length])
+        position = 12 + header_length
+
+        self._combinations = position + 4
+        position += 4 + 4 * self._read(position)
+        self._entries = position + 4
+        position += 8 + 4 * self._read(position)
+        self._words = position + 4
+        position += 4 + 4 * self._read(position)
+        self._string_offsets = position + 4
+        position += 8 + 4 * self._read(position)
+        self._strings = position
+
+        self._properties = {}
+        for property in self.header["properties"]:
+            self._properties[property["key"]] = {
+                _value_key(value): index for (index, value) in enumerate(property["values"])
+            }
+        self._strides = {}
+        stride = 1
+        for key in reversed(self.header["enumerated"]):
+            self._strides[key] = stride
+            stride *= len(self._properties[key])
+        self._decoded = {}
+
+    def _read(self, position: int) -> int:
+        return _UINT32.unpack_from(self._buffer, position)[0]
+
+    def _string(self, id: int) -> str:
+        string = self._decoded.get(id)
+        if string is None:
+            start = self._read(self._string_offsets + 4 * id)
+            end = self._read(self._string_offsets + 4 * id + 4)
+            string = self._decoded[id] = self._buffer[self._strings + start:self._strings + end].decode("utf-8")
+        return string
+
+    def _index(self, input: dict) -> int:
+        """
+        Returns the index of the combination of the user input.
+
+        :raise KeyError: If the input is not covered by the table.
+        """
+        defaults = self.header["defaults"]
+        for key in input:
+            if key not in self._properties and key not in self.header["fixed"]:
+                raise KeyError(f"{key} is not an option of the lookup table.")
+        for (key, value) in self.header["fixed"].items():
+            if key in input and key not in self._properties and input[key] != value:
+                raise KeyError(f"{key} is fixed to {value!r} in the lookup table.")
+
+        index = 0
+        for (key, values) in self._properties.items():
+            if key in input:
+                value = input[key]
+            elif key in defaults:
+                value = defaults[key]
+            else:
+                raise KeyError(f"{key} is missing.")
+            try:
+                position = values.get(_value_key(value))
+            except TypeError:
+                position = None
+            if position is None:
+                raise KeyError(f"{value!r} is not a value of {key}.")
+            index += position * self._strides.get(key, 0)
+        return index
+
+    def lookup(self, input: dict) -> tuple[list[str], bool]:
+        """
+        Returns the instructions of a user input.
+
+        :param input: Enduser input.
+        :type input: dict
+        :raise KeyError: If the input is not covered by the table.
+        :return: Returns instructions and False. Or error and True.
+        :rtype: tuple[list[str], bool]
+        """
+        entry = self._read(self._combinations + 4 * self._index(input))
+        start = self._read(self._entries + 4 * entry)
+        end = self._read(self._entries + 4 * entry + 4)
+        is_error = bool(self._read(self._words + 4 * start))
+        lines = [self._string(self._read(self._words + 4 * word)) for word in range(start + 1, end)]
+        return (lines, is_error)
+
+    def __len__(self) -> int:
+        return self._read(self._combinations - 4)
+
+    def close(self) -> None:
+        self._buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,151 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Exhaustive rendering of every combination of enum and boolean options of a config.
+"""
+
+from itertools import islice, product, tee
+from math import prod
+from typing import Iterator
+
+from installation_instruction.installation_instruction import InstallationInstruction
+
+
+def _get_option_space(instruction: InstallationInstruction, collapse: bool = False) -> tuple[list[tuple[str, list]], dict]:
+    """
+    Returns the enumerable properties of a schema with their possible values
+    and the defaults of all other properties.
+
+    :param instruction: Installation instruction.
+    :type instruction: InstallationInstruction
+    :param collapse: Fix properties which do not influence the output to their default or first value.
+    :type collapse: bool
+    :return: List of property keys with values and dict of fixed values.
+    :rtype: tuple[list[tuple[str, list]], dict]
+    """
+    space = []
+    fixed = {}
+    dependencies = instruction.dependencies()["properties"] if collapse else {}
+    for (key, value) in instruction.schema.get("properties", {}).items():
+        if "enum" in value:
+            values = list(value["enum"])
+        elif value.get("type") == "boolean":
+            values = [False, True]
+        else:
+            values = None
+
+        if values is not None and (not collapse or dependencies[key]["influences_output"]):
+            space.append((key, values))
+        elif "default" in value:
+            fixed[key] = value["default"]
+        elif values:
+            fixed[key] = values[0]
+    return (space, fixed)
+
+def _parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parses a shard string like `1/4` into a zero based index and the number of shards.
+
+    :param shard: Shard as `i/n` with `1 <= i <= n`.
+    :type shard: str
+    :raise ValueError: If the shard is malformed.
+    :return: Tuple of zero based index and number of shards.
+    :rtype: tuple[int, int]
+    """
+    try:
+        (index, count) = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard '{shard}' is not of the form i/n.")
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard index {index} is not between 1 and {count}.")
+    return (index - 1, count)
+
+def count_combinations(instruction: InstallationInstruction, limit: int | None = None, shard: tuple[int, int] | None = None, collapse: bool = False) -> int:
+    """
+    Returns the number of combinations `iter_combinations` yields.
+
+    :param instruction: Installation instruction.
+    :type instruction: InstallationInstruction
+    :param limit: Maximum number of combinations.
+    :type limit: int or None
+    :param shard: Zero based shard index and number of shards.
+    :type shard: tuple[int, int] or None
+    :param collapse: Only enumerate properties which influence the output, see `InstallationInstruction.dependencies`.
+    :type collapse: bool
+    :return: Number of combinations.
+    :rtype: int
+    """
+    (space, _fixed) = _get_option_space(instruction, collapse)
+    total = prod(len(values) for (_key, values) in space)
+    if shard is not None:
+        (index, count) = shard
+        total = max(0, (total - index + count - 1) // count)
+    if limit is not None:
+        total = min(total, limit)
+    return total
+
+def iter_combinations(instruction: InstallationInstruction, limit: int | None = None, shard: tuple[int, int] | None = None, collapse: bool = False) -> Iterator[dict]:
+    """
+    Yields every combination of enum and boolean properties as user input.
+    Other properties are set to their default if they have one.
+
+    With `shard` only every n-th combination, starting at the shard index, is yielded.
+
+    :param instruction: Installation instruction.
+    :type instruction: InstallationInstruction
+    :param limit: Maximum number of combinations.
+    :type limit: int or None
+    :param shard: Zero based shard index and number of shards.
+    :type shard: tuple[int, int] or None
+    :param collapse: Only enumerate properties which influence the output, see `InstallationInstruction.dependencies`.
+    :type collapse: bool
+    :return: Iterator over user inputs.
+    :rtype: Iterator[dict]
+    """
+    (space, fixed) = _get_option_space(instruction, collapse)
+    keys = [key for (key, _values) in space]
+    combinations = (
+        {**fixed, **dict(zip(keys, values))}
+        for values in product(*(values for (_key, values) in space))
+    )
+    if shard is not None:
+        (index, count) = shard
+        combinations = islice(combinations, index, None, count)
+    if limit is not None:
+        combinations = islice(combinations, limit)
+    return combinations
+
+def render_matrix(instruction: InstallationInstruction, workers: int | None = None, limit: int | None = None, shard: tuple[int, int] | None = None, collapse: bool = False) -> Iterator[tuple[dict, list[str], bool]]:
+    """
+    Renders every combination of enum and boolean properties.
+
+    :param instruction: Installation instruction.
+    :type instruction: InstallationInstruction
+    :param workers: Number of worker processes, renders in this process if None or 1.
+    :type workers: int or None
+    :param limit: Maximum number of combinations.
+    :type limit: int or None
+    :param shard: Zero based shard index and number of shards.
+    :type shard: tuple[int, int] or None
+    :param collapse: Only enumerate properties which influence the output, see `InstallationInstruction.dependencies`.
+    :type collapse: bool
+    :return: Iterator over user input, instructions and False. Or user input, errors and True.
+    :rtype: Iterator[tuple[dict, list[str], bool]]
+    """
+    if workers == 1:
+        workers = None
+    (inputs, render_inputs) = tee(iter_combinations(instruction, limit, shard, collapse))
+    for (input, (instructions, is_error)) in zip(inputs, instruction.render_many(render_inputs, workers=workers)):
+        yield (input, instructions, is_error)
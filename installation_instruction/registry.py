@@ -0,0 +1,302 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Registry of many configs, e.g. all `install.cfg` files of a monorepo, indexed by the `$id` of their schema.
+
+Configs are loaded concurrently. Loaded instructions are held within a memory budget, the least recently used
+are dropped first and loaded again from their file when they are accessed.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from threading import Lock
+import os
+
+from installation_instruction.cache import ConfigCache
+from installation_instruction.helpers import CONFIG_FILE_NAME
+from installation_instruction.installation_instruction import InstallationInstruction
+from installation_instruction.tracing import span
+
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Loaded instructions take about ten times the size of their config (schema, compiled validator and template)
+# plus a fixed overhead, measured with tracemalloc on generated configs.
+ESTIMATED_BYTES_PER_CHARACTER = 12
+ESTIMATED_OVERHEAD = 64 * 1024
+
+
+def discover_configs(root: str, file_name: str = CONFIG_FILE_NAME) -> list[str]:
+    """
+    Returns the paths of all config files below a directory. Hidden directories like `.git` are skipped.
+
+    :param root: Directory to search.
+    :type root: str
+    :param file_name: Name of config files.
+    :type file_name: str
+    :return: Sorted paths of the config files.
+    :rtype: list[str]
+    """
+    paths = []
+    for (directory, directories, files) in os.walk(root):
+        directories[:] = [name for name in directories if not name.startswith(".")]
+        if file_name in files:
+            paths.append(os.path.join(directory, file_name))
+    return sorted(paths)
+
+def _estimate_size(config: str) -> int:
+    return ESTIMATED_OVERHEAD + ESTIMATED_BYTES_PER_CHARACTER * len(config)
+
+def _load(path: str, cache: ConfigCache | None) -> tuple[InstallationInstruction, int]:
+    """
+    Loads a config and compiles its template.
+
+    :return: Instruction and its estimated size in bytes.
+    """
+    with span("load-config", path=path):
+        with open(path, "r") as file:
+            config = file.read()
+        instruction = InstallationInstruction(config, cache)
+        instruction.template
+    return (instruction, _estimate_size(config))
+
+def _warm_cache(path: str, directory: str, max_size: int) -> None:
+    """
+    Loads a config in a worker process, so the parsed schema and compiled template are in the config cache.
+    """
+    _load(path, ConfigCache(directory, max_size))
+
+
+class _Entry:
+    """
+    Config file with its `$id` and its instruction, if it is loaded.
+    """
+
+    __slots__ = ("path", "id", "instruction", "size")
+
+    def __init__(self, path: str, id: str, instruction: InstallationInstruction, size: int) -> None:
+        self.path = path
+        self.id = id
+        self.instruction = instruction
+        self.size = size
+
+
+class ConfigRegistry:
+    """
+    Configs indexed by the `$id` of their schema, or by their absolute path if the schema has no `$id`.
+
+    Loaded instructions are held while their estimated size fits into `memory_budget`.
+    Dropped instructions are loaded again from their file on access, with a `ConfigCache` this skips parsing and compilation.
+    """
+
+    def __init__(self, cache: ConfigCache | None = None, memory_budget: int = DEFAULT_MEMORY_BUDGET, workers: int | None = None, processes: bool = False) -> None:
+        """
+        :param cache: Cache for parsed configs and compiled templates.
+        :type cache: ConfigCache or None
+        :param memory_budget: Maximum estimated size of the loaded instructions in bytes.
+        :type memory_budget: int
+        :param workers: Number of threads or processes loading configs. Defaults to the number of cpus.
+        :type workers: int or None
+        :param processes: Load configs in worker processes, which parse and compile them into `cache`.
+            This avoids the global interpreter lock, but needs a cache.
+        :type processes: bool
+        :raise Exception: If `processes` is set without a cache.
+        """
+        if processes and cache is None:
+            raise Exception("Loading configs in processes needs a ConfigCache.")
+        self.cache = cache
+        self.memory_budget = memory_budget
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.errors = {}
+        self.entries = {}
+        self._paths = {}
+        self._loaded = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        self._reloads = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def add_tree(self, root: str) -> dict[str, str]:
+        """
+        Discovers and loads all `install.cfg` files below a directory, see `discover_configs`.
+
+        :param root: Directory to search.
+        :type root: str
+        :return: Paths of configs which failed to load, mapped to their error message.
+        :rtype: dict[str, str]
+        """
+        return self.add(discover_configs(root))
+
+    def add(self, paths: list[str]) -> dict[str, str]:
+        """
+        Loads configs concurrently and adds them to the index.
+        A config which fails to load is left out, the others are loaded nonetheless. Errors are also kept in `errors`.
+
+        :param paths: Paths to config files.
+        :type paths: list[str]
+        :return: Paths of configs which failed to load, mapped to their error message.
+        :rtype: dict[str, str]
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        errors = {}
+        if self.processes:
+            with ProcessPoolExecutor(self.workers) as executor:
+                futures = {executor.submit(_warm_cache, path, self.cache.store.directory, self.cache.store.max_size): path for path in paths}
+                for future in as_completed(futures):
+                    if (error := future.exception()) is not None:
+                        errors[futures[future]] = str(error)
+            paths = [path for path in paths if path not in errors]
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = {executor.submit(_load, path, self.cache): path for path in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    (instruction, size) = future.result()
+                    self._add(path, instruction, size)
+                except Exception as e:
+                    errors[path] = str(e)
+
+        with self._lock:
+            for path in paths:
+                if path not in errors:
+                    self.errors.pop(path, None)
+            self.errors.update(errors)
+        return errors
+
+    def _add(self, path: str, instruction: InstallationInstruction, size: int) -> None:
+        id = instruction.schema.get("$id") or path
+        with self._lock:
+            if (other := self.entries.get(id)) is not None and other.path != path:
+                raise Exception(f"$id {id} is also used by {other.path}.")
+            if (old := self._paths.get(path)) is not None:
+                self._remove(old)
+            entry = self.entries[id] = self._paths[path] = _Entry(path, id, None, 0)
+            self._hold(entry, instruction, size)
+
+    def _hold(self, entry: _Entry, instruction: InstallationInstruction, size: int) -> None:
+        """
+        Marks an instruction as loaded and drops the least recently used ones above the memory budget. Needs the lock.
+        """
+        entry.instruction = instruction
+        entry.size = size
+        self._loaded[entry.id] = entry
+        self._size += size
+        self.loads += 1
+        while self._size > self.memory_budget and len(self._loaded) > 1:
+            (_id, evicted) = self._loaded.popitem(last=False)
+            self._drop(evicted)
+            self.evictions += 1
+
+    def _drop(self, entry: _Entry) -> None:
+        from installation_instruction.environment import discard_template
+        discard_template(entry.instruction._template_source)
+        self._size -= entry.size
+        entry.instruction = None
+        entry.size = 0
+
+    def _remove(self, entry: _Entry) -> None:
+        if entry.instruction is not None:
+            del self._loaded[entry.id]
+            self._drop(entry)
+        del self.entries[entry.id]
+        del self._paths[entry.path]
+
+    def get(self, id: str) -> InstallationInstruction:
+        """
+        Returns the instruction of a config, loading it again from its file if it was dropped.
+
+        :param id: `$id` of the schema, or the absolute path of configs without `$id`.
+        :type id: str
+        :raise KeyError: If no config has this `$id`.
+        :raise Exception: If a dropped config fails to load or its `$id` changed.
+        :return: Instruction of the config.
+        :rtype: InstallationInstruction
+        """
+        with self._lock:
+            entry = self.entries[id]
+            if entry.instruction is not None:
+                self._loaded.move_to_end(id)
+                return entry.instruction
+            # Only one thread loads a dropped config, others wait for it without holding the lock.
+            if (reload := self._reloads.get(id)) is not None:
+                waiting = True
+            else:
+                reload = self._reloads[id] = Future()
+                waiting = False
+        if waiting:
+            return reload.result()
+
+        try:
+            (instruction, size) = _load(entry.path, self.cache)
+            if (instruction.schema.get("$id") or entry.path) != id:
+                raise Exception(f"$id of {entry.path} changed, add it again.")
+        except Exception as e:
+            with self._lock:
+                del self._reloads[id]
+            reload.set_exception(e)
+            raise
+        with self._lock:
+            del self._reloads[id]
+            if self.entries.get(id) is entry:
+                self._hold(entry, instruction, size)
+        reload.set_result(instruction)
+        return instruction
+
+    def __getitem__(self, id: str) -> InstallationInstruction:
+        return self.get(id)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def ids(self) -> list[str]:
+        """
+        Returns the `$id` of all configs.
+
+        :rtype: list[str]
+        """
+        with self._lock:
+            return list(self.entries)
+
+    def path(self, id: str) -> str:
+        """
+        Returns the path of the config file with a `$id`.
+
+        :raise KeyError: If no config has this `$id`.
+        :rtype: str
+        """
+        return self.entries[id].path
+
+    def stats(self) -> dict:
+        """
+        Returns the number of configs, loaded configs, their estimated size, loads, evictions and errors.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "configs": len(self.entries),
+                "loaded": len(self._loaded),
+                "size": self._size,
+                "memory_budget": self.memory_budget,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "errors": len(self.errors),
+            }
@@ -0,0 +1,515 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Execution of rendered instructions as a graph of steps.
+
+Template authors group commands into steps with the `step` macro:
+
+.. code-block:: jinja
+
+    {% call step("torch") %}
+        pip install torch
+    {% endcall %}
+    {% call step("spacy", after=["torch"]) %}
+        pip install spacy
+    {% endcall %}
+
+The macro renders marker lines, which are shell comments, around the commands of a step.
+Commands of a step run in sequence, steps run in parallel once the steps they depend on finished.
+A step may only depend on steps defined before it, so the steps always form a graph without cycles.
+Commands outside of steps act as barriers: they run after everything before them and before everything after them.
+
+Output of commands is streamed line by line while they run, only the last lines are kept for error reports.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from logging.handlers import RotatingFileHandler
+from threading import Lock, Thread, current_thread, main_thread
+from time import perf_counter, sleep
+from typing import Callable, Iterable, Iterator
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+
+from installation_instruction.helpers import STEP_MARKER, END_STEP_MARKER
+from installation_instruction.tracing import span
+
+
+DEFAULT_TAIL_LINES = 200
+KILL_TIMEOUT = 5.0
+POLL_INTERVAL = 0.01
+READER_POLL_INTERVAL = 0.1
+LOG_FILE_NAME = "install.log"
+LOG_MAX_BYTES = 1024 * 1024
+
+
+class Step:
+    """
+    Commands run in sequence after the steps they depend on.
+    """
+
+    def __init__(self, name: str | None, after: list[int], commands: list[str]) -> None:
+        """
+        :param name: Name of the step or None for commands outside of steps.
+        :type name: str or None
+        :param after: Indices of the steps this step depends on.
+        :type after: list[int]
+        :param commands: Shell commands.
+        :type commands: list[str]
+        """
+        self.name = name
+        self.after = after
+        self.commands = commands
+
+    def __repr__(self) -> str:
+        return f"Step({self.name!r}, after={self.after!r}, commands={self.commands!r})"
+
+
+class CommandResult:
+    """
+    Outcome of running a command. `stdout` and `stderr` hold only the last lines of the output.
+    """
+
+    def __init__(self, command: str, returncode: int, duration: float, max_rss: int | None, stdout: str, stderr: str) -> None:
+        """
+        :param command: Shell command.
+        :type command: str
+        :param returncode: Exit code of the command.
+        :type returncode: int
+        :param duration: Wall time in seconds.
+        :type duration: float
+        :param max_rss: Peak resident set size in bytes, None if unknown or below the peak of this process.
+        :type max_rss: int or None
+        :param stdout: Last lines of stdout.
+        :type stdout: str
+        :param stderr: Last lines of stderr.
+        :type stderr: str
+        """
+        self.command = command
+        self.returncode = returncode
+        self.duration = duration
+        self.max_rss = max_rss
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+class StepResult:
+    """
+    Outcome of running a step. On failure `command` is the failed command.
+    """
+
+    def __init__(self, step: Step, commands: list[CommandResult]) -> None:
+        self.step = step
+        self.commands = commands
+
+    @property
+    def failed(self) -> bool:
+        return any(command.returncode != 0 for command in self.commands)
+
+    @property
+    def returncode(self) -> int:
+        return self.commands[-1].returncode if self.commands else 0
+
+    @property
+    def command(self) -> str | None:
+        return self.commands[-1].command if self.failed else None
+
+    @property
+    def stdout(self) -> str:
+        return "".join(command.stdout for command in self.commands)
+
+    @property
+    def stderr(self) -> str:
+        return "".join(command.stderr for command in self.commands)
+
+
+def iter_steps(lines: Iterable[str]) -> Iterator[Step]:
+    """
+    Groups rendered instructions into steps, yielding each step as soon as it is complete.
+    Consecutive commands outside of steps are grouped into one barrier step.
+
+    :param lines: Rendered instructions.
+    :type lines: Iterable[str]
+    :raise Exception: If steps are nested, not closed, have duplicate names or depend on unknown or later steps.
+    :return: Iterator over the steps in the order of the instructions.
+    :rtype: Iterator[Step]
+    """
+    count = 0
+    names = {}
+    barrier = None
+    since_barrier = []
+    current = None
+    pending = None
+
+    for line in lines:
+        if line.startswith(STEP_MARKER):
+            if current is not None:
+                raise Exception(f"Step {current.name} is not closed before the next step starts.")
+            if pending is not None:
+                yield pending
+                pending = None
+            marker = json.loads(line[len(STEP_MARKER):])
+            (name, after) = (str(marker["name"]), marker.get("after") or [])
+            if isinstance(after, str):
+                after = [after]
+            if name in names:
+                raise Exception(f"Step {name} is defined twice.")
+            dependencies = [] if barrier is None else [barrier]
+            for dependency in after:
+                if dependency not in names:
+                    raise Exception(f"Step {name} depends on {dependency}, which is not defined before it.")
+                dependencies.append(names[dependency])
+            current = Step(name, sorted(set(dependencies)), [])
+        elif line == END_STEP_MARKER:
+            if current is None:
+                raise Exception("End of step without a step.")
+            names[current.name] = count
+            since_barrier.append(count)
+            count += 1
+            yield current
+            current = None
+        elif current is not None:
+            current.commands.append(line)
+        elif pending is not None:
+            pending.commands.append(line)
+        else:
+            dependencies = since_barrier if barrier is None else [barrier] + since_barrier
+            barrier = count
+            since_barrier = []
+            count += 1
+            pending = Step(None, dependencies, [line])
+
+    if current is not None:
+        raise Exception(f"Step {current.name} is not closed.")
+    if pending is not None:
+        yield pending
+
+def parse_steps(lines: Iterable[str]) -> list[Step]:
+    """
+    Groups rendered instructions into steps, see `iter_steps`.
+
+    :param lines: Rendered instructions.
+    :type lines: Iterable[str]
+    :raise Exception: If steps are nested, not closed, have duplicate names or depend on unknown or later steps.
+    :return: Steps in the order of the instructions.
+    :rtype: list[Step]
+    """
+    return list(iter_steps(lines))
+
+
+def _pump(stream, tail: deque, on_line: Callable[[str], None] | None) -> None:
+    """
+    Reads a stream line by line into a ring buffer and passes each line on.
+    """
+    for line in stream:
+        tail.append(line)
+        if on_line is not None:
+            on_line(line.rstrip("\n"))
+    stream.close()
+
+def _get_own_max_rss() -> int | None:
+    if not hasattr(os, "wait4"):
+        return None
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _wait(process: subprocess.Popen, own_max_rss: int | None) -> tuple[int, int | None]:
+    """
+    Waits for a process and returns its exit code and peak resident set size in bytes.
+
+    A child starts with the peak of this process at the time it was started, smaller peaks can not be told apart
+    and are reported as None, as is the peak on platforms without `os.wait4`.
+    """
+    if own_max_rss is None:
+        return (process.wait(), None)
+    try:
+        (_pid, status, usage) = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # Already reaped by `Popen.poll` while it was cancelled.
+        return (process.wait(), None)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if usage.ru_maxrss <= own_max_rss:
+        return (process.returncode, None)
+    return (process.returncode, usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024))
+
+
+def _signal_group(process: subprocess.Popen, signum: int) -> None:
+    """
+    Sends a signal to the process group of a command. On Windows a console break is sent instead.
+    """
+    try:
+        if os.name == "nt":
+            if process.returncode is None:
+                process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(process.pid, signum)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _kill_group(process: subprocess.Popen) -> None:
+    """
+    Kills the process group of a command. On Windows only the process itself is killed.
+    """
+    try:
+        if os.name == "nt":
+            if process.returncode is None:
+                process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _group_is_alive(process: subprocess.Popen) -> bool:
+    if os.name == "nt":
+        return process.returncode is None
+    try:
+        os.killpg(process.pid, 0)
+    except (ProcessLookupError, PermissionError):
+        return False
+    return True
+
+
+class _ProcessGroup:
+    """
+    Running processes of all steps, which can be terminated at once.
+
+    Every command is started in its own process group, so signals reach the processes started by its shell as well.
+    """
+
+    def __init__(self, tail: int) -> None:
+        self.tail = tail
+        self.lock = Lock()
+        self.processes = set()
+        self.cancelled = False
+
+    def run(self, command: str, on_output: Callable[[str, str], None] | None) -> CommandResult:
+        """
+        Runs a command, streaming its output line by line to `on_output` with the stream name.
+        """
+        start = perf_counter()
+        with self.lock:
+            if self.cancelled:
+                return CommandResult(command, -1, 0.0, None, "", "")
+            own_max_rss = _get_own_max_rss()
+            if os.name == "nt":
+                group = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+            else:
+                group = {"start_new_session": True}
+            process = subprocess.Popen(
+                command, shell=True, text=True, errors="replace",
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                **group,
+            )
+            self.processes.add(process)
+        stdout = deque(maxlen=self.tail)
+        stderr = deque(maxlen=self.tail)
+        try:
+            readers = [
+                Thread(target=_pump, args=(process.stdout, stdout, on_output and (lambda line: on_output("stdout", line))), daemon=True),
+                Thread(target=_pump, args=(process.stderr, stderr, on_output and (lambda line: on_output("stderr", line))), daemon=True),
+            ]
+            for reader in readers:
+                reader.start()
+            (returncode, max_rss) = _wait(process, own_max_rss)
+            # Processes which left the process group may keep the pipes open, their output is not waited for once cancelled.
+            for reader in readers:
+                while not self.cancelled and reader.is_alive():
+                    reader.join(READER_POLL_INTERVAL)
+        finally:
+            with self.lock:
+                self.processes.discard(process)
+        return CommandResult(command, returncode, perf_counter() - start, max_rss, "".join(stdout), "".join(stderr))
+
+    def interrupt(self) -> None:
+        """
+        Forwards an interrupt to the process groups of all running commands.
+        """
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            _signal_group(process, signal.SIGINT)
+
+    def cancel(self) -> None:
+        """
+        Terminates the process groups of all running commands and runs no further commands.
+        Returns once all processes of the groups exited, groups still running after `KILL_TIMEOUT` seconds are killed.
+        """
+        with self.lock:
+            self.cancelled = True
+            processes = list(self.processes)
+        for process in processes:
+            _signal_group(process, signal.SIGTERM)
+        deadline = perf_counter() + KILL_TIMEOUT
+        for process in processes:
+            while _group_is_alive(process) and perf_counter() < deadline:
+                sleep(POLL_INTERVAL)
+            _kill_group(process)
+
+def _run_step(step: Step, group: _ProcessGroup, on_output: Callable[[Step, str, str], None] | None) -> StepResult:
+    results = []
+    with span("step", name=step.name):
+        for command in step.commands:
+            with span("command", command=command):
+                result = group.run(command, on_output and (lambda stream, line: on_output(step, stream, line)))
+            results.append(result)
+            if result.returncode != 0:
+                break
+    return StepResult(step, results)
+
+def run_steps(steps: Iterable[Step], jobs: int = 1, on_output: Callable[[Step, str, str], None] | None = None, tail: int = DEFAULT_TAIL_LINES) -> Iterator[StepResult]:
+    """
+    Runs steps on a pool of `jobs` threads, each step once all steps it depends on succeeded.
+    Steps are taken from `steps` only when no known step can start, so commands start while later steps are still rendered.
+    If `steps` raises, running commands are terminated and the exception is raised.
+    In the main thread an interrupt (SIGINT) is forwarded to the running commands before `KeyboardInterrupt` is raised.
+
+    Results are yielded in the order of the steps, independent of the order they finished in.
+    After the first failure running commands are terminated, no further steps are started
+    and the failed result is yielded last.
+
+    Output is streamed while the commands run: every line is passed to `on_output` with the step
+    and the stream name (`stdout` or `stderr`). Calls are serialized, but lines of parallel steps interleave.
+    Results only keep the last `tail` lines of each stream, so memory does not grow with the output.
+
+    :param steps: Steps from `iter_steps` or `parse_steps`.
+    :type steps: Iterable[Step]
+    :param jobs: Maximum number of steps running at once.
+    :type jobs: int
+    :param on_output: Callback for every line of output.
+    :type on_output: Callable[[Step, str, str], None] or None
+    :param tail: Number of lines of each stream kept for the result.
+    :type tail: int
+    :return: Iterator over the results.
+    :rtype: Iterator[StepResult]
+    """
+    if on_output is not None:
+        output_lock = Lock()
+        callback = on_output
+        def on_output(step: Step, stream: str, line: str) -> None:
+            with output_lock:
+                callback(step, stream, line)
+
+    group = _ProcessGroup(tail)
+    previous_handler = signal.getsignal(signal.SIGINT) if current_thread() is main_thread() else None
+    # Handlers not installed from python are reported as None and can not be restored.
+    forward_interrupts = previous_handler is not None
+    if forward_interrupts:
+        def on_interrupt(signum, frame):
+            group.interrupt()
+            if callable(previous_handler):
+                previous_handler(signum, frame)
+            elif previous_handler != signal.SIG_IGN:
+                raise KeyboardInterrupt
+        signal.signal(signal.SIGINT, on_interrupt)
+
+    steps = iter(steps)
+    known = []
+    exhausted = False
+    results = {}
+    running = {}
+    started = set()
+    next_result = 0
+    failure = None
+
+    with ThreadPoolExecutor(max(1, jobs)) as executor:
+        try:
+            while failure is None:
+                while len(running) < max(1, jobs):
+                    ready = next((
+                        index for (index, step) in enumerate(known)
+                        if index not in started and all(dependency in results for dependency in step.after)
+                    ), None)
+                    if ready is not None:
+                        started.add(ready)
+                        running[executor.submit(_run_step, known[ready], group, on_output)] = ready
+                    elif exhausted:
+                        break
+                    elif (step := next(steps, None)) is not None:
+                        known.append(step)
+                    else:
+                        exhausted = True
+                if not running:
+                    break
+                (done, _pending) = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = results[running.pop(future)] = future.result()
+                    if result.failed and failure is None:
+                        failure = result
+                        group.cancel()
+                while next_result in results and not results[next_result].failed:
+                    yield results[next_result]
+                    next_result += 1
+        except BaseException:
+            group.cancel()
+            raise
+        finally:
+            wait(running)
+            if forward_interrupts:
+                signal.signal(signal.SIGINT, previous_handler)
+
+    if failure is not None:
+        yield failure
+
+def format_summary(results: list[StepResult]) -> str:
+    """
+    Returns a table with wall time and peak memory of every command that ran.
+
+    :param results: Results from `run_steps`.
+    :type results: list[StepResult]
+    :return: Table as string.
+    :rtype: str
+    """
+    rows = [("Step", "Command", "Time", "Peak RSS")]
+    for result in results:
+        for command in result.commands:
+            text = command.command if len(command.command) <= 48 else command.command[:45] + "..."
+            rows.append((
+                result.step.name or "",
+                text + (" (failed)" if command.returncode != 0 else ""),
+                f"{command.duration:.2f}s",
+                f"{command.max_rss / 1024 / 1024:.1f} MiB" if command.max_rss is not None else "-",
+            ))
+    widths = [max(len(row[column]) for row in rows) for column in range(4)]
+    return "\n".join(
+        "  ".join(value.ljust(width) if column < 2 else value.rjust(width) for (column, (value, width)) in enumerate(zip(row, widths))).rstrip()
+        for row in rows
+    )
+
+def _get_install_logger(directory: str | None = None) -> logging.Logger:
+    """
+    Returns the logger the output of installations is written to.
+    The log file `install.log` in the user log dir is rotated at 1 MiB, keeping 3 old files.
+
+    :param directory: Log directory. Defaults to the user log dir.
+    :type directory: str or None
+    :return: Logger.
+    :rtype: logging.Logger
+    """
+    logger = logging.getLogger("installation_instruction.install")
+    if not logger.handlers:
+        if directory is None:
+            import platformdirs
+            directory = platformdirs.user_log_dir("installation_instruction")
+        os.makedirs(directory, exist_ok=True)
+        handler = RotatingFileHandler(os.path.join(directory, LOG_FILE_NAME), maxBytes=LOG_MAX_BYTES, backupCount=3, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
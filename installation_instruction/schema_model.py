@@ -0,0 +1,206 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Immutable model of the properties of a schema, built once per instruction.
+
+`InstallationInstruction.parse_schema` and the options of the cli are both derived from it.
+Alternatives of a property given with `enum`, `const`, `anyOf` or `oneOf` are merged into one list of enum entries.
+Keys and titles are interned, so models of many configs share their strings.
+"""
+
+from sys import intern
+from types import MappingProxyType
+from typing import Any
+
+
+class _Frozen:
+    """
+    Base class of slot based objects whose attributes can not be changed after `__init__`.
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def _set(self, **attributes) -> None:
+        for (name, value) in attributes.items():
+            object.__setattr__(self, name, value)
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, name) for name in self.__slots__))
+
+
+def _intern(value: Any) -> Any:
+    return intern(value) if isinstance(value, str) else value
+
+
+class EnumEntry(_Frozen):
+    """
+    A value of an enum property with its pretty title and description.
+    """
+
+    __slots__ = ("key", "title", "description")
+
+    def __init__(self, key: Any, title: Any, description: str) -> None:
+        self._set(key=_intern(key), title=_intern(title), description=description)
+
+    def to_dict(self) -> dict:
+        return {"title": self.title, "key": self.key, "description": self.description}
+
+
+class Property(_Frozen):
+    """
+    A property of the schema.
+
+    `type` is the json type of the property, a tuple if the schema lists several types.
+    `enum` is the tuple of its entries or None if it is not an enum.
+    """
+
+    __slots__ = ("key", "title", "description", "type", "default", "required", "enum")
+
+    def __init__(self, key: str, title: str, description: str, type: str | tuple, default: Any, required: bool, enum: tuple[EnumEntry, ...] | None) -> None:
+        self._set(key=_intern(key), title=_intern(title), description=description, type=type, default=default, required=required, enum=enum)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the property in the format of `InstallationInstruction.parse_schema`, where enums have the type `enum`.
+
+        :rtype: dict
+        """
+        result = {
+            "title": self.title,
+            "description": self.description,
+            "type": list(self.type) if isinstance(self.type, tuple) else self.type,
+            "default": self.default,
+            "key": self.key,
+        }
+        if self.enum is not None:
+            result["enum"] = [entry.to_dict() for entry in self.enum]
+            result["type"] = "enum"
+        return result
+
+
+class SchemaModel(_Frozen):
+    """
+    `$id`, title, description and properties of a schema. Properties are mapped by their key in schema order.
+    """
+
+    __slots__ = ("id", "title", "description", "properties")
+
+    def __init__(self, id: str, title: str, description: str, properties: tuple[Property, ...]) -> None:
+        self._set(id=id, title=title, description=description, properties=MappingProxyType({property.key: property for property in properties}))
+
+    def __reduce__(self):
+        return (self.__class__, (self.id, self.title, self.description, tuple(self.properties.values())))
+
+    @classmethod
+    def from_schema(cls, schema: dict, misc: dict | None = None):
+        """
+        Builds the model of a schema.
+
+        :param schema: Json schema of the config.
+        :type schema: dict
+        :param misc: Keys of the config header besides `schema`. Its `pretty` and `description` map keys to titles and descriptions.
+        :type misc: dict or None
+        :return: Model of the schema.
+        :rtype: SchemaModel
+        """
+        misc = misc or {}
+        pretty = misc.get("pretty", {})
+        description = misc.get("description", {})
+        required = set(schema.get("required", []))
+
+        properties = []
+        for (key, value) in schema.get("properties", {}).items():
+            enum = _get_enum_entries(value, pretty, description)
+            properties.append(Property(
+                key=key,
+                title=value.get("title", "") or pretty.get(key, key),
+                description=value.get("description", "") or description.get(key, ""),
+                type=_get_type(value),
+                default=value.get("default", None),
+                required=key in required,
+                enum=enum,
+            ))
+        return cls(schema.get("$id", ""), schema.get("title", ""), schema.get("description", ""), tuple(properties))
+
+    def to_dict(self) -> dict:
+        """
+        Returns the model in the format of `InstallationInstruction.parse_schema`.
+
+        :rtype: dict
+        """
+        return {
+            "$id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "properties": {key: property.to_dict() for (key, property) in self.properties.items()},
+        }
+
+
+def _get_type(value: dict) -> str | tuple:
+    """
+    Returns the type of a property as given, lists as tuples, or the type shared by all of its alternatives. Defaults to `string`.
+    """
+    if "type" in value:
+        return tuple(value["type"]) if isinstance(value["type"], list) else value["type"]
+    alternatives = value.get("anyOf", value.get("oneOf", []))
+    types = {alternative.get("type") for alternative in alternatives if isinstance(alternative, dict)}
+    if len(types) == 1 and isinstance(json_type := types.pop(), str):
+        return json_type
+    return "string"
+
+def _get_enum_entries(value: dict, pretty: dict, description: dict) -> tuple[EnumEntry, ...] | None:
+    """
+    Merges `enum`, `const` and the alternatives of `anyOf` and `oneOf` into enum entries.
+
+    An alternative with `const` or `enum` contributes its values, its own `title` and `description` are used for a `const`.
+    Returns None if the property is not an enum, i.e. it has none of these keywords or an alternative allows other values.
+    """
+    values = {}
+
+    def add(key: Any, title: Any = "", entry_description: str = "") -> None:
+        # Keyed by type as well, so `True` and `1` are different values.
+        try:
+            if (type(key), key) in values:
+                return
+        except TypeError:
+            return
+        values[(type(key), key)] = EnumEntry(key, title or pretty.get(key, key), entry_description or description.get(key, ""))
+
+    def add_alternative(schema: dict) -> bool:
+        if "const" in schema:
+            add(schema["const"], schema.get("title", ""), schema.get("description", ""))
+        elif "enum" in schema:
+            for key in schema["enum"]:
+                add(key)
+        else:
+            return False
+        return True
+
+    if "enum" in value or "const" in value:
+        add_alternative(value)
+    else:
+        alternatives = value.get("anyOf", value.get("oneOf"))
+        if not alternatives:
+            return None
+        for alternative in alternatives:
+            if not isinstance(alternative, dict) or not add_alternative(alternative):
+                return None
+    return tuple(values.values())
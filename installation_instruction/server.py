@@ -0,0 +1,290 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Long-lived asyncio HTTP server rendering preloaded configs.
+
+Endpoints:
+
+* `GET /configs` lists the served configs.
+* `GET /configs/<name>/schema` returns the output of `InstallationInstruction.parse_schema`.
+* `POST /configs/<name>/render` renders the json body as user input.
+* `POST /configs/<name>/choices` returns the valid remaining choices for the json body as partial user input.
+* `GET /metrics` returns request latencies and cache statistics.
+
+Configs are reloaded when their file changed. Requests are handled in threads of the default executor of the event loop.
+"""
+
+from collections import deque
+from hashlib import sha256
+from http import HTTPStatus
+from threading import Lock
+from time import perf_counter
+import asyncio
+import json
+import os
+
+from installation_instruction.cache import ConfigCache, RenderCache
+from installation_instruction.helpers import CONFIG_FILE_NAME, _strip_step_markers
+from installation_instruction.installation_instruction import InstallationInstruction
+
+
+LATENCY_WINDOW = 4096
+MAX_BODY_SIZE = 1024 * 1024
+
+
+def _config_name(path: str) -> str:
+    """
+    Returns the name a config is served under. This is the folder name for `install.cfg` files,
+    else the file name up to the first dot.
+    """
+    file_name = os.path.basename(path)
+    if file_name == CONFIG_FILE_NAME:
+        return os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return file_name.split(".")[0]
+
+def _percentile(values: list[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percentile))]
+
+
+class _ServedConfig:
+    """
+    Config file with its loaded instruction, reloaded when the file changes.
+    """
+
+    def __init__(self, path: str, cache: ConfigCache | None, render_cache: RenderCache) -> None:
+        self.path = path
+        self.cache = cache
+        self.render_cache = render_cache
+        self.stat = None
+        self.digest = None
+        self.instruction = None
+        self.reloads = 0
+        self.lock = Lock()
+        self.reload()
+
+    def reload(self) -> None:
+        """
+        Loads the config if the modification time or size of the file changed and its content hash differs.
+        """
+        with self.lock:
+            self._reload()
+
+    def _reload(self) -> None:
+        stat = os.stat(self.path)
+        if self.stat is not None and (stat.st_mtime_ns, stat.st_size) == self.stat:
+            return
+        with open(self.path, "r") as file:
+            config = file.read()
+        digest = sha256(config.encode("utf-8")).hexdigest()
+        if digest != self.digest:
+            instruction = InstallationInstruction(config, self.cache)
+            instruction.render_cache = self.render_cache
+            if self.instruction is not None:
+                self.instruction.invalidate_render_cache()
+                self.reloads += 1
+            self.instruction = instruction
+            self.digest = digest
+        self.stat = (stat.st_mtime_ns, stat.st_size)
+
+
+class RenderServer:
+    """
+    HTTP server serving schemas and render results of preloaded configs.
+    """
+
+    def __init__(self, paths: list[str], cache: ConfigCache | None = None, render_cache: RenderCache | None = None) -> None:
+        """
+        :param paths: Paths to config files.
+        :type paths: list[str]
+        :param cache: Cache for parsed configs and compiled templates.
+        :type cache: ConfigCache or None
+        :param render_cache: Cache for render results shared by all configs. Defaults to an in-memory `RenderCache`.
+        :type render_cache: RenderCache or None
+        """
+        self.cache = cache
+        self.render_cache = render_cache if render_cache is not None else RenderCache()
+        self.configs = {}
+        for path in paths:
+            name = _config_name(path)
+            unique_name = name
+            counter = 1
+            while unique_name in self.configs:
+                counter += 1
+                unique_name = f"{name}-{counter}"
+            self.configs[unique_name] = _ServedConfig(path, cache, self.render_cache)
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def metrics(self) -> dict:
+        """
+        Returns request count, latency percentiles in milliseconds and cache statistics.
+
+        :return: Metrics.
+        :rtype: dict
+        """
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": {
+                "p50": _percentile(latencies, 0.5) * 1000,
+                "p90": _percentile(latencies, 0.9) * 1000,
+                "p99": _percentile(latencies, 0.99) * 1000,
+                "max": (latencies[-1] if latencies else 0.0) * 1000,
+            },
+            "reloads": sum(config.reloads for config in self.configs.values()),
+            "render_cache": self.render_cache.stats(),
+            "config_cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[HTTPStatus, object]:
+        """
+        Routes a request and returns status and json response.
+
+        :param method: HTTP method.
+        :type method: str
+        :param path: Request path without query.
+        :type path: str
+        :param body: Request body.
+        :type body: bytes
+        :return: Status and json serializable response.
+        :rtype: tuple[http.HTTPStatus, object]
+        """
+        parts = [part for part in path.split("/") if part]
+        if method == "GET" and parts == ["metrics"]:
+            return (HTTPStatus.OK, self.metrics())
+        if method == "GET" and parts == ["configs"]:
+            return (HTTPStatus.OK, {
+                name: {"path": config.path, "$id": config.instruction.schema.get("$id", "")}
+                for (name, config) in self.configs.items()
+            })
+        if len(parts) != 3 or parts[0] != "configs":
+            return (HTTPStatus.NOT_FOUND, {"error": f"{path} not found."})
+        config = self.configs.get(parts[1])
+        if config is None:
+            return (HTTPStatus.NOT_FOUND, {"error": f"Config {parts[1]} not found."})
+
+        try:
+            config.reload()
+        except Exception as e:
+            return (HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Reloading config failed: {e}"})
+
+        if method == "GET" and parts[2] == "schema":
+            return (HTTPStatus.OK, config.instruction.parse_schema())
+        if method == "POST" and parts[2] == "choices":
+            try:
+                partial = json.loads(body or b"{}")
+                if not isinstance(partial, dict):
+                    return (HTTPStatus.BAD_REQUEST, {"error": "Body is not a json object."})
+                return (HTTPStatus.OK, {"choices": config.instruction.valid_choices(partial)})
+            except ValueError as e:
+                return (HTTPStatus.BAD_REQUEST, {"error": f"Body is not valid json: {e}"})
+            except Exception as e:
+                return (HTTPStatus.BAD_REQUEST, {"error": str(e)})
+        if method == "POST" and parts[2] == "render":
+            try:
+                input = json.loads(body or b"{}")
+            except ValueError as e:
+                return (HTTPStatus.BAD_REQUEST, {"error": f"Body is not valid json: {e}"})
+            if not isinstance(input, dict):
+                return (HTTPStatus.BAD_REQUEST, {"error": "Body is not a json object."})
+            if errors := config.instruction.validate(input):
+                return (HTTPStatus.BAD_REQUEST, {"error": "Invalid input.", "errors": [e.message for e in errors]})
+            (instructions, is_error) = config.instruction._render_memoized(input)
+            return (HTTPStatus.OK, {"instructions": _strip_step_markers(instructions), "error": is_error})
+        return (HTTPStatus.NOT_FOUND, {"error": f"{path} not found."})
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = perf_counter()
+                try:
+                    (method, target, version) = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    (name, _, value) = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = headers.get("content-length", "0")
+                body = None
+                if not length.isdigit():
+                    (status, response) = (HTTPStatus.BAD_REQUEST, {"error": "Invalid Content-Length."})
+                elif int(length) > MAX_BODY_SIZE:
+                    (status, response) = (HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Body too large."})
+                else:
+                    body = await reader.readexactly(int(length)) if int(length) else b""
+                    try:
+                        # Rendering and building choice tables take long for large configs, they run in a thread
+                        # so other connections are served meanwhile.
+                        (status, response) = await asyncio.get_running_loop().run_in_executor(None, self.handle, method, target.split("?")[0], body)
+                    except Exception as e:
+                        (status, response) = (HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+
+                keep_alive = body is not None and (
+                    headers.get("connection", "").lower() == "keep-alive" if version == "HTTP/1.0"
+                    else headers.get("connection", "").lower() != "close"
+                )
+                data = json.dumps(response).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+
+                self.requests += 1
+                if status.value >= 400:
+                    self.errors += 1
+                self.latencies.append(perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000) -> asyncio.Server:
+        """
+        Starts serving in the running event loop.
+
+        :param host: Host to bind to.
+        :type host: str
+        :param port: Port to bind to, 0 picks a free port.
+        :type port: int
+        :return: The asyncio server.
+        :rtype: asyncio.Server
+        """
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8000) -> None:
+        """
+        Serves until cancelled.
+
+        :param host: Host to bind to.
+        :type host: str
+        :param port: Port to bind to.
+        :type port: int
+        """
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
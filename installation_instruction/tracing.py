@@ -0,0 +1,267 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Spans timing the phases of loading, validating, rendering and installing.
+
+Code marks a phase with `with span("name"):`. Hooks added with `add_hook` are called when a span starts and ends.
+Without hooks `span` returns a shared object doing nothing, so instrumented code costs one function call per phase.
+
+`Timings` sums up the time per phase for `ibi --timings`, `ChromeTrace` writes trace event json for `ibi --trace FILE`,
+which can be opened in `chrome://tracing` or https://ui.perfetto.dev.
+"""
+
+from time import perf_counter_ns
+from typing import Iterable, Iterator
+import json
+import os
+import threading
+
+
+class Span:
+    """
+    A phase with a name, arguments, start and end time in nanoseconds and the thread it ran in.
+
+    `duration` is the time spent in the phase. It is `end - start`, except for spans of `iter_span`
+    which only count the time spent producing items.
+    """
+
+    __slots__ = ("name", "args", "start", "end", "duration", "thread_id")
+
+    def __init__(self, name: str, args: dict) -> None:
+        self.name = name
+        self.args = args
+        self.start = None
+        self.end = None
+        self.duration = None
+        self.thread_id = threading.get_ident()
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        for hook in _hooks:
+            hook.span_start(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.end = perf_counter_ns()
+        if self.duration is None:
+            self.duration = self.end - self.start
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        for hook in _hooks:
+            hook.span_end(self)
+
+
+class _NullSpan:
+    """
+    Span returned while no hook is added.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+
+class Hook:
+    """
+    Base class of hooks. Hooks are called from the thread the span runs in.
+    Spans of `iter_span` are started and ended at once after their last item.
+    """
+
+    def span_start(self, span: Span) -> None:
+        pass
+
+    def span_end(self, span: Span) -> None:
+        pass
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Adds a hook, which is called for all spans started afterwards.
+
+    :param hook: Hook to add.
+    :type hook: Hook
+    """
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+
+def remove_hook(hook: Hook) -> None:
+    """
+    Removes a hook added with `add_hook`.
+
+    :param hook: Hook to remove.
+    :type hook: Hook
+    """
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(added for added in _hooks if added is not hook)
+
+def is_enabled() -> bool:
+    """
+    Returns True if a hook is added.
+    """
+    return bool(_hooks)
+
+
+def span(name: str, /, **args) -> Span | _NullSpan:
+    """
+    Returns a context manager timing a phase.
+
+    :param name: Name of the phase.
+    :type name: str
+    :param args: Arguments shown in traces, should be json serializable.
+    :return: Span, or a shared span doing nothing if no hook is added.
+    :rtype: Span
+    """
+    if not _hooks:
+        return _NULL_SPAN
+    return Span(name, args)
+
+def iter_span(name: str, iterable: Iterable, /, **args) -> Iterator:
+    """
+    Times producing the items of an iterable, e.g. of a template rendered while its output is consumed.
+    The span lasts from the first to the last item, but its duration only counts the time spent producing items.
+
+    :param name: Name of the phase.
+    :type name: str
+    :param iterable: Iterable to time.
+    :type iterable: Iterable
+    :return: Iterator over the items, `iterable` itself if no hook is added.
+    :rtype: Iterator
+    """
+    if not _hooks:
+        return iter(iterable)
+    return _iter_span(Span(name, args), iter(iterable))
+
+def _iter_span(span: Span, iterator: Iterator) -> Iterator:
+    """
+    Other code runs between the items, so hooks are called for the start and the end of the span after the last item.
+    """
+    busy = 0
+    try:
+        while True:
+            start = perf_counter_ns()
+            if span.start is None:
+                span.start = start
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                busy += perf_counter_ns() - start
+            yield item
+    except Exception as e:
+        span.args["error"] = type(e).__name__
+        raise
+    finally:
+        span.end = perf_counter_ns()
+        span.duration = busy
+        if span.start is None:
+            span.start = span.end
+        for hook in _hooks:
+            hook.span_start(span)
+        for hook in _hooks:
+            hook.span_end(span)
+
+
+class Timings(Hook):
+    """
+    Sums up the duration and count of spans per name and nesting.
+    """
+
+    def __init__(self) -> None:
+        self.phases = {}
+        self._order = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span_start(self, span: Span) -> None:
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(span.name)
+        path = tuple(stack)
+        with self._lock:
+            self._order.setdefault(path, len(self._order))
+
+    def span_end(self, span: Span) -> None:
+        stack = self._local.stack
+        path = tuple(stack)
+        stack.pop()
+        with self._lock:
+            (count, total) = self.phases.get(path, (0, 0))
+            self.phases[path] = (count + 1, total + span.duration)
+
+    def format(self) -> str:
+        """
+        Returns a table of the phases, nested phases are indented below their parent.
+
+        :return: Table with the columns phase, count and time.
+        :rtype: str
+        """
+        with self._lock:
+            phases = dict(self.phases)
+            order = dict(self._order)
+        rows = [("Phase", "Count", "Time")]
+        for path in sorted(phases, key=lambda path: [order[path[:depth]] for depth in range(1, len(path) + 1)]):
+            (count, total) = phases[path]
+            rows.append(("  " * (len(path) - 1) + path[-1], str(count), f"{total / 1e6:.1f} ms"))
+        width = [max(len(row[column]) for row in rows) for column in range(3)]
+        return "\n".join(f"{name:<{width[0]}}  {count:>{width[1]}}  {time:>{width[2]}}" for (name, count, time) in rows)
+
+
+class ChromeTrace(Hook):
+    """
+    Collects spans as complete events of the chrome trace event format.
+    """
+
+    def __init__(self) -> None:
+        self.events = []
+        self._lock = threading.Lock()
+
+    def span_end(self, span: Span) -> None:
+        event = {
+            "name": span.name,
+            "ph": "X",
+            "ts": span.start / 1e3,
+            "dur": (span.end - span.start) / 1e3,
+            "pid": os.getpid(),
+            "tid": span.thread_id,
+        }
+        if span.duration != span.end - span.start:
+            span.args["busy_ms"] = span.duration / 1e6
+        if span.args:
+            event["args"] = span.args
+        with self._lock:
+            self.events.append(event)
+
+    def write(self, path: str) -> None:
+        """
+        Writes the collected events as json.
+
+        :param path: Path of the trace file.
+        :type path: str
+        """
+        with self._lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file, default=str)
@@ -0,0 +1,251 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compiles a json schema into a specialized python validation function.
+
+Only the keywords used by typical configs (`type`, `enum`, `const`, `required`, `properties`,
+`additionalProperties` and `default`) are compiled. Schemas using any other validation keyword
+are validated by a cached `Draft202012Validator`.
+The generated function reports the same errors as `jsonschema`.
+"""
+
+from collections import deque
+from collections.abc import Mapping, Sequence
+from copy import deepcopy
+from numbers import Number
+from typing import Any, Callable
+
+from jsonschema import Draft202012Validator
+from jsonschema.exceptions import ValidationError
+
+
+SUPPORTED_KEYWORDS = {"type", "enum", "const", "required", "properties", "additionalProperties"}
+UNSUPPORTED_KEYWORDS = set(Draft202012Validator.VALIDATORS) - SUPPORTED_KEYWORDS
+
+TYPE_CHECKS = {
+    "array": "isinstance({0}, list)",
+    "boolean": "isinstance({0}, bool)",
+    "integer": "(isinstance({0}, int) and not isinstance({0}, bool) or isinstance({0}, float) and {0}.is_integer())",
+    "null": "{0} is None",
+    "number": "(isinstance({0}, _Number) and not isinstance({0}, bool))",
+    "object": "isinstance({0}, dict)",
+    "string": "isinstance({0}, str)",
+}
+
+IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+
+
+def _is_supported(schema: Any) -> bool:
+    """
+    Checks recursively if a schema only uses keywords that can be compiled.
+
+    :param schema: Json schema or subschema.
+    :type schema: Any
+    :return: True if the schema can be compiled.
+    :rtype: bool
+    """
+    if not isinstance(schema, dict):
+        return False
+    if UNSUPPORTED_KEYWORDS.intersection(schema):
+        return False
+    types = schema.get("type", [])
+    for type in types if isinstance(types, list) else [types]:
+        if type not in TYPE_CHECKS:
+            return False
+    for subschema in schema.get("properties", {}).values():
+        if not _is_supported(subschema):
+            return False
+    additional = schema.get("additionalProperties", True)
+    if not isinstance(additional, bool) and not _is_supported(additional):
+        return False
+    return True
+
+
+def _equal(one: Any, two: Any) -> bool:
+    """
+    Equality as defined by json schema, where booleans are not equal to numbers.
+    """
+    if one is two:
+        return True
+    if isinstance(one, str) or isinstance(two, str):
+        return one == two
+    if isinstance(one, Sequence) and isinstance(two, Sequence):
+        return len(one) == len(two) and all(_equal(i, j) for (i, j) in zip(one, two))
+    if isinstance(one, Mapping) and isinstance(two, Mapping):
+        return len(one) == len(two) and all(key in two and _equal(value, two[key]) for (key, value) in one.items())
+    if isinstance(one, bool) or isinstance(two, bool):
+        return isinstance(one, bool) and isinstance(two, bool) and one == two
+    return one == two
+
+
+def _error(message: str, keyword: str, path: tuple, schema_path: tuple, instance: Any, schema: dict) -> ValidationError:
+    return ValidationError(
+        message,
+        validator=keyword,
+        path=deque(path),
+        schema_path=deque(schema_path + (keyword,)),
+        validator_value=schema[keyword],
+        instance=instance,
+        schema=schema,
+        type_checker=Draft202012Validator.TYPE_CHECKER,
+    )
+
+
+def _extras_message(extras: list) -> str:
+    verb = "was" if len(extras) == 1 else "were"
+    return "Additional properties are not allowed (%s %s unexpected)" % (", ".join(repr(extra) for extra in extras), verb)
+
+
+class _CodeGenerator:
+    """
+    Generates the source code of a validation function for a supported schema.
+    """
+
+    def __init__(self, use_default: bool) -> None:
+        self.use_default = use_default
+        self.lines = []
+        self.constants = {}
+        self.counter = 0
+
+    def constant(self, value: Any) -> str:
+        name = f"_c{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def variable(self) -> str:
+        self.counter += 1
+        return f"v{self.counter}"
+
+    def emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def error(self, indent: int, message: str, keyword: str, path: str, schema_path: tuple, var: str, schema_name: str) -> None:
+        self.emit(indent, f"errors.append(_error({message}, {keyword!r}, {path}, {schema_path!r}, {var}, {schema_name}))")
+
+    def generate(self, schema: dict, var: str, path: str, schema_path: tuple, indent: int) -> None:
+        """
+        Emits checks for `var` against `schema`. `path` is the source code of a tuple holding the path to `var`.
+        """
+        schema_name = self.constant(schema)
+
+        if "type" in schema:
+            types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+            checks = " or ".join(TYPE_CHECKS[type].format(var) for type in types) or "False"
+            reprs = ", ".join(repr(type) for type in types)
+            self.emit(indent, f"if not ({checks}):")
+            self.error(indent + 1, f"f'{{{var}!r}} is not of type ' + {reprs!r}", "type", path, schema_path, var, schema_name)
+
+        if "enum" in schema:
+            enums = schema["enum"]
+            if enums and all(isinstance(e, str) for e in enums):
+                values = self.constant(frozenset(enums))
+                self.emit(indent, f"if not isinstance({var}, str) or {var} not in {values}:")
+            else:
+                values = self.constant(enums)
+                self.emit(indent, f"if not any(_equal(e, {var}) for e in {values}):")
+            self.error(indent + 1, f"f'{{{var}!r}} is not one of {{{schema_name}[\"enum\"]!r}}'", "enum", path, schema_path, var, schema_name)
+
+        if "const" in schema:
+            const = self.constant(schema["const"])
+            self.emit(indent, f"if not _equal({var}, {const}):")
+            self.error(indent + 1, f"f'{{{const}!r}} was expected'", "const", path, schema_path, var, schema_name)
+
+        if not ({"required", "properties", "additionalProperties"} & set(schema) or self.use_default):
+            return
+        self.emit(indent, f"if isinstance({var}, dict):")
+        indent += 1
+        self.emit(indent, "pass")
+
+        for property in schema.get("required", []):
+            self.emit(indent, f"if {property!r} not in {var}:")
+            self.error(indent + 1, repr(f"{property!r} is a required property"), "required", path, schema_path, var, schema_name)
+
+        properties = schema.get("properties", {})
+        for (property, subschema) in properties.items():
+            child = self.variable()
+            self.emit(indent, f"if {property!r} in {var}:")
+            self.emit(indent + 1, f"{child} = {var}[{property!r}]")
+            self.generate(subschema, child, f"{path} + ({property!r},)", schema_path + ("properties", property), indent + 1)
+            if self.use_default and "default" in subschema:
+                default = self.constant(subschema["default"])
+                self.emit(indent, "else:")
+                if isinstance(subschema["default"], IMMUTABLE_TYPES):
+                    self.emit(indent + 1, f"{var}[{property!r}] = {default}")
+                else:
+                    self.emit(indent + 1, f"{var}[{property!r}] = _deepcopy({default})")
+
+        if "additionalProperties" in schema:
+            additional = schema["additionalProperties"]
+            known = self.constant(frozenset(properties))
+            extra = self.variable()
+            if additional is False:
+                self.emit(indent, f"{extra} = [key for key in {var} if key not in {known}]")
+                self.emit(indent, f"if {extra}:")
+                self.error(indent + 1, f"_extras_message(sorted({extra}, key=str))", "additionalProperties", path, schema_path, var, schema_name)
+            elif isinstance(additional, dict):
+                child = self.variable()
+                self.emit(indent, f"for {extra} in [key for key in {var} if key not in {known}]:")
+                self.emit(indent + 1, f"{child} = {var}[{extra}]")
+                self.generate(additional, child, f"{path} + ({extra},)", schema_path + ("additionalProperties",), indent + 1)
+
+    def source(self) -> str:
+        return "\n".join(["def validate(data):", "    errors = []"] + self.lines + ["    return errors"])
+
+
+def compile_validator(schema: dict, use_default: bool = False) -> Callable[[Any], list[ValidationError]]:
+    """
+    Compiles a json schema into a function returning a list of all validation errors of an instance.
+
+    If the schema uses keywords which are not supported, the function is backed by a `Draft202012Validator`.
+    The schema itself is not checked, this should be done with `Draft202012Validator.check_schema` beforehand.
+
+    :param schema: Json schema.
+    :type schema: dict
+    :param use_default: Sets missing properties to their `default` in place, after validating them.
+    :type use_default: bool
+    :return: Function returning a list of `jsonschema.exceptions.ValidationError`.
+    :rtype: Callable[[Any], list[ValidationError]]
+    """
+    if not _is_supported(schema):
+        validator = Draft202012Validator(schema)
+        if not use_default:
+            return lambda instance: list(validator.iter_errors(instance))
+
+        defaults = compile_validator(
+            {"properties": {
+                key: {"default": value["default"]}
+                for (key, value) in schema.get("properties", {}).items()
+                if isinstance(value, dict) and "default" in value
+            }},
+            use_default=True,
+        )
+        def validate(instance):
+            errors = list(validator.iter_errors(instance))
+            defaults(instance)
+            return errors
+        return validate
+
+    generator = _CodeGenerator(use_default)
+    generator.generate(schema, "data", "()", (), 1)
+    namespace = {
+        "_error": _error,
+        "_extras_message": _extras_message,
+        "_equal": _equal,
+        "_deepcopy": deepcopy,
+        "_Number": Number,
+        **generator.constants,
+    }
+    exec(compile(generator.source(), "<installation_instruction.validator>", "exec"), namespace)
+    return namespace["validate"]
@@ -0,0 +1,111 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from installation_instruction.cache import RenderCache
+from installation_instruction.installation_instruction import InstallationInstruction
+from installation_instruction.matrix import count_combinations, render_matrix
+
+
+CONFIG = r"""
+type: object
+properties:
+   os:
+      enum: [linux, windows]
+   shell:
+      enum: [bash, zsh, fish]
+   verbose:
+      type: boolean
+   unused:
+      enum: [a, b, c]
+      default: a
+   gpu:
+      type: boolean
+------
+{% if os == "linux" %}
+    echo {{ shell }}
+{% endif %}
+{% if verbose %}
+    echo done
+{% else %}
+    echo    done
+{% endif %}
+{{ "x" if gpu else "x" }}
+{{ raise(message) if undeclared_flag }}
+"""
+
+
+def test_dependencies():
+    install = InstallationInstruction(CONFIG)
+    dependencies = install.dependencies()
+
+    assert dependencies["properties"]["os"] == {
+        "referenced": True,
+        "in_output": False,
+        "in_condition": True,
+        "influences_output": True,
+    }
+    assert dependencies["properties"]["shell"]["in_output"]
+    assert dependencies["properties"]["verbose"]["referenced"]
+    assert not dependencies["properties"]["verbose"]["influences_output"]
+    assert not dependencies["properties"]["gpu"]["influences_output"]
+    assert not dependencies["properties"]["unused"]["referenced"]
+    assert dependencies["undeclared"] == ["message", "undeclared_flag"]
+    assert dependencies["raises"]
+
+
+def test_dependencies_of_example():
+    install = InstallationInstruction.from_file("examples/pytorch/pytorch-instruction.schema.yml.jinja")
+    properties = install.dependencies()["properties"]
+    assert all(dependency["influences_output"] for dependency in properties.values())
+    assert install.dependencies()["undeclared"] == []
+    assert install.dependencies()["raises"]
+    assert not InstallationInstruction("type: object\n------\necho one").dependencies()["raises"]
+
+
+def test_collapsed_matrix():
+    install = InstallationInstruction(CONFIG)
+    assert count_combinations(install) == 2 * 3 * 2 * 3 * 2
+    assert count_combinations(install, collapse=True) == 2 * 3
+
+    for (input, instructions, _is_error) in render_matrix(install, collapse=True):
+        assert input["unused"] == "a"
+        assert input["verbose"] is False
+        assert instructions == install.validate_and_render(input)[0]
+
+
+def test_memoization_ignores_irrelevant_properties():
+    install = InstallationInstruction(CONFIG)
+    install.render_cache = RenderCache()
+
+    install.validate_and_render({"os": "linux", "shell": "zsh", "verbose": True, "gpu": False})
+    install.validate_and_render({"os": "linux", "shell": "zsh", "verbose": False, "gpu": True, "unused": "c"})
+    assert install.render_cache.stats()["hits"] == 1
+
+
+def test_property_named_like_a_macro_is_in_memoization_key():
+    install = InstallationInstruction("type: object\nproperties:\n  step:\n    type: string\n------\necho {{ step }}")
+    install.render_cache = RenderCache()
+
+    assert install.dependencies()["properties"]["step"]["influences_output"]
+    assert install.validate_and_render({"step": "one"}) == (["echo one"], False)
+    assert install.validate_and_render({"step": "two"}) == (["echo two"], False)
+
+
+def test_memoized_render_uses_given_input():
+    config = "type: object\nproperties:\n  name:\n    type: string\n    default: x\n------\necho {{ name is defined }}"
+    expected = InstallationInstruction(config).validate_and_render({})
+    install = InstallationInstruction(config)
+    install.render_cache = RenderCache()
+    assert install.validate_and_render({}) == expected
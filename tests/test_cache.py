@@ -0,0 +1,147 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+from installation_instruction.cache import ConfigCache, RenderCache
+from installation_instruction.environment import configure_environment
+from installation_instruction.installation_instruction import InstallationInstruction
+
+
+CONFIG = r"""
+type: object
+properties:
+   err:
+      type: boolean
+------
+something
+{{ raise("test message") if err }}
+"""
+
+
+def test_second_load_hits_cache(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+
+    first = InstallationInstruction(CONFIG, cache)
+    first.template
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["bytecode_misses"] == 1
+
+    second = InstallationInstruction(CONFIG, cache)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["bytecode_hits"] == 0
+    # drops compiled templates held in memory, like a new process
+    configure_environment()
+    second.template
+    assert cache.stats()["bytecode_hits"] == 1
+
+    assert second.schema == first.schema
+    assert second.validate_and_render({"err": True}) == (["test message"], True)
+    assert second.validate_and_render({"err": False}) == (["something"], False)
+
+
+def test_changed_config_misses_cache(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+    InstallationInstruction(CONFIG, cache)
+    InstallationInstruction(CONFIG.replace("something", "other"), cache)
+    assert cache.stats()["hits"] == 0
+    assert cache.stats()["misses"] == 2
+
+
+def test_header_which_is_not_json_is_not_cached(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+    config = "type: object\nproperties:\n  day:\n    default: 2024-01-01\n------\necho {{ day }}"
+    for _ in range(2):
+        install = InstallationInstruction(config, cache)
+        assert install.validate_and_render({"day": install.schema["properties"]["day"]["default"]}) == (["echo 2024-01-01"], False)
+    assert cache.stats()["hits"] == 0
+    assert not cache.set("key", {"schema": {1: "one"}, "misc": {}, "template": ""})
+
+
+def test_concurrent_writes(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache = ConfigCache(str(tmp_path), max_size=4096)
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda i: cache.set(str(i % 4), {"schema": {}, "misc": {}, "template": "x" * i}), range(200)))
+    assert cache.get("0") is not None
+
+
+def test_invalidate(tmp_path):
+    cache = ConfigCache(str(tmp_path))
+    InstallationInstruction(CONFIG, cache)
+    cache.invalidate(cache.key(CONFIG))
+    assert os.listdir(tmp_path) == []
+
+    InstallationInstruction(CONFIG, cache)
+    assert cache.stats()["hits"] == 0
+    assert cache.stats()["misses"] == 2
+
+
+def test_lru_eviction(tmp_path):
+    cache = ConfigCache(str(tmp_path), max_size=1)
+    InstallationInstruction(CONFIG, cache)
+    assert cache.stats()["evictions"] > 0
+    assert cache.get(cache.key(CONFIG)) is None
+
+
+DEFAULTS_CONFIG = r"""
+type: object
+properties:
+   os:
+      enum: [linux, windows]
+      default: linux
+   err:
+      type: boolean
+------
+{{ os }}
+{{ raise("test message") if err }}
+"""
+
+
+def test_render_cache_memory_tier():
+    install = InstallationInstruction(DEFAULTS_CONFIG)
+    install.render_cache = RenderCache(maxsize=2)
+
+    assert install.validate_and_render({"err": False, "os": "linux"}) == (["linux"], False)
+    assert install.validate_and_render({"os": "linux", "err": False}) == (["linux"], False)
+    assert install.render_cache.stats()["hits"] == 1
+
+    assert install.validate_and_render({"err": True}) == (["test message"], True)
+    assert install.validate_and_render({"err": True}) == (["test message"], True)
+    assert install.render_cache.stats()["hits"] == 2
+
+    install.validate_and_render({"err": False, "os": "windows"})
+    assert install.render_cache.stats()["evictions"] == 1
+    assert install.render_cache.stats()["size"] == 2
+
+
+def test_render_cache_disk_tier(tmp_path):
+    first = InstallationInstruction(DEFAULTS_CONFIG)
+    first.render_cache = RenderCache(directory=str(tmp_path))
+    first.validate_and_render({"err": False, "os": "windows"})
+
+    second = InstallationInstruction(DEFAULTS_CONFIG)
+    second.render_cache = RenderCache(directory=str(tmp_path))
+    assert second.validate_and_render({"os": "windows", "err": False}) == (["windows"], False)
+    assert second.render_cache.stats()["disk_hits"] == 1
+
+    changed = InstallationInstruction(DEFAULTS_CONFIG.replace("{{ os }}", "os: {{ os }}"))
+    changed.render_cache = second.render_cache
+    assert changed.validate_and_render({"os": "windows", "err": False}) == (["os: windows"], False)
+
+    second.invalidate_render_cache()
+    assert len(os.listdir(tmp_path)) == 1
+    assert second.render_cache.stats()["size"] == 1
@@ -0,0 +1,135 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from itertools import product
+
+import pytest
+
+from installation_instruction.cache import ConfigCache
+from installation_instruction.choices import ChoiceTable
+from installation_instruction.installation_instruction import InstallationInstruction
+
+
+PYTORCH = "examples/pytorch/pytorch-instruction.schema.yml.jinja"
+
+CONFIG = """
+type: object
+properties:
+  os:
+    enum: [linux, mac]
+    default: linux
+  gpu:
+    type: boolean
+    default: false
+  verbose:
+    type: boolean
+    default: false
+------
+{% if os == "mac" and gpu %}
+    {{ raise("No gpu on mac.") }}
+{% endif %}
+echo {{ os }}
+"""
+
+
+def _brute_force(instruction, partial):
+    properties = instruction.schema["properties"]
+    options = {
+        key: value["enum"] if "enum" in value else [False, True]
+        for (key, value) in properties.items()
+        if "enum" in value or value.get("type") == "boolean"
+    }
+    choices = {key: [] for key in options if key not in partial}
+    for values in product(*options.values()):
+        input = dict(zip(options, values))
+        if any(input[key] != value for (key, value) in partial.items()):
+            continue
+        if not instruction._validate_and_render_without_raising(input)[1]:
+            for key in choices:
+                if input[key] not in choices[key]:
+                    choices[key].append(input[key])
+    return {key: [value for value in options[key] if value in values] for (key, values) in choices.items()}
+
+
+@pytest.mark.parametrize("partial", [
+    {},
+    {"__os__": "macos"},
+    {"compute_platform": "ro60"},
+    {"compute_platform": "ro60", "__os__": "windows"},
+    {"build": "preview", "package": "conda"},
+])
+def test_valid_choices_match_rendering(partial):
+    instruction = InstallationInstruction.from_file(PYTORCH)
+    assert instruction.valid_choices(partial) == _brute_force(instruction, partial)
+
+
+def test_options_not_influencing_output():
+    instruction = InstallationInstruction(CONFIG)
+    assert instruction.valid_choices({}) == {"os": ["linux", "mac"], "gpu": [False, True], "verbose": [False, True]}
+    assert instruction.valid_choices({"os": "mac"}) == {"gpu": [False], "verbose": [False, True]}
+    assert instruction.valid_choices({"os": "mac", "gpu": True}) == {"verbose": []}
+
+    with pytest.raises(Exception):
+        instruction.valid_choices({"os": "win"})
+    with pytest.raises(Exception):
+        instruction.valid_choices({"verbose": "yes"})
+
+
+def test_missing_required_property_does_not_exclude_choices():
+    config = CONFIG.replace("------", """  name:
+    type: string
+required: [name]
+if:
+  properties:
+    os:
+      const: linux
+then:
+  properties:
+    gpu:
+      const: false
+------""", 1)
+    instruction = InstallationInstruction(config)
+    assert instruction.validate({"os": "linux", "gpu": True})
+
+    assert instruction.valid_choices({"os": "linux"}) == {"gpu": [False], "verbose": [False, True]}
+    assert instruction.valid_choices({"os": "mac"}) == {"gpu": [False], "verbose": [False, True]}
+
+
+def test_choice_table_is_cached(tmp_path, monkeypatch):
+    cache = ConfigCache(str(tmp_path))
+    expected = InstallationInstruction(CONFIG, cache).valid_choices({"os": "mac"})
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Choice table was built again.")
+    monkeypatch.setattr(ChoiceTable, "from_instruction", fail)
+    assert InstallationInstruction(CONFIG, cache).valid_choices({"os": "mac"}) == expected
+
+
+def test_choice_table_with_values_which_are_not_json_is_not_cached(tmp_path):
+    config = """
+type: object
+properties:
+  release:
+    enum: [2024-01-01, 2024-06-01]
+    default: 2024-01-01
+------
+{% if release.month == 6 %}
+    {{ raise("Not released yet.") }}
+{% endif %}
+install {{ release }}
+"""
+    cache = ConfigCache(str(tmp_path))
+    choices = InstallationInstruction(config, cache).valid_choices({})
+    assert [str(value) for value in choices["release"]] == ["2024-01-01"]
+    assert InstallationInstruction(config, cache).valid_choices({}) == choices
@@ -0,0 +1,90 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import subprocess
+import sys
+
+
+def _imported_modules(*args):
+    """
+    Returns the top level names of all modules imported by running the cli with `-X importtime`.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-m", "installation_instruction", *args], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("| package"):
+            continue
+        modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return modules
+
+
+def test_help_does_not_import_heavy_modules():
+    modules = _imported_modules("--help")
+    assert "installation_instruction" in modules
+    assert not {"git", "jsonschema", "jinja2", "yaml"} & modules
+
+
+def test_show_local_file_does_not_import_git():
+    modules = _imported_modules("show", "tests/data/test_install/install.cfg", "--help")
+    assert "jsonschema" in modules
+    assert "git" not in modules
+
+
+def test_help_and_default_do_not_import_jinja(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path))
+    assert "jinja2" not in _imported_modules("show", "tests/data/test_install/install.cfg", "--help")
+    assert "jinja2" not in _imported_modules("default", "list", "tests/data/test_install/install.cfg")
+
+
+RAISING_CONFIG = """
+type: object
+properties:
+  flag:
+    type: string
+    default: ""
+------
+echo first
+touch {{ flag }}
+{{ raise("template error") }}
+"""
+
+
+def test_nothing_is_installed_if_the_template_raises(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config = tmp_path / "install.cfg"
+    config.write_text(RAISING_CONFIG)
+    flag = tmp_path / "flag"
+
+    result = subprocess.run([sys.executable, "-m", "installation_instruction", "install", str(config), "--flag", str(flag)], capture_output=True, text=True)
+    assert result.returncode == 1
+    assert result.stdout == "Error: template error\n"
+    assert not flag.exists()
+
+    result = subprocess.run([sys.executable, "-m", "installation_instruction", "show", str(config), "--flag", str(flag)], capture_output=True, text=True)
+    assert result.returncode == 1
+    assert result.stdout == f"echo first\ntouch {flag}\nError: template error\n"
+
+
+def test_install_starts_before_rendering_finished(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    config = tmp_path / "install.cfg"
+    config.write_text(RAISING_CONFIG.replace("touch {{ flag }}", '{% call step("touch") %}touch {{ flag }}{% endcall %}').replace('{{ raise("template error") }}', "{{ missing.attribute }}"))
+    flag = tmp_path / "flag"
+
+    result = subprocess.run([sys.executable, "-m", "installation_instruction", "install", str(config), "--flag", str(flag)], capture_output=True, text=True)
+    assert result.returncode == 1
+    assert "missing" in result.stdout
+    assert flag.exists()
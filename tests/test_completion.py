@@ -0,0 +1,143 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import shutil
+
+import pytest
+from click.testing import CliRunner
+
+from installation_instruction import completion, helpers, http_cache
+from installation_instruction.__main__ import main
+from installation_instruction.completion import OptionIndex, _option_specs, _options_from_specs
+from installation_instruction.get_flags_and_options_from_schema import _get_flags_and_options
+from installation_instruction.installation_instruction import InstallationInstruction
+
+
+PYTORCH = "examples/pytorch/pytorch-instruction.schema.yml.jinja"
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = OptionIndex(str(tmp_path / "completion"))
+    monkeypatch.setattr(completion, "_default_option_index", index)
+    yield index
+    index.close()
+
+
+def _complete(*words):
+    """
+    Returns the completions of bash for the last word.
+    """
+    env = {"_IBI_COMPLETE": "bash_complete", "COMP_WORDS": " ".join(("ibi",) + words), "COMP_CWORD": str(len(words))}
+    result = CliRunner().invoke(main, [], prog_name="ibi", env=env)
+    return [line.split(",", 1)[1] for line in result.output.splitlines()]
+
+
+def test_index(tmp_path):
+    index = OptionIndex(str(tmp_path), max_entries=3)
+    index.set("show", "https://example.org/a.git", "1", [{"decls": ["--a"]}])
+    index.set("add", "https://example.org/a.git", "1", [{"decls": ["--b"]}])
+    index.set("show", "https://example.org/b.git", "1", [])
+    assert index.get("show", "https://example.org/a.git", "1") == [{"decls": ["--a"]}]
+    assert index.get("show", "https://example.org/a.git", "2") is None
+    assert index.get("show", "https://example.org/a.git") == [{"decls": ["--a"]}]
+    assert index.get("add", "https://example.org/a.git") == [{"decls": ["--b"]}]
+    assert index.get("install", "https://example.org/a.git") is None
+    assert index.sources("https://") == ["https://example.org/a.git", "https://example.org/b.git"]
+
+    index.set("show", "/configs/c", "1", [])
+    assert index.get("show", "https://example.org/a.git") is None
+    assert index.get("add", "https://example.org/a.git") == [{"decls": ["--b"]}]
+    index.close()
+
+
+def test_option_specs_round_trip():
+    instruction = InstallationInstruction.from_file("tests/data/test_install/install.cfg")
+    (options, _defaults) = _get_flags_and_options(instruction.schema_model)
+    restored = _options_from_specs(_option_specs(options))
+
+    assert [(option.opts, option.secondary_opts, option.is_flag) for option in restored] == [(option.opts, option.secondary_opts, option.is_flag) for option in options]
+    assert list(restored[2].type.choices) == ["Windows", "macOS", "Linux"]
+
+
+def test_complete_options_and_choices(index):
+    assert _complete("show", PYTORCH, "--") == ["--build", "----os--", "--package", "--compute-platform", "--help"]
+    assert _complete("show", PYTORCH, "--compute-platform", "") == ["cu118", "cu121", "ro60", "cpu"]
+    assert _complete("default", "add", PYTORCH, "--pa") == ["--package"]
+
+
+def test_complete_uses_index_until_config_changes(tmp_path, index, monkeypatch):
+    config = tmp_path / "install.cfg"
+    shutil.copy("tests/data/test_install/install.cfg", config)
+    assert "--os" in _complete("show", str(tmp_path), "--")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("config was parsed again")
+    monkeypatch.setattr(InstallationInstruction, "__init__", fail)
+    assert "--os" in _complete("show", str(tmp_path), "--")
+
+    monkeypatch.undo()
+    monkeypatch.setattr(completion, "_default_option_index", index)
+    config.write_text(config.read_text().replace("  os:", "  platform:"))
+    assert "--platform" in _complete("show", str(tmp_path), "--")
+
+
+def test_complete_indexed_git_url_without_fetching(index, monkeypatch):
+    instruction = InstallationInstruction.from_file(PYTORCH)
+    (options, _defaults) = _get_flags_and_options(instruction.schema_model)
+    completion.index_options("show", "https://example.org/pytorch.git", instruction.config_key, options)
+
+    def fail(path):
+        raise AssertionError("repository was fetched")
+    monkeypatch.setattr(completion, "_resolve_config_file", fail)
+    assert _complete("show", "https://example.org/pytorch.git", "--p") == ["--package"]
+    assert "https://example.org/pytorch.git" in _complete("show", "https://example.org/py")
+
+
+def test_commands_index_only_successful_git_urls(index, monkeypatch):
+    def fail():
+        raise AssertionError("index was opened")
+    monkeypatch.setattr(completion, "_get_default_option_index", fail)
+    result = CliRunner().invoke(main, ["show", "tests/data/test_install/install.cfg", "--error-install"])
+    assert result.exit_code == 0
+
+    monkeypatch.undo()
+    monkeypatch.setattr(completion, "_default_option_index", index)
+    instruction = InstallationInstruction.from_file(PYTORCH)
+    options = _get_flags_and_options(instruction.schema_model, inst=True)
+    completion.index_options("install", "https://example.org/pytorch.git", instruction.config_key, options)
+    assert index.get("install", "https://example.org/pytorch.git") is not None
+    assert index.get("show", "https://example.org/pytorch.git") is None
+
+
+def test_complete_unknown_config_prints_nothing(index):
+    assert _complete("show", "does/not/exist", "--") == ["--help"]
+
+
+def test_remote_config_is_resolved_once(tmp_path, monkeypatch):
+    config = tmp_path / "install.cfg"
+    shutil.copy(PYTORCH, config)
+    fetched = []
+
+    class Cache:
+        def get(self, url):
+            fetched.append(url)
+            return str(config)
+
+    monkeypatch.setattr(http_cache, "_default_http_cache", Cache())
+    monkeypatch.setattr(helpers, "_resolved_config_files", {})
+    assert helpers._resolve_config_file("https://example.org/install.cfg") == str(config)
+    assert helpers._resolve_config_file("https://example.org/install.cfg") == str(config)
+    assert fetched == ["https://example.org/install.cfg"]
@@ -0,0 +1,103 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+
+import pytest
+
+from installation_instruction import defaults
+from installation_instruction.defaults import DefaultsStore, LEGACY_FILE_NAME, DATABASE_FILE_NAME
+
+
+WRITERS = 16
+WRITES_PER_WRITER = 20
+
+
+def test_update_and_remove(tmp_path):
+    store = DefaultsStore(str(tmp_path))
+    assert store.get("project") == {}
+
+    (old, new) = store.update("project", lambda settings: {**settings, "os": "linux", "gpu": True})
+    assert (old, new) == ({}, {"os": "linux", "gpu": True})
+    store.update("other", lambda settings: {"os": "win"})
+
+    (old, new) = store.update("project", lambda settings: {"os": settings["os"]})
+    assert old == {"os": "linux", "gpu": True}
+    assert DefaultsStore(str(tmp_path)).get("project") == {"os": "linux"}
+    assert store.projects() == ["other", "project"]
+
+    assert store.remove("project")
+    assert not store.remove("project")
+    assert store.get("project") == {}
+    assert store.get("other") == {"os": "win"}
+
+
+def test_failed_update_is_rolled_back(tmp_path):
+    store = DefaultsStore(str(tmp_path))
+    store.update("project", lambda settings: {"os": "linux"})
+
+    def update(settings):
+        settings["os"] = "mac"
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        store.update("project", update)
+    assert store.get("project") == {"os": "linux"}
+
+
+def test_migrates_json_file_once(tmp_path):
+    with open(tmp_path / LEGACY_FILE_NAME, "w") as file:
+        json.dump({"project": {"os": "linux", "jobs": 4}, "other": {"gpu": False}}, file)
+
+    store = DefaultsStore(str(tmp_path))
+    assert store.get("project") == {"os": "linux", "jobs": 4}
+    assert store.get("other") == {"gpu": False}
+
+    store.remove("other")
+    assert DefaultsStore(str(tmp_path)).get("other") == {}
+
+
+def _increment(directory: str) -> None:
+    store = DefaultsStore(directory)
+    for _ in range(WRITES_PER_WRITER):
+        store.update("project", lambda settings: {**settings, "count": settings.get("count", 0) + 1})
+    store.close()
+
+
+def test_reading_does_not_take_the_write_lock(tmp_path, monkeypatch):
+    import sqlite3
+    DefaultsStore(str(tmp_path)).update("project", lambda settings: {"os": "linux"})
+
+    writer = sqlite3.connect(str(tmp_path / DATABASE_FILE_NAME), isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    monkeypatch.setattr(defaults, "BUSY_TIMEOUT", 0.1)
+    assert DefaultsStore(str(tmp_path)).get("project") == {"os": "linux"}
+    writer.execute("ROLLBACK")
+    writer.close()
+
+
+def test_reading_without_defaults_creates_no_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(defaults, "_get_default_data_dir", lambda: str(tmp_path / "data"))
+    monkeypatch.setattr(defaults, "_default_store", None)
+    assert defaults._get_user_defaults("project") == {}
+    assert not (tmp_path / "data").exists()
+
+
+def test_parallel_writers_do_not_lose_updates(tmp_path):
+    DefaultsStore(str(tmp_path)).close()
+    with ProcessPoolExecutor(WRITERS) as executor:
+        list(executor.map(_increment, [str(tmp_path)] * WRITERS))
+
+    assert DefaultsStore(str(tmp_path)).get("project") == {"count": WRITERS * WRITES_PER_WRITER}
@@ -0,0 +1,78 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from jinja2.exceptions import TemplateSyntaxError
+import pytest
+
+from installation_instruction import environment
+from installation_instruction.installation_instruction import InstallationInstruction
+
+
+@pytest.fixture(autouse=True)
+def reset_environment():
+    environment.configure_environment()
+    yield
+    environment.configure_environment(template_cache_size=environment.DEFAULT_TEMPLATE_CACHE_SIZE)
+
+
+def test_macros_are_globals_of_shared_environment():
+    shared = environment.get_environment()
+    assert shared is environment.get_environment()
+    assert set(environment.MACRO_NAMES) <= shared.globals.keys()
+
+    first = InstallationInstruction("type: object\n------\none")
+    second = InstallationInstruction("type: object\n------\n{% call command() %}\ntwo\nthree\n{% endcall %}")
+    assert first.template.environment is second.template.environment is shared
+    assert second.validate_and_render({}) == (["two three"], False)
+
+
+def test_templates_are_cached_by_source():
+    first = environment.load_template("{{ a }}")
+    assert environment.load_template("{{ a }}") is first
+    assert environment.load_template("{{ b }}") is not first
+
+
+def test_template_cache_is_bounded():
+    environment.configure_environment(template_cache_size=2)
+    first = environment.load_template("1")
+    environment.load_template("2")
+    environment.load_template("3")
+    assert environment.template_cache_info() == {"size": 2, "maxsize": 2}
+    assert environment.load_template("1") is not first
+
+
+def test_configure_environment():
+    environment.configure_environment(trim_blocks=False)
+    assert not environment.get_environment().trim_blocks
+    assert environment.get_environment().lstrip_blocks
+    assert "raise" in environment.get_environment().globals
+
+
+def test_bytecode_cache_is_keyed_by_options(tmp_path):
+    from installation_instruction.cache import ConfigCache
+    cache = ConfigCache(str(tmp_path))
+    source = "{% if true %}\none{% endif %}"
+
+    assert environment.load_template(source, cache.bytecode_cache, "name").render() == "one"
+    environment.configure_environment(trim_blocks=False)
+    assert environment.load_template(source, cache.bytecode_cache, "name").render() == "\none"
+    assert environment.get_bytecode_name("name") != environment.get_bytecode_name("name", True)
+
+
+def test_error_line_numbers_match_template():
+    instruction = InstallationInstruction("type: object\n------\nfirst\nsecond\n{% if %}\n")
+    with pytest.raises(TemplateSyntaxError) as error:
+        instruction.template
+    assert error.value.lineno == 3
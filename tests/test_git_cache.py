@@ -0,0 +1,135 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import git
+import pytest
+
+from installation_instruction.git_cache import GitMirrorCache
+
+
+def _commit_config(work_dir, config):
+    repo = git.Repo(work_dir)
+    with open(os.path.join(work_dir, "install.cfg"), "w") as file:
+        file.write(config)
+    repo.index.add(["install.cfg"])
+    repo.index.commit("update config")
+    repo.remote("origin").push("HEAD:refs/heads/main")
+
+
+@pytest.fixture
+def remote(tmp_path):
+    bare_dir = tmp_path / "remote.git"
+    work_dir = tmp_path / "work"
+    bare = git.Repo.init(bare_dir, bare=True, initial_branch="main")
+    bare.git.config("uploadpack.allowFilter", "true")
+    work = git.Repo.init(work_dir, initial_branch="main")
+    work.git.config("user.name", "test")
+    work.git.config("user.email", "test@example.com")
+    work.create_remote("origin", str(bare_dir))
+    _commit_config(str(work_dir), "first\n")
+    return ("file://" + bare_dir.as_posix(), str(work_dir))
+
+
+def _read_config(checkout_dir):
+    with open(os.path.join(checkout_dir, "install.cfg")) as file:
+        return file.read()
+
+
+def test_checkout_is_reused_within_ttl(tmp_path, remote):
+    (url, work_dir) = remote
+    cache = GitMirrorCache(str(tmp_path / "cache"), ttl=3600)
+
+    first = cache.get_checkout(url)
+    assert _read_config(first) == "first\n"
+
+    _commit_config(work_dir, "second\n")
+    assert cache.get_checkout(url) == first
+    assert cache.fetches == 1
+
+
+def test_stale_mirror_is_fetched(tmp_path, remote):
+    (url, work_dir) = remote
+    cache = GitMirrorCache(str(tmp_path / "cache"), ttl=0)
+
+    first = cache.get_checkout(url)
+    _commit_config(work_dir, "second\n")
+    second = cache.get_checkout(url)
+
+    assert second != first
+    assert _read_config(second) == "second\n"
+    assert _read_config(first) == "first\n"
+    assert cache.fetches == 2
+
+
+def test_old_checkouts_are_removed_by_age(tmp_path, remote):
+    (url, work_dir) = remote
+    cache = GitMirrorCache(str(tmp_path / "cache"), ttl=0, checkout_max_age=0)
+
+    first = cache.get_checkout(url)
+    _commit_config(work_dir, "second\n")
+    second = cache.get_checkout(url)
+
+    assert not os.path.exists(first)
+    assert _read_config(second) == "second\n"
+
+
+def test_only_head_is_fetched(tmp_path, remote):
+    (url, work_dir) = remote
+    git.Repo(work_dir).remote("origin").push("HEAD:refs/pull/1/head")
+    git.Repo(work_dir).remote("origin").push("HEAD:refs/heads/feature")
+    cache = GitMirrorCache(str(tmp_path / "cache"), ttl=0)
+    cache.get_checkout(url)
+    cache.get_checkout(url)
+
+    refs = cache.get_mirror(url).git.for_each_ref("--format=%(refname)").split()
+    assert refs == ["refs/heads/main"]
+
+
+def test_offline_mode(tmp_path, remote):
+    (url, work_dir) = remote
+    offline = GitMirrorCache(str(tmp_path / "cache"), ttl=0, offline=True)
+    with pytest.raises(Exception):
+        offline.get_checkout(url)
+
+    GitMirrorCache(str(tmp_path / "cache")).get_checkout(url)
+    _commit_config(work_dir, "second\n")
+    assert _read_config(offline.get_checkout(url)) == "first\n"
+    assert offline.fetches == 0
+
+
+def test_concurrent_checkouts_share_mirror(tmp_path, remote):
+    (url, _work_dir) = remote
+    caches = [GitMirrorCache(str(tmp_path / "cache"), ttl=3600) for _ in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        checkouts = list(executor.map(lambda cache: cache.get_checkout(url), caches))
+
+    assert len(set(checkouts)) == 1
+    assert sum(cache.fetches for cache in caches) == 1
+    assert _read_config(checkouts[0]) == "first\n"
+
+
+def test_repository_without_config(tmp_path, remote):
+    (url, work_dir) = remote
+    repo = git.Repo(work_dir)
+    repo.index.remove(["install.cfg"], working_tree=True)
+    repo.index.commit("remove config")
+    repo.remote("origin").push("HEAD:refs/heads/main")
+
+    checkout = GitMirrorCache(str(tmp_path / "cache")).get_checkout(url)
+    assert os.listdir(checkout) == []
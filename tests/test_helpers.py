@@ -11,6 +11,9 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import re
+
+import pytest
 
 
 from jinja2 import Template
@@ -100,6 +103,53 @@ something:"""
     assert schema == parsed_schema
     assert template == parsed_template
 
+@pytest.mark.parametrize("string", [
+    "a: 1\n------\nb",
+    "  a: 1  \n\n---------\n\n  b\n  c  \n\n",
+    "a---\n- x\n------\n------\nb",
+    "a: '------'\n------\nb",
+    "a\t------\tb\n",
+    "------",
+])
+def test_split_string_at_delimiter_matches_regex(string):
+    reg = re.compile(r"^\s*(?P<schema>.*?)\s*\-{6,}\s*(?P<template>.*?)\s*$", re.S)
+    matches = reg.search(string)
+    assert helpers._split_string_at_delimiter(string) == (matches.group("schema"), matches.group("template"))
+
 def test_is_remote_git_repository():
     assert helpers._is_remote_git_repository("https://github.com/instructions-d-installation/web-installation-instruction.git")
     assert not helpers._is_remote_git_repository("./instructions-d-installation/web-installation-instruction.git")
+
+@pytest.mark.parametrize("string", [
+    "  a   b  \n\n c\r\nd\re\x0bf\x0cg\x1ch\x85i j k  ",
+    "\n\n   \n",
+    "no line break",
+    "trailing\r",
+])
+def test_iter_normalized_lines_in_chunks(string):
+    expected = []
+    for line in string.splitlines():
+        if line := line.strip():
+            expected.append(re.sub(r"\s{2,}", " ", line))
+
+    for size in range(1, len(string) + 1):
+        chunks = [string[i:i + size] for i in range(0, len(string), size)]
+        assert list(helpers._iter_normalized_lines(chunks)) == expected
+
+@pytest.mark.parametrize("string", [
+    '{"type": "object", "properties": {"os": {"enum": ["linux", "mac"]}}}',
+    "{type: object, properties: {os: {enum: [linux, mac]}}}",
+    "type: object\nproperties:\n  os:\n    enum: [linux, mac]",
+])
+def test_parse_header_json_and_yaml(string):
+    assert helpers._parse_header(string) == {"type": "object", "properties": {"os": {"enum": ["linux", "mac"]}}}
+
+def test_parse_header_without_libyaml(monkeypatch):
+    import yaml
+    monkeypatch.delattr(yaml, "CSafeLoader", raising=False)
+    assert helpers._get_yaml_loader() is yaml.SafeLoader
+    assert helpers._parse_header("type: object") == {"type": "object"}
+
+def test_parse_header_invalid():
+    with pytest.raises(Exception, match="neither a valid json nor a valid yaml"):
+        helpers._parse_header("{type: [object")
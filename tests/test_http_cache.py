@@ -0,0 +1,161 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import hashlib
+
+import pytest
+
+from installation_instruction import helpers, http_cache
+from installation_instruction.http_cache import HttpConfigCache, DirectFetchUnavailable, _get_config_url
+
+
+LAST_MODIFIED = "Wed, 21 Oct 2015 07:28:00 GMT"
+
+
+class _ConfigHandler(BaseHTTPRequestHandler):
+    """
+    Serves `server.configs`, with an `ETag` for paths starting with `/etag/` and a `Last-Modified` header else.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.clients.add(self.client_address)
+        if self.path == "/moved/install.cfg":
+            self._respond(301, b"", {"Location": "/etag/install.cfg"})
+            return
+        body = self.server.configs.get(self.path)
+        if body is None:
+            self._respond(404, b"not found")
+            return
+        if self.path.startswith("/etag/"):
+            etag = '"' + hashlib.sha256(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self._respond(304, None, {"ETag": etag})
+            else:
+                self._respond(200, body, {"ETag": etag})
+        elif self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            self._respond(304, None)
+        else:
+            self._respond(200, body, {"Last-Modified": LAST_MODIFIED})
+
+    def _respond(self, status, body, headers={}):
+        self.send_response(status)
+        for (name, value) in headers.items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ConfigHandler)
+    server.configs = {}
+    server.requests = []
+    server.clients = set()
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _read(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_config_urls():
+    assert _get_config_url("https://github.com/owner/repo.git") == "https://raw.githubusercontent.com/owner/repo/HEAD/install.cfg"
+    assert _get_config_url("https://gitlab.com/group/sub/repo") == "https://gitlab.com/group/sub/repo/-/raw/HEAD/install.cfg"
+    assert _get_config_url("https://example.org/folder/install.cfg") == "https://example.org/folder/install.cfg"
+    assert _get_config_url("https://example.org/repo.git") is None
+    assert _get_config_url("file:///tmp/repo") is None
+
+
+@pytest.mark.parametrize("folder", ["etag", "modified"])
+def test_revalidation(tmp_path, server, folder):
+    url = f"{server.url}/{folder}/install.cfg"
+    server.configs[f"/{folder}/install.cfg"] = b"first"
+    cache = HttpConfigCache(str(tmp_path), ttl=3600)
+
+    path = cache.get(url)
+    assert _read(path) == b"first"
+    assert cache.get(url) == path
+    assert len(server.requests) == 1
+
+    cache.ttl = 0
+    assert _read(cache.get(url)) == b"first"
+    assert (cache.fetches, cache.revalidations) == (1, 1)
+
+    if folder == "etag":
+        server.configs[f"/{folder}/install.cfg"] = b"second"
+        assert _read(cache.get(url)) == b"second"
+        assert cache.fetches == 2
+
+
+def test_redirect(tmp_path, server):
+    server.configs["/etag/install.cfg"] = b"moved"
+    assert _read(HttpConfigCache(str(tmp_path)).get(f"{server.url}/moved/install.cfg")) == b"moved"
+
+
+def test_unavailable(tmp_path, server):
+    cache = HttpConfigCache(str(tmp_path), ttl=0)
+    with pytest.raises(DirectFetchUnavailable):
+        cache.get(f"{server.url}/missing/install.cfg")
+    with pytest.raises(DirectFetchUnavailable):
+        cache.get("https://example.org/repo.git")
+    with pytest.raises(DirectFetchUnavailable):
+        HttpConfigCache(str(tmp_path), offline=True).get(f"{server.url}/etag/install.cfg")
+    assert len(server.requests) == 1
+
+
+def test_cached_config_is_used_when_server_is_down(tmp_path, server):
+    url = f"{server.url}/etag/install.cfg"
+    server.configs["/etag/install.cfg"] = b"cached"
+    HttpConfigCache(str(tmp_path)).get(url)
+    server.shutdown()
+    server.server_close()
+    assert _read(HttpConfigCache(str(tmp_path), ttl=0, timeout=1).get(url)) == b"cached"
+    assert _read(HttpConfigCache(str(tmp_path), offline=True).get(url)) == b"cached"
+
+
+def test_get_many_reuses_connections(tmp_path, server):
+    urls = [f"{server.url}/etag/{index}/install.cfg" for index in range(40)]
+    for index in range(40):
+        server.configs[f"/etag/{index}/install.cfg"] = f"config {index}".encode("utf-8")
+    cache = HttpConfigCache(str(tmp_path))
+    paths = cache.get_many(urls + [f"{server.url}/missing/install.cfg"], workers=4)
+
+    assert [_read(paths[url]) for url in urls] == [f"config {index}".encode("utf-8") for index in range(40)]
+    assert isinstance(paths[f"{server.url}/missing/install.cfg"], DirectFetchUnavailable)
+    assert cache.pool.connections <= 4
+    assert len(server.clients) == cache.pool.connections
+
+
+def test_install_config_file_is_fetched_over_http(tmp_path, server, monkeypatch):
+    server.configs["/repo/install.cfg"] = b"type: object\n------\necho"
+    monkeypatch.setattr(http_cache, "_default_http_cache", HttpConfigCache(str(tmp_path)))
+    (_temp_dir, path) = helpers._get_install_config_file(f"{server.url}/repo/install.cfg")
+    assert _read(path) == b"type: object\n------\necho"
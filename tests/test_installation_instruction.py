@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 
 from installation_instruction.installation_instruction import InstallationInstruction
@@ -72,4 +74,95 @@ def test_parse_schema(test_data_flags_options_config_string_with_empty_template)
         "key": "virtualenv"
     }
 
-    assert schema["properties"]["verbose"]["description"] == "Activate verbose output."
\ No newline at end of file
+    assert schema["properties"]["verbose"]["description"] == "Activate verbose output."
+
+def _pytorch_inputs():
+    for os in ["linux", "macos", "windows"]:
+        for compute_platform in ["cu118", "cu121", "ro60", "cpu"]:
+            yield {"build": "stable", "__os__": os, "package": "conda", "compute_platform": compute_platform}
+    yield {"build": "stable", "__os__": "beos", "package": "conda", "compute_platform": "cpu"}
+
+
+def test_render_many():
+    install = InstallationInstruction.from_file("examples/pytorch/pytorch-instruction.schema.yml.jinja")
+    results = list(install.render_many(_pytorch_inputs()))
+
+    assert results[:-1] == [install.validate_and_render(input) for input in list(_pytorch_inputs())[:-1]]
+    assert results[-1] == (["'beos' is not one of ['linux', 'macos', 'windows']"], True)
+
+
+def test_render_many_is_lazy():
+    from itertools import count, islice
+
+    install = InstallationInstruction.from_file("examples/scikit-learn/scikit-learn-instruction.schema.yml.jinja")
+    inputs = ({"os": "Linux", "packager": "pip", "virtualenv": i % 2 == 0} for i in count())
+    results = list(islice(install.render_many(inputs, workers=2, chunksize=4), 10))
+
+    assert len(results) == 10
+    assert results[1] == install.validate_and_render({"os": "Linux", "packager": "pip", "virtualenv": False})
+
+
+def test_render_many_with_executor():
+    from concurrent.futures import ProcessPoolExecutor
+
+    install = InstallationInstruction.from_file("examples/pytorch/pytorch-instruction.schema.yml.jinja")
+    expected = list(install.render_many(_pytorch_inputs()))
+
+    assert list(install.render_many(_pytorch_inputs(), workers=2, chunksize=3)) == expected
+    with ProcessPoolExecutor(2) as executor:
+        assert list(install.render_many(_pytorch_inputs(), executor=executor, chunksize=3)) == expected
+
+
+def test_iter_render_matches_validate_and_render(user_input_tests):
+    install = InstallationInstruction.from_file(user_input_tests.get("schema_path"))
+    input = user_input_tests.get("input")
+
+    if user_input_tests.get("expected_error") is None:
+        with pytest.raises(Exception):
+            list(install.iter_render(input))
+        return
+
+    (instructions, is_error) = install.validate_and_render(input)
+    if is_error:
+        with pytest.raises(Exception) as e:
+            list(install.iter_render(input))
+        assert str(e.value) == "\n".join(instructions)
+    else:
+        assert list(install.iter_render(input)) == instructions
+
+
+def test_validate_and_render_async_matches_sync(user_input_tests):
+    install = InstallationInstruction.from_file(user_input_tests.get("schema_path"))
+    input = user_input_tests.get("input")
+
+    if user_input_tests.get("expected_error") is None:
+        with pytest.raises(Exception):
+            asyncio.run(install.validate_and_render_async(input))
+        return
+    assert asyncio.run(install.validate_and_render_async(input)) == install.validate_and_render(input)
+
+
+def test_validate_and_render_async_limits_concurrency():
+    install = InstallationInstruction.from_file("examples/pytorch/pytorch-instruction.schema.yml.jinja")
+    install.render_concurrency = 2
+    inputs = [input for input in _pytorch_inputs() if input["__os__"] != "beos"] * 3
+
+    running = 0
+    max_running = 0
+    render_async = install._render_async
+    async def counting_render_async(input):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.001)
+        try:
+            return await render_async(input)
+        finally:
+            running -= 1
+    install._render_async = counting_render_async
+
+    async def render():
+        return await asyncio.gather(*(install.validate_and_render_async(input) for input in inputs))
+
+    assert asyncio.run(render()) == [install.validate_and_render(input) for input in inputs]
+    assert max_running == 2
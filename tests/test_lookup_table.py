@@ -0,0 +1,62 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+from installation_instruction.installation_instruction import InstallationInstruction
+from installation_instruction.lookup_table import LookupTable, compile_lookup_table
+from installation_instruction.matrix import iter_combinations
+
+
+@pytest.mark.parametrize("config_path", [
+    "examples/pytorch/pytorch-instruction.schema.yml.jinja",
+    "examples/scikit-learn/scikit-learn-instruction.schema.yml.jinja",
+    "examples/spacy/spacy-instruction.schema.yml.jinja",
+    "tests/data/test_install/install.cfg",
+])
+def test_round_trip(tmp_path, config_path):
+    install = InstallationInstruction.from_file(config_path)
+    path = str(tmp_path / "table.bin")
+    compile_lookup_table(install, path)
+
+    with LookupTable(path) as table:
+        for input in iter_combinations(install):
+            assert table.lookup(input) == install._validate_and_render_without_raising(input)
+
+
+def test_lookup_errors(tmp_path):
+    install = InstallationInstruction.from_file("examples/pytorch/pytorch-instruction.schema.yml.jinja")
+    path = str(tmp_path / "table.bin")
+    compile_lookup_table(install, path)
+
+    with LookupTable(path) as table:
+        assert len(table) == 48
+        assert table.lookup({"__os__": "linux", "compute_platform": "cpu"}) == \
+            install.validate_and_render({"build": "stable", "__os__": "linux", "package": "pip", "compute_platform": "cpu"})
+        with pytest.raises(KeyError):
+            table.lookup({"__os__": "beos"})
+        with pytest.raises(KeyError):
+            table.lookup({"package": "pip"})
+        with pytest.raises(KeyError):
+            table.lookup({"__os__": "linux", "unknown": 1})
+
+
+def test_reader_does_not_import_jinja():
+    import subprocess
+    import sys
+
+    code = "import sys, installation_instruction.lookup_table; print('jinja2' in sys.modules, 'jsonschema' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert result.stdout.strip() == "False False"
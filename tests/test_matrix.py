@@ -0,0 +1,73 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from installation_instruction.__main__ import main
+from installation_instruction.installation_instruction import InstallationInstruction
+from installation_instruction.matrix import count_combinations, iter_combinations, render_matrix, _parse_shard
+
+
+PYTORCH = "examples/pytorch/pytorch-instruction.schema.yml.jinja"
+
+
+def test_iter_combinations():
+    install = InstallationInstruction.from_file(PYTORCH)
+    combinations = list(iter_combinations(install))
+
+    assert len(combinations) == count_combinations(install) == 2 * 3 * 2 * 4
+    assert combinations[0] == {"build": "stable", "__os__": "linux", "package": "conda", "compute_platform": "cu118"}
+    assert len({json.dumps(c, sort_keys=True) for c in combinations}) == len(combinations)
+
+
+def test_shards_cover_all_combinations():
+    install = InstallationInstruction.from_file(PYTORCH)
+    shards = [list(iter_combinations(install, shard=(i, 5))) for i in range(5)]
+
+    assert [len(shard) for shard in shards] == [count_combinations(install, shard=(i, 5)) for i in range(5)]
+    assert sorted(json.dumps(c, sort_keys=True) for shard in shards for c in shard) == \
+        sorted(json.dumps(c, sort_keys=True) for c in iter_combinations(install))
+
+
+def test_parse_shard():
+    assert _parse_shard("1/4") == (0, 4)
+    with pytest.raises(ValueError):
+        _parse_shard("5/4")
+    with pytest.raises(ValueError):
+        _parse_shard("a")
+
+
+def test_render_matrix():
+    install = InstallationInstruction.from_file(PYTORCH)
+    results = list(render_matrix(install, workers=2))
+
+    assert len(results) == 48
+    for (input, instructions, is_error) in results:
+        assert install.validate_and_render(input) == (instructions, is_error)
+
+
+def test_matrix_cli(tmp_path):
+    errors_path = tmp_path / "errors.jsonl"
+    result = CliRunner().invoke(main, ["matrix", PYTORCH, "--workers", "1", "--limit", "10", "--shard", "2/2", "--errors", str(errors_path), "--no-progress"])
+    assert result.exit_code == 0
+
+    rows = [json.loads(line) for line in result.stdout.splitlines()]
+    errors = [json.loads(line) for line in errors_path.read_text().splitlines()]
+    assert len(rows) + len(errors) == 10
+    assert all("instructions" in row for row in rows)
+    assert all(error["error"] for error in errors)
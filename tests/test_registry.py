@@ -0,0 +1,129 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+import pytest
+
+from installation_instruction.cache import ConfigCache
+from installation_instruction.registry import ConfigRegistry, discover_configs, _estimate_size
+
+
+def _config(id: str, text: str = "echo {{ os }}") -> str:
+    return f"""
+$id: {id}
+type: object
+properties:
+  os:
+    enum: [linux, mac]
+    default: linux
+------
+{text}
+"""
+
+def _write_tree(root, configs: dict[str, str]) -> None:
+    for (folder, config) in configs.items():
+        os.makedirs(root / folder, exist_ok=True)
+        (root / folder / "install.cfg").write_text(config)
+
+
+def test_discover_configs_skips_hidden_directories(tmp_path):
+    _write_tree(tmp_path, {"a": _config("a"), "b/c": _config("c"), ".git/d": _config("d")})
+    assert discover_configs(str(tmp_path)) == [str(tmp_path / "a" / "install.cfg"), str(tmp_path / "b" / "c" / "install.cfg")]
+
+
+def test_failing_config_does_not_block_others(tmp_path):
+    _write_tree(tmp_path, {
+        "a": _config("https://example.org/a"),
+        "b": _config("https://example.org/b", "{% if %}"),
+        "c": "no delimiter",
+        "d": _config("https://example.org/a", "duplicate"),
+        "e": _config("https://example.org/e"),
+    })
+    registry = ConfigRegistry(workers=4)
+    errors = registry.add_tree(str(tmp_path))
+
+    assert set(registry.ids()) == {"https://example.org/a", "https://example.org/e"}
+    assert str(tmp_path / "b" / "install.cfg") in errors
+    assert "No delimiter" in errors[str(tmp_path / "c" / "install.cfg")]
+    assert len(errors) == 3 and registry.errors == errors
+    assert registry.get("https://example.org/e").validate_and_render({"os": "mac"}) == (["echo mac"], False)
+    with pytest.raises(KeyError):
+        registry.get("https://example.org/b")
+
+
+def test_memory_budget_evicts_and_reloads(tmp_path):
+    configs = {name: _config(f"https://example.org/{name}", f"echo {name}") for name in "abc"}
+    _write_tree(tmp_path, configs)
+    registry = ConfigRegistry(ConfigCache(str(tmp_path / "cache")), memory_budget=2 * _estimate_size(configs["a"]), workers=2)
+    assert registry.add_tree(str(tmp_path / "a")) == {}
+    registry.add_tree(str(tmp_path / "b"))
+    registry.get("https://example.org/a")
+    registry.add_tree(str(tmp_path / "c"))
+
+    stats = registry.stats()
+    assert (stats["configs"], stats["loaded"], stats["evictions"]) == (3, 2, 1)
+    assert stats["size"] <= stats["memory_budget"]
+
+    assert registry.get("https://example.org/b").validate_and_render({}) == (["echo b"], False)
+    assert registry.stats()["loads"] == 4
+    assert registry.stats()["evictions"] == 2
+
+
+def test_processes_warm_cache(tmp_path):
+    _write_tree(tmp_path, {"a": _config("https://example.org/a"), "b": "no delimiter"})
+    cache = ConfigCache(str(tmp_path / "cache"))
+    registry = ConfigRegistry(cache, workers=2, processes=True)
+    errors = registry.add_tree(str(tmp_path))
+    assert list(errors) == [str(tmp_path / "b" / "install.cfg")]
+    assert cache.stats()["hits"] == 1
+    assert registry.path("https://example.org/a") == str(tmp_path / "a" / "install.cfg")
+
+    with pytest.raises(Exception):
+        ConfigRegistry(processes=True)
+
+
+def test_reload_does_not_block_other_configs(tmp_path, monkeypatch):
+    import threading
+    from installation_instruction import registry as registry_module
+
+    configs = {name: _config(f"https://example.org/{name}", f"echo {name}") for name in "ab"}
+    _write_tree(tmp_path, configs)
+    registry = ConfigRegistry(memory_budget=_estimate_size(configs["a"]), workers=1)
+    registry.add_tree(str(tmp_path / "a"))
+    registry.add_tree(str(tmp_path / "b"))
+    assert registry.stats()["loaded"] == 1
+
+    started = threading.Event()
+    release = threading.Event()
+    load = registry_module._load
+    def slow_load(path, cache):
+        started.set()
+        assert release.wait(5)
+        return load(path, cache)
+    monkeypatch.setattr(registry_module, "_load", slow_load)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("https://example.org/a"))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    assert registry.get("https://example.org/b").validate_and_render({}) == (["echo b"], False)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results[0] is results[1]
+    assert registry.stats()["loads"] == 3
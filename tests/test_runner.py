@@ -0,0 +1,230 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+
+import pytest
+
+from installation_instruction.installation_instruction import InstallationInstruction
+from installation_instruction.helpers import _strip_step_markers
+from installation_instruction.runner import iter_steps, parse_steps, run_steps, format_summary
+
+
+CONFIG = """
+type: object
+properties:
+  gpu:
+    type: boolean
+    default: false
+------
+echo setup
+{% call step("torch") %}
+    echo torch
+{% endcall %}
+{% call step("data") %}
+    echo data
+{% endcall %}
+{% call step("model", after=["torch", "data"]) %}
+    echo model {{ "gpu" if gpu else "cpu" }}
+{% endcall %}
+echo done
+"""
+
+posix_only = pytest.mark.skipif(os.name == "nt", reason="Uses posix shell commands.")
+
+
+def test_step_macro_renders_markers():
+    (lines, is_error) = InstallationInstruction(CONFIG)._validate_and_render_with_step_markers({})
+    assert not is_error
+    assert lines != _strip_step_markers(lines)
+    assert _strip_step_markers(lines) == ["echo setup", "echo torch", "echo data", "echo model cpu", "echo done"]
+
+
+def test_markers_are_stripped_from_rendered_instructions():
+    instruction = InstallationInstruction(CONFIG)
+    expected = ["echo setup", "echo torch", "echo data", "echo model cpu", "echo done"]
+
+    assert instruction.validate_and_render({}) == (expected, False)
+    assert list(instruction.iter_render({})) == expected
+    assert list(instruction.render_many([{}])) == [(expected, False)]
+
+
+def test_parse_steps():
+    (lines, _is_error) = InstallationInstruction(CONFIG)._validate_and_render_with_step_markers({})
+    steps = parse_steps(lines)
+
+    assert [step.name for step in steps] == [None, "torch", "data", "model", None]
+    assert [step.after for step in steps] == [[], [0], [0], [0, 1, 2], [0, 1, 2, 3]]
+    assert steps[3].commands == ["echo model cpu"]
+
+
+def test_parse_steps_without_steps():
+    steps = parse_steps(["echo a", "echo b"])
+    assert len(steps) == 1
+    assert steps[0].commands == ["echo a", "echo b"]
+
+
+@pytest.mark.parametrize("lines", [
+    ['#ibi-step {"name": "a", "after": ["b"]}', "echo a", "#ibi-end-step"],
+    ['#ibi-step {"name": "a"}', "#ibi-end-step", '#ibi-step {"name": "a"}', "#ibi-end-step"],
+    ['#ibi-step {"name": "a"}', '#ibi-step {"name": "b"}', "#ibi-end-step", "#ibi-end-step"],
+    ['#ibi-step {"name": "a"}', "echo a"],
+])
+def test_parse_steps_invalid(lines):
+    with pytest.raises(Exception):
+        parse_steps(lines)
+
+
+@posix_only
+def test_run_steps_in_parallel_and_in_order(tmp_path):
+    flag = tmp_path / "flag"
+    lines = [
+        '#ibi-step {"name": "waits"}',
+        f"for i in $(seq 500); do [ -f {flag} ] && break; sleep 0.01; done; [ -f {flag} ] && echo waited",
+        "#ibi-end-step",
+        '#ibi-step {"name": "signals"}',
+        f"touch {flag} && echo signaled",
+        "#ibi-end-step",
+    ]
+    results = list(run_steps(parse_steps(lines), jobs=2))
+
+    assert [result.step.name for result in results] == ["waits", "signals"]
+    assert [result.stdout for result in results] == ["waited\n", "signaled\n"]
+
+
+@posix_only
+def test_run_steps_respects_dependencies(tmp_path):
+    log = tmp_path / "log"
+    lines = [
+        '#ibi-step {"name": "first"}', f"sleep 0.2; echo first >> {log}", "#ibi-end-step",
+        '#ibi-step {"name": "second", "after": ["first"]}', f"echo second >> {log}", "#ibi-end-step",
+    ]
+    results = list(run_steps(parse_steps(lines), jobs=2))
+
+    assert not any(result.failed for result in results)
+    assert log.read_text() == "first\nsecond\n"
+
+
+@posix_only
+def test_run_steps_fails_fast():
+    lines = [
+        '#ibi-step {"name": "slow"}', "sleep 30", "echo never", "#ibi-end-step",
+        '#ibi-step {"name": "broken"}', "echo oops >&2; exit 3", "#ibi-end-step",
+        '#ibi-step {"name": "later", "after": ["broken"]}', "echo later", "#ibi-end-step",
+    ]
+    start = time.monotonic()
+    results = list(run_steps(parse_steps(lines), jobs=2))
+
+    assert time.monotonic() - start < 10
+    assert results[-1].failed
+    assert results[-1].step.name == "broken"
+    assert results[-1].returncode == 3
+    assert results[-1].stderr == "oops\n"
+    assert "later" not in [result.step.name for result in results]
+
+
+@posix_only
+def test_no_descendant_of_cancelled_step_survives(tmp_path):
+    pid_file = tmp_path / "pid"
+    lines = [
+        '#ibi-step {"name": "a"}', f"for i in $(seq 500); do [ -s {pid_file} ] && break; sleep 0.01; done; exit 1", "#ibi-end-step",
+        '#ibi-step {"name": "b"}', f"sleep 30 & echo $! > {pid_file}; sleep 2 && echo done", "#ibi-end-step",
+    ]
+    results = list(run_steps(parse_steps(lines), jobs=2))
+
+    assert results[-1].step.name == "a"
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+
+@posix_only
+def test_interrupt_is_forwarded_to_running_steps(tmp_path):
+    import signal
+    import threading
+    pid_file = tmp_path / "pid"
+    lines = ['#ibi-step {"name": "a"}', f"sleep 30 & echo $! > {pid_file}; wait", "#ibi-end-step"]
+    def interrupt():
+        for _ in range(500):
+            if pid_file.exists() and pid_file.read_text():
+                break
+            time.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGINT)
+    threading.Thread(target=interrupt).start()
+
+    with pytest.raises(KeyboardInterrupt):
+        list(run_steps(parse_steps(lines)))
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+
+
+@posix_only
+def test_run_steps_streams_output_and_keeps_tail():
+    lines = ['#ibi-step {"name": "count"}', "seq 1000; echo err >&2", "#ibi-end-step"]
+    output = []
+    results = list(run_steps(parse_steps(lines), on_output=lambda step, stream, line: output.append((step.name, stream, line)), tail=10))
+
+    assert len(output) == 1001
+    assert output[0] == ("count", "stdout", "1")
+    assert ("count", "stderr", "err") in output
+    assert results[0].stdout == "".join(f"{i}\n" for i in range(991, 1001))
+    assert results[0].stderr == "err\n"
+
+
+@posix_only
+def test_run_steps_measures_commands():
+    lines = ["sleep 0.1", f"{sys.executable} -c \"b = bytearray(200 * 2 ** 20); b[::4096] = b'x' * len(b[::4096])\""]
+    (result,) = run_steps(parse_steps(lines))
+
+    assert [command.returncode for command in result.commands] == [0, 0]
+    assert result.commands[0].duration >= 0.1
+    assert result.commands[1].max_rss >= 200 * 2 ** 20
+
+    summary = format_summary([result])
+    assert "sleep 0.1" in summary
+    assert "Peak RSS" in summary
+
+
+@posix_only
+def test_run_steps_starts_before_rendering_finished(tmp_path):
+    flag = tmp_path / "flag"
+
+    def lines():
+        yield f"touch {flag}"
+        yield '#ibi-step {"name": "next"}'
+        deadline = time.monotonic() + 10
+        while not flag.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        yield f"echo {flag.exists()}"
+        yield "#ibi-end-step"
+
+    results = list(run_steps(iter_steps(lines())))
+    assert results[-1].stdout == "True\n"
+
+
+@posix_only
+def test_run_steps_terminates_commands_on_render_error():
+    def lines():
+        yield '#ibi-step {"name": "slow"}'
+        yield "sleep 30"
+        yield "#ibi-end-step"
+        yield '#ibi-step {"name": "next"}'
+        time.sleep(0.2)
+        raise Exception("template error")
+
+    start = time.monotonic()
+    with pytest.raises(Exception, match="template error"):
+        list(run_steps(iter_steps(lines()), jobs=2))
+    assert time.monotonic() - start < 10
@@ -0,0 +1,117 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pickle
+
+import pytest
+
+from installation_instruction.installation_instruction import InstallationInstruction
+from installation_instruction.schema_model import SchemaModel
+from installation_instruction.get_flags_and_options_from_schema import _get_flags_and_options
+
+
+SCHEMA = {
+    "$id": "alternatives",
+    "type": "object",
+    "required": ["gpu"],
+    "properties": {
+        "gpu": {
+            "anyOf": [
+                {"const": "cu121", "title": "CUDA 12.1", "description": "Latest CUDA."},
+                {"const": "cpu"},
+                {"enum": ["rocm", "cpu"]},
+            ],
+        },
+        "level": {
+            "oneOf": [{"const": 1, "type": "integer"}, {"const": 2, "type": "integer"}],
+            "default": 1,
+        },
+        "channel": {"const": "stable"},
+        "name": {"anyOf": [{"type": "string"}, {"const": "none"}]},
+    },
+}
+
+MISC = {"pretty": {"cpu": "CPU only", "gpu": "Graphics card"}, "description": {"rocm": "AMD graphics cards."}}
+
+
+def test_alternatives_are_merged_into_enum_entries():
+    properties = SchemaModel.from_schema(SCHEMA, MISC).to_dict()["properties"]
+
+    assert properties["gpu"] == {
+        "title": "Graphics card",
+        "description": "",
+        "type": "enum",
+        "default": None,
+        "key": "gpu",
+        "enum": [
+            {"title": "CUDA 12.1", "key": "cu121", "description": "Latest CUDA."},
+            {"title": "CPU only", "key": "cpu", "description": ""},
+            {"title": "rocm", "key": "rocm", "description": "AMD graphics cards."},
+        ],
+    }
+    assert [entry["key"] for entry in properties["level"]["enum"]] == [1, 2]
+    assert properties["channel"]["enum"] == [{"title": "stable", "key": "stable", "description": ""}]
+    assert "enum" not in properties["name"]
+    assert properties["name"]["type"] == "string"
+
+
+def test_type_lists_and_enum_values_of_other_types_are_kept():
+    properties = SchemaModel.from_schema({"properties": {
+        "name": {"type": ["string", "null"]},
+        "flag": {"enum": [True, 1, 1.0, "1", True]},
+    }}).to_dict()["properties"]
+
+    assert properties["name"]["type"] == ["string", "null"]
+    assert [entry["key"] for entry in properties["flag"]["enum"]] == [True, 1, 1.0, "1"]
+    assert [type(entry["key"]) for entry in properties["flag"]["enum"]] == [bool, int, float, str]
+
+
+def test_model_is_immutable_and_interned():
+    model = SchemaModel.from_schema(SCHEMA, MISC)
+    gpu = model.properties["gpu"]
+
+    with pytest.raises(AttributeError):
+        gpu.title = "GPU"
+    with pytest.raises(AttributeError):
+        gpu.enum[0].key = "cu118"
+    with pytest.raises(TypeError):
+        model.properties["other"] = gpu
+    assert not hasattr(gpu, "__dict__")
+
+    other = SchemaModel.from_schema({"properties": {"gpu": {"enum": ["".join(["cu", "121"])]}}})
+    assert other.properties["gpu"].enum[0].key is gpu.enum[0].key
+
+    assert pickle.loads(pickle.dumps(model)).to_dict() == model.to_dict()
+
+
+def test_options_use_enum_entries():
+    options = _get_flags_and_options(SchemaModel.from_schema(SCHEMA, MISC), inst=True)
+
+    assert [option.opts for option in options] == [["--gpu"], ["--level"], ["--channel"], ["--name"]]
+    assert list(options[0].type.choices) == ["cu121", "cpu", "rocm"]
+    assert options[0].required == True
+    assert options[1].default == 1
+
+
+def test_instruction_builds_model_once():
+    install = InstallationInstruction.from_file("examples/scikit-learn/scikit-learn-instruction.schema.yml.jinja")
+
+    assert install.schema_model is install.schema_model
+    schema = install.parse_schema()
+    assert schema == install.parse_schema()
+    assert schema["$id"] == install.schema_model.id
+
+    schema["properties"].clear()
+    assert install.parse_schema()["properties"]
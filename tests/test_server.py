@@ -0,0 +1,147 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import json
+import os
+import shutil
+import urllib.error
+import urllib.request
+
+from installation_instruction.server import RenderServer
+
+
+def _request(port, path, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data, method="POST" if data else "GET")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return (response.status, json.load(response))
+    except urllib.error.HTTPError as e:
+        return (e.code, json.load(e))
+
+
+def _run_with_server(paths, client):
+    async def main():
+        server = RenderServer(paths)
+        async with await server.start("127.0.0.1", 0) as asyncio_server:
+            port = asyncio_server.sockets[0].getsockname()[1]
+            return await asyncio.to_thread(client, server, port)
+    return asyncio.run(main())
+
+
+def test_schema_and_render():
+    def client(server, port):
+        (status, configs) = _request(port, "/configs")
+        assert status == 200
+        assert set(configs) == {"pytorch-instruction", "test_install"}
+
+        (status, schema) = _request(port, "/configs/test_install/schema")
+        assert status == 200
+        assert schema["properties"]["os"]["default"] == "macOS"
+
+        (status, result) = _request(port, "/configs/test_install/render", {"error_install": False, "error_template": True})
+        assert (status, result) == (200, {"instructions": ["error error error"], "error": True})
+        (status, result) = _request(port, "/configs/test_install/render", {"error_template": False})
+        assert status == 400
+        assert result["errors"] == ["'error_install' is a required property"]
+        assert _request(port, "/configs/unknown/schema")[0] == 404
+
+        for _ in range(3):
+            (status, result) = _request(port, "/configs/pytorch-instruction/render", {"build": "stable", "__os__": "linux", "package": "pip", "compute_platform": "cpu"})
+            assert status == 200
+            assert not result["error"]
+
+        (status, metrics) = _request(port, "/metrics")
+        assert metrics["requests"] == 8
+        assert metrics["errors"] == 2
+        assert metrics["render_cache"]["hits"] == 2
+        assert metrics["latency_ms"]["max"] > 0
+
+    _run_with_server(["examples/pytorch/pytorch-instruction.schema.yml.jinja", "tests/data/test_install/install.cfg"], client)
+
+
+def test_hot_reload(tmp_path):
+    path = tmp_path / "install.cfg"
+    shutil.copy("tests/data/test_install/install.cfg", path)
+
+    def client(server, port):
+        input = {"error_install": False, "error_template": False}
+        assert _request(port, f"/configs/{tmp_path.name}/render", input)[1]["instructions"] == ['echo "start"', 'echo "end"']
+
+        path.write_text(path.read_text().replace('echo "end"', 'echo "finish"'))
+        os.utime(path, ns=(0, 1))
+        assert _request(port, f"/configs/{tmp_path.name}/render", input)[1]["instructions"] == ['echo "start"', 'echo "finish"']
+        assert server.metrics()["reloads"] == 1
+
+    _run_with_server([str(path)], client)
+
+
+def test_choices():
+    def client(server, port):
+        (status, result) = _request(port, "/configs/pytorch-instruction/choices", {"__os__": "macos"})
+        assert status == 200
+        assert result["choices"]["compute_platform"] == ["cpu"]
+        assert _request(port, "/configs/pytorch-instruction/choices", {"__os__": "beos"})[0] == 400
+
+    _run_with_server(["examples/pytorch/pytorch-instruction.schema.yml.jinja"], client)
+
+
+def _raw_request(port, data):
+    import socket
+    with socket.create_connection(("127.0.0.1", port)) as connection:
+        connection.sendall(data)
+        return connection.recv(65536).split(b"\r\n", 1)[0]
+
+
+def test_body_which_is_not_an_object(tmp_path):
+    config = tmp_path / "install.cfg"
+    config.write_text("properties:\n  os:\n    enum: [linux, mac]\n------\necho {{ os }}")
+    server = RenderServer([str(config)])
+    for body in (b"[]", b'"x"', b"1"):
+        for action in ("render", "choices"):
+            assert server.handle("POST", f"/configs/{tmp_path.name}/{action}", body) == (400, {"error": "Body is not a json object."})
+
+
+def test_invalid_content_length():
+    def client(server, port):
+        for length in (b"abc", b"-1"):
+            assert _raw_request(port, b"POST /configs/test_install/render HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n") == b"HTTP/1.1 400 Bad Request"
+        assert _raw_request(port, b"POST /configs/test_install/render HTTP/1.1\r\nContent-Length: 99999999\r\n\r\n") == b"HTTP/1.1 413 Request Entity Too Large"
+
+    _run_with_server(["tests/data/test_install/install.cfg"], client)
+
+
+def test_slow_request_does_not_block_others():
+    import threading
+    import time
+
+    def client(server, port):
+        handle = server.handle
+        def slow_handle(method, path, body):
+            if path == "/slow":
+                time.sleep(1)
+            return handle(method, path, body)
+        server.handle = slow_handle
+
+        slow = threading.Thread(target=_request, args=(port, "/slow"))
+        slow.start()
+        time.sleep(0.1)
+        start = time.perf_counter()
+        assert _request(port, "/metrics")[0] == 200
+        assert time.perf_counter() - start < 0.5
+        slow.join()
+
+    _run_with_server(["tests/data/test_install/install.cfg"], client)
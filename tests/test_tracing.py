@@ -0,0 +1,113 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+from installation_instruction import tracing
+from installation_instruction.installation_instruction import InstallationInstruction
+
+
+CONFIG = r"""
+type: object
+properties:
+   name:
+      type: string
+      default: world
+------
+hello {{ name }}
+"""
+
+
+@pytest.fixture
+def timings():
+    hook = tracing.Timings()
+    tracing.add_hook(hook)
+    yield hook
+    tracing.remove_hook(hook)
+
+
+def test_span_without_hooks_does_nothing():
+    assert not tracing.is_enabled()
+    assert tracing.span("a") is tracing.span("b", key="value")
+    with tracing.span("a"):
+        pass
+    iterable = [1, 2]
+    assert list(tracing.iter_span("a", iterable)) == iterable
+
+
+def test_timings_nest_phases(timings):
+    with tracing.span("outer"):
+        for _ in range(2):
+            with tracing.span("inner", name="step"):
+                pass
+    with tracing.span("other"):
+        pass
+    with tracing.span("outer"):
+        with tracing.span("late"):
+            pass
+
+    assert timings.phases[("outer",)][0] == 2
+    assert timings.phases[("outer", "inner")][0] == 2
+    names = [line.split()[0] for line in timings.format().splitlines()[1:]]
+    assert names == ["outer", "inner", "late", "other"]
+
+
+def test_iter_span_only_counts_time_producing_items(timings):
+    for _ in tracing.iter_span("produce", iter([1, 2])):
+        time.sleep(0.05)
+    (count, total) = timings.phases[("produce",)]
+    assert count == 1
+    assert total < 0.05 * 1e9
+
+
+def test_error_is_recorded():
+    trace = tracing.ChromeTrace()
+    tracing.add_hook(trace)
+    try:
+        with pytest.raises(ValueError):
+            with tracing.span("failing"):
+                raise ValueError()
+    finally:
+        tracing.remove_hook(trace)
+    assert trace.events[0]["args"] == {"error": "ValueError"}
+
+
+def test_phases_of_loading_and_rendering(timings):
+    instruction = InstallationInstruction(CONFIG)
+    assert list(instruction.iter_render({"name": "world"})) == ["hello world"]
+    assert instruction.validate_and_render({"name": "you"}) == (["hello you"], False)
+    assert {("split",), ("parse-header",), ("check-schema",), ("compile-validator",), ("validate",), ("compile-template",), ("render",)} <= timings.phases.keys()
+    assert timings.phases[("render",)][0] == 2
+
+
+def test_cli_writes_timings_and_trace(tmp_path):
+    trace_file = tmp_path / "trace.json"
+    result = subprocess.run(
+        [sys.executable, "-m", "installation_instruction", "--timings", "--trace", str(trace_file), "show", "examples/pytorch/pytorch-instruction.schema.yml.jinja", "----os--", "linux"],
+        capture_output=True, text=True, env={"XDG_CACHE_HOME": str(tmp_path), "XDG_DATA_HOME": str(tmp_path), "PATH": ""},
+    )
+    assert result.returncode == 0, result.stderr
+    assert "Phase" in result.stderr and "render" in result.stderr
+    assert "Phase" not in result.stdout
+
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    assert events[0]["name"] == "ibi"
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    assert {"load-config", "validate", "render"} <= {event["name"] for event in events}
@@ -0,0 +1,111 @@
+# Copyright 2024 Adam McKellar, Kanushka Gupta, Timo Ege
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from jsonschema.exceptions import best_match
+import pytest
+from jsonschema import Draft202012Validator
+
+from installation_instruction.installation_instruction import InstallationInstruction
+from installation_instruction.validator import compile_validator, _is_supported
+
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "os": {"enum": ["windows", "macos", "linux"], "default": "linux"},
+        "packager": {"type": "string", "enum": ["pip", "conda"]},
+        "virtualenv": {"type": "boolean", "default": False},
+        "jobs": {"type": "integer"},
+        "ratio": {"type": ["number", "null"]},
+        "mixed": {"enum": [1, True, "1", None, [1, 2], {"a": False}]},
+        "version": {"const": 2},
+        "nested": {
+            "type": "object",
+            "properties": {"name": {"type": "string"}},
+            "required": ["name"],
+            "additionalProperties": {"type": "integer"},
+        },
+    },
+    "required": ["os", "packager"],
+    "additionalProperties": False,
+}
+
+INPUTS = [
+    {"os": "linux", "packager": "pip"},
+    {},
+    [],
+    "linux",
+    {"os": "beos", "packager": 1, "virtualenv": "yes"},
+    {"os": "linux", "packager": "pip", "jobs": 1.0, "ratio": None},
+    {"os": "linux", "packager": "pip", "jobs": 1.5, "ratio": True},
+    {"os": "linux", "packager": "pip", "jobs": True, "ratio": "1"},
+    {"os": "linux", "packager": "pip", "mixed": 1},
+    {"os": "linux", "packager": "pip", "mixed": 1.0},
+    {"os": "linux", "packager": "pip", "mixed": False},
+    {"os": "linux", "packager": "pip", "mixed": [1, 2]},
+    {"os": "linux", "packager": "pip", "mixed": [True, 2]},
+    {"os": "linux", "packager": "pip", "mixed": {"a": 0}},
+    {"os": "linux", "packager": "pip", "version": 2.0},
+    {"os": "linux", "packager": "pip", "version": "2"},
+    {"os": "linux", "packager": "pip", "extra": 1, "other": 2},
+    {"os": "linux", "packager": "pip", "nested": {"name": "x", "a": 1, "b": "2"}},
+    {"os": "linux", "packager": "pip", "nested": {"a": []}},
+    {"os": "linux", "packager": "pip", "nested": []},
+]
+
+
+def _error_set(errors):
+    return sorted((e.validator, tuple(e.path), tuple(e.schema_path), e.message) for e in errors)
+
+
+@pytest.mark.parametrize("input", INPUTS)
+def test_parity_with_jsonschema(input):
+    assert _is_supported(SCHEMA)
+    expected = _error_set(Draft202012Validator(SCHEMA).iter_errors(input))
+    assert _error_set(compile_validator(SCHEMA)(input)) == expected
+
+
+def test_unsupported_keyword_falls_back():
+    schema = {"properties": {"name": {"type": "string", "minLength": 3}}}
+    assert not _is_supported(schema)
+
+    validate = compile_validator(schema)
+    assert validate({"name": "abc"}) == []
+    assert [e.validator for e in validate({"name": "a"})] == ["minLength"]
+
+
+def test_use_default():
+    validate = compile_validator(SCHEMA, use_default=True)
+    input = {"packager": "pip"}
+    errors = validate(input)
+
+    assert [e.validator for e in errors] == ["required"]
+    assert input == {"os": "linux", "packager": "pip", "virtualenv": False}
+
+
+def test_instruction_reports_all_errors(test_data_flags_options_config_string_with_empty_template):
+    install = InstallationInstruction(test_data_flags_options_config_string_with_empty_template)
+    errors = install.validate({"os": "beos", "packager": "npm"})
+    assert {e.validator for e in errors} == {"enum", "required"}
+    assert len(errors) == 3
+
+    with pytest.raises(Exception):
+        install.validate_and_render({"os": "beos"})
+
+
+def test_best_match_of_type_errors():
+    input = {"os": "linux", "packager": "pip", "virtualenv": None}
+    expected = best_match(Draft202012Validator(SCHEMA).iter_errors(input))
+    assert best_match(compile_validator(SCHEMA)(input)).message == expected.message